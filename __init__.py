@@ -1,8 +1,10 @@
 """Via stitching plugin package
 
 This package registers the ActionPlugin with pcbnew when imported by KiCad.
+Only the small registration stub is imported here; the dialog and the
+stitching engine are loaded when the plugin is run.
 """
-from .via_stitching_action import ViaStitchingPlugin
+from .plugin import ViaStitchingPlugin
 
 try:
     # Register the plugin with pcbnew when this package is imported by KiCad.
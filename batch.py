@@ -0,0 +1,240 @@
+"""
+Batch mode: stitch many board files with the same settings.
+
+Every board is stitched in its own worker process, at most --jobs at a time.
+A board that fails (or crashes its worker) is reported in the summary and
+doesn't stop the other boards.
+
+Run it with KiCad's Python from the folder that contains the plugin folder:
+
+    python -m via_stitching_plugin.batch "boards/*.kicad_pcb" --preset fab.json --jobs 4 --summary summary.csv
+
+Stitched boards are written next to the originals with a "_stitched" suffix,
+into --output-dir, or over the originals with --in-place.
+
+The geometry read from every board is cached next to it (see snapshot_cache),
+so stitching an unchanged board again skips reading it through pcbnew.
+"""
+import argparse
+import csv
+import glob
+import multiprocessing
+import multiprocessing.connection
+import os
+import sys
+import time
+
+from .stitching import DEFAULT_SETTINGS, check_settings, load_preset, stitch_board
+
+SUMMARY_COLUMNS = ['board', 'status', 'placed', 'skipped', 'track_placed', 'grid_placed', 'seconds', 'cached',
+                   'output', 'error']
+
+
+def expand_board_paths(patterns):
+    """Expand board file names and glob patterns, in order and without duplicates.
+
+    A pattern that matches nothing is kept as is, so it shows up as a failed
+    board in the summary instead of silently disappearing.
+    """
+    paths = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                paths.append(path)
+    return paths
+
+
+def output_path(path, output_dir=None, suffix='_stitched', in_place=False):
+    """File a stitched board is written to."""
+    if in_place:
+        return path
+    base, ext = os.path.splitext(os.path.basename(path))
+    folder = output_dir if output_dir is not None else os.path.dirname(path)
+    return os.path.join(folder, base + suffix + ext)
+
+
+def stitch_file(path, settings, out_path, use_cache=True):
+    """Load a board file, stitch it and save it.
+
+    Args:
+        use_cache: read the board geometry through the cache file next to the board
+
+    Returns:
+        StitchReport
+    """
+    import pcbnew
+
+    board = pcbnew.LoadBoard(path)
+    report = stitch_board(board, settings, path if use_cache else None)
+    if not report.gnd_found:
+        raise Exception("No GND net found in the board.")
+    pcbnew.SaveBoard(out_path, board)
+    return report
+
+
+def _stitch_worker(path, settings, out_path, use_cache, conn):
+    """Worker process entry: stitch one board and send its summary row."""
+    t0 = time.perf_counter()
+    row = {'board': path, 'output': out_path}
+    try:
+        report = stitch_file(path, settings, out_path, use_cache)
+        row.update(status='ok', placed=report.placed, skipped=report.skipped,
+                   track_placed=report.track_placed, grid_placed=report.grid_placed,
+                   cached=report.snapshot_cached)
+    except Exception as e:
+        row.update(status='error', error=str(e) or e.__class__.__name__)
+    row['seconds'] = time.perf_counter() - t0
+    conn.send(row)
+    conn.close()
+
+
+def run_batch(paths, settings, jobs=None, output_dir=None, suffix='_stitched', in_place=False, progress=None,
+              use_cache=True):
+    """Stitch board files in parallel, one worker process per board.
+
+    Args:
+        paths: board file paths
+        settings: checked settings dict (see stitching.DEFAULT_SETTINGS)
+        jobs: maximum number of boards stitched at the same time (CPU count if None)
+        output_dir, suffix, in_place: where stitched boards are written (see output_path)
+        progress: optional callback called with each summary row as soon as
+                  its board is done
+        use_cache: read the board geometry through cache files next to the boards
+
+    Returns:
+        list of summary rows (dicts with the keys of SUMMARY_COLUMNS), in the order of paths
+    """
+    jobs = max(1, jobs or os.cpu_count() or 1)
+    if output_dir is not None and not in_place:
+        os.makedirs(output_dir, exist_ok=True)
+
+    pending = list(enumerate(paths))
+    pending.reverse()
+    running = {}  # process sentinel -> (index, path, out_path, process, connection, start time)
+    rows = [None] * len(paths)
+
+    while pending or running:
+        # Start workers up to the concurrency limit
+        while pending and len(running) < jobs:
+            index, path = pending.pop()
+            out_path = output_path(path, output_dir, suffix, in_place)
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_stitch_worker, args=(path, settings, out_path, use_cache, sender),
+                                              name='via-stitching %s' % os.path.basename(path))
+            process.start()
+            sender.close()
+            running[process.sentinel] = (index, path, out_path, process, receiver, time.perf_counter())
+
+        # Wait for any worker to finish
+        for sentinel in multiprocessing.connection.wait(list(running)):
+            index, path, out_path, process, receiver, t0 = running.pop(sentinel)
+            row = None
+            try:
+                if receiver.poll():
+                    row = receiver.recv()
+            except (EOFError, OSError):
+                pass
+            receiver.close()
+            process.join()
+            if row is None:
+                # The worker died without reporting, e.g. a crash inside pcbnew
+                row = {'board': path, 'output': out_path, 'status': 'error',
+                       'error': 'worker exited with code %s' % process.exitcode,
+                       'seconds': time.perf_counter() - t0}
+            for column in SUMMARY_COLUMNS:
+                row.setdefault(column, '')
+            rows[index] = row
+            if progress is not None:
+                progress(row)
+
+    return rows
+
+
+def format_table(lines):
+    """Lines of cells (strings, the first line is the header) as plain text table lines."""
+    widths = [max(len(line[i]) for line in lines) for i in range(len(lines[0]))]
+    text = []
+    for n, line in enumerate(lines):
+        text.append('  '.join(cell.ljust(width) for cell, width in zip(line, widths)).rstrip())
+        if n == 0:
+            text.append('  '.join('-' * width for width in widths))
+    return text
+
+
+def format_summary(rows):
+    """Summary rows as a plain text table."""
+    header = ['board', 'status', 'placed', 'skipped', 'time [s]']
+    lines = [header]
+    for row in rows:
+        lines.append([row['board'], row['status'], str(row['placed']), str(row['skipped']),
+                      '%.1f' % row['seconds']])
+    text = format_table(lines)
+
+    errors = [row for row in rows if row['status'] != 'ok']
+    placed = sum(row['placed'] or 0 for row in rows)
+    text.append('')
+    text.append('%d boards, %d failed, %d vias placed' % (len(rows), len(errors), placed))
+    for row in errors:
+        text.append('%s: %s' % (row['board'], row['error']))
+    return '\n'.join(text)
+
+
+def write_summary_csv(rows, path):
+    """Write summary rows to a CSV file."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict((column, row[column]) for column in SUMMARY_COLUMNS))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m via_stitching_plugin.batch',
+                                     description="Stitch many KiCad boards with the same settings.")
+    parser.add_argument('boards', nargs='+', help="board files or glob patterns")
+    parser.add_argument('--preset', help="JSON file with stitching settings (defaults: %s)" %
+                        ", ".join("%s=%s" % item for item in DEFAULT_SETTINGS.items()))
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of boards stitched at the same time (default: CPU count)")
+    parser.add_argument('--output-dir', help="write stitched boards into this folder")
+    parser.add_argument('--suffix', default='_stitched', help="file name suffix of stitched boards")
+    parser.add_argument('--in-place', action='store_true', help="overwrite the original board files")
+    parser.add_argument('--summary', help="also write the summary table to this CSV file")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="don't read or write the geometry cache files next to the boards")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.preset:
+            settings = load_preset(args.preset)
+        else:
+            settings = dict(DEFAULT_SETTINGS)
+            check_settings(settings)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    paths = expand_board_paths(args.boards)
+
+    def progress(row):
+        if row['status'] == 'ok':
+            print("done    %s: %d vias placed (%.1f s)" % (row['board'], row['placed'], row['seconds']))
+        else:
+            print("FAILED  %s: %s" % (row['board'], row['error']))
+        sys.stdout.flush()
+
+    rows = run_batch(paths, settings, args.jobs, args.output_dir, args.suffix, args.in_place, progress,
+                     not args.no_cache)
+
+    print()
+    print(format_summary(rows))
+    if args.summary:
+        write_summary_csv(rows, args.summary)
+
+    return 1 if any(row['status'] != 'ok' for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
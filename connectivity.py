@@ -0,0 +1,312 @@
+"""
+Net connectivity of a board snapshot, across layers and vias.
+
+Two things are built from the snapshot, each once and only when first asked for
+(see BoardSnapshot.connectivity):
+- track chains per layer: traces that share end points joined into tracks, what
+  track stitching follows. Track end points are hashed into grid cells of
+  COORD_TOLERANCE, so finding the next trace doesn't scan all traces.
+- a union-find over all tracks, arcs, vias and pads, joining items of the same
+  net that touch: track ends on the same layer, track ends on a via (on a layer
+  the via spans) or inside a pad, vias inside pads. Zones are left out, they
+  would connect almost everything on a plane net.
+
+From the union-find come the connected groups of a net (its topology) and the
+layer transitions: vias where tracks of a net change layers.
+"""
+from .geometry import SpatialIndex
+
+COORD_TOLERANCE = 1000  # nanometers (1 micron tolerance)
+
+# Cell size of the spatial indexes of vias and pads
+INDEX_CELL_SIZE = 2000000  # 2mm
+
+
+def coords_match(x1, y1, x2, y2):
+    """Check if two positions match within tolerance."""
+    return abs(x1 - x2) <= COORD_TOLERANCE and abs(y1 - y2) <= COORD_TOLERANCE
+
+
+def _cell(x, y):
+    # Positions within COORD_TOLERANCE are in the same or a neighbouring cell
+    return x // COORD_TOLERANCE, y // COORD_TOLERANCE
+
+
+def _neighbour_cells(x, y):
+    cx, cy = _cell(x, y)
+    return [(cx + dx, cy + dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)]
+
+
+def chain_tracks(tracks, traces, net_name=None):
+    """Join traces that share end points into tracks.
+
+    Starting from the first trace not used yet, a track is grown from its end,
+    then from its start, each time with the first unused trace (in the order of
+    traces) that touches the current end. At a branch the other traces start
+    tracks of their own.
+
+    Args:
+        tracks: snapshot track table
+        traces: track IDs, usually all traces of one layer
+        net_name: function giving the name of a net code, for the error message
+
+    Returns:
+        list of tracks, where each track is a list of connected track IDs
+
+    Raises:
+        Exception: two traces of different nets share an end point
+    """
+    if not traces:
+        return []
+
+    t = tracks
+    cells = {}
+    for i, trace in enumerate(traces):
+        for x, y in ((t.x0[trace], t.y0[trace]), (t.x1[trace], t.y1[trace])):
+            cells.setdefault(_cell(x, y), []).append(i)
+
+    processed = [False] * len(traces)
+
+    def next_trace(trace, end_x, end_y):
+        """Index in traces of the first unused trace touching end_x, end_y, or None."""
+        best = None
+        for cell in _neighbour_cells(end_x, end_y):
+            for i in cells.get(cell, ()):
+                if processed[i] or (best is not None and i >= best):
+                    continue
+                other = traces[i]
+                if (coords_match(end_x, end_y, t.x0[other], t.y0[other]) or
+                        coords_match(end_x, end_y, t.x1[other], t.y1[other])):
+                    best = i
+        if best is not None and t.net[traces[best]] != t.net[trace]:
+            name = net_name or str
+            raise Exception(
+                "Net mismatch! Traces share endpoint but have different nets:\n"
+                "Net %s vs Net %s" % (name(t.net[trace]), name(t.net[traces[best]])))
+        return best
+
+    def grow(track, seed, end_x, end_y, append):
+        current = seed
+        while True:
+            i = next_trace(current, end_x, end_y)
+            if i is None:
+                break
+            processed[i] = True
+            next_id = traces[i]
+            if append:
+                track.append(next_id)
+            else:
+                track.insert(0, next_id)
+            # Move to the far end of the next trace
+            if coords_match(end_x, end_y, t.x0[next_id], t.y0[next_id]):
+                end_x, end_y = t.x1[next_id], t.y1[next_id]
+            else:
+                end_x, end_y = t.x0[next_id], t.y0[next_id]
+            current = next_id
+
+    chains = []
+    for seed_idx, seed in enumerate(traces):
+        if processed[seed_idx]:
+            continue
+        processed[seed_idx] = True
+        track = [seed]
+        # Grow the track in both directions: from the seed's end, then its start
+        grow(track, seed, t.x1[seed], t.y1[seed], True)
+        grow(track, seed, t.x0[seed], t.y0[seed], False)
+        chains.append(track)
+
+    return chains
+
+
+class Connectivity:
+    """Connectivity of the copper items of a snapshot, per net and across layers.
+
+    Items of the union-find are numbered tracks first, then vias, then pads (see
+    item and kind_of).
+
+    Attributes:
+        via_layers: per via, the set of layer IDs of the tracks ending on it;
+                    only filled once the union-find is built
+    """
+
+    TRACK = 0
+    VIA = 1
+    PAD = 2
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._chains = {}      # layer ID -> track chains
+        self._parent = None    # union-find, built on first use
+        self._size = None
+        self._groups = None    # net code -> list of groups (lists of items)
+        self.via_layers = []
+
+    # --- track chains ---
+
+    def chains(self, layer):
+        """Tracks (lists of connected track IDs) on a layer, see chain_tracks (cached)."""
+        chains = self._chains.get(layer)
+        if chains is None:
+            tracks = self.snapshot.tracks
+            traces = [track_id for track_id in range(len(tracks)) if tracks.layer[track_id] == layer]
+            chains = chain_tracks(tracks, traces, self.snapshot.net_name)
+            self._chains[layer] = chains
+        return chains
+
+    def chains_by_net(self, layer):
+        """Track chains on a layer, as a dict mapping net code to list of chains."""
+        tracks = self.snapshot.tracks
+        by_net = {}
+        for chain in self.chains(layer):
+            by_net.setdefault(tracks.net[chain[0]], []).append(chain)
+        return by_net
+
+    # --- union-find ---
+
+    def item(self, kind, index):
+        """Union-find item of a track, via or pad."""
+        snapshot = self.snapshot
+        if kind == self.TRACK:
+            return index
+        if kind == self.VIA:
+            return len(snapshot.tracks) + index
+        return len(snapshot.tracks) + len(snapshot.vias) + index
+
+    def kind_of(self, item):
+        """(kind, index) of a union-find item."""
+        snapshot = self.snapshot
+        if item < len(snapshot.tracks):
+            return self.TRACK, item
+        item -= len(snapshot.tracks)
+        if item < len(snapshot.vias):
+            return self.VIA, item
+        return self.PAD, item - len(snapshot.vias)
+
+    def find(self, item):
+        """Root of an item's group."""
+        self._build()
+        parent = self._parent
+        while parent[item] != item:
+            parent[item] = parent[parent[item]]  # Path halving
+            item = parent[item]
+        return item
+
+    def connected(self, item1, item2):
+        return self.find(item1) == self.find(item2)
+
+    def _union(self, a, b):
+        a = self.find(a)
+        b = self.find(b)
+        if a == b:
+            return
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+
+    def _build(self):
+        if self._parent is not None:
+            return
+        snapshot = self.snapshot
+        tracks = snapshot.tracks
+        vias = snapshot.vias
+        pads = snapshot.pads
+        count = len(tracks) + len(vias) + len(pads)
+        self._parent = list(range(count))
+        self._size = [1] * count
+        self.via_layers = [set() for _ in range(len(vias))]
+
+        via_masks = [snapshot.span_mask(vias.layer_top[i], vias.layer_bottom[i]) for i in range(len(vias))]
+        via_index = SpatialIndex(INDEX_CELL_SIZE)
+        for i in range(len(vias)):
+            r = vias.diameter[i] // 2
+            via_index.insert(i, vias.x[i] - r, vias.y[i] - r, vias.x[i] + r, vias.y[i] + r)
+
+        pad_index = SpatialIndex(INDEX_CELL_SIZE)
+        for i in range(len(pads)):
+            r = int(snapshot.pad_shapes[pads.shape[i]].bounding_radius)
+            pad_index.insert(i, pads.x[i] - r, pads.y[i] - r, pads.x[i] + r, pads.y[i] + r)
+
+        def in_pad(i, x, y, mask, net):
+            return (pads.net[i] == net and pads.layers[i] & mask and
+                    snapshot.pad_shapes[pads.shape[i]].distance(x - pads.x[i], y - pads.y[i]) <= COORD_TOLERANCE)
+
+        # Track ends: to other track ends on the same layer, to vias and to pads
+        ends = {}
+        for track_id in range(len(tracks)):
+            layer = tracks.layer[track_id]
+            net = tracks.net[track_id]
+            mask = snapshot.layer_mask([layer])
+            for x, y in ((tracks.x0[track_id], tracks.y0[track_id]), (tracks.x1[track_id], tracks.y1[track_id])):
+                for cell in _neighbour_cells(x, y):
+                    for other, ox, oy in ends.get((layer, net) + cell, ()):
+                        if coords_match(x, y, ox, oy):
+                            self._union(track_id, other)
+                ends.setdefault((layer, net) + _cell(x, y), []).append((track_id, x, y))
+
+                for i in via_index.query_radius(x, y, 0):
+                    r = vias.diameter[i] / 2.0
+                    if (vias.net[i] == net and via_masks[i] & mask and
+                            (x - vias.x[i]) ** 2 + (y - vias.y[i]) ** 2 <= r * r):
+                        self._union(track_id, self.item(self.VIA, i))
+                        self.via_layers[i].add(layer)
+
+                for i in pad_index.query_radius(x, y, 0):
+                    if in_pad(i, x, y, mask, net):
+                        self._union(track_id, self.item(self.PAD, i))
+
+        # Vias in pads
+        for i in range(len(vias)):
+            for p in pad_index.query_radius(vias.x[i], vias.y[i], 0):
+                if in_pad(p, vias.x[i], vias.y[i], via_masks[i], vias.net[i]):
+                    self._union(self.item(self.VIA, i), self.item(self.PAD, p))
+
+    # --- topology ---
+
+    def net_of(self, item):
+        kind, index = self.kind_of(item)
+        table = (self.snapshot.tracks, self.snapshot.vias, self.snapshot.pads)[kind]
+        return table.net[index]
+
+    def groups(self, net_code):
+        """Connected groups of a net's items (without zones), as lists of items (cached)."""
+        if self._groups is None:
+            self._build()
+            by_root = {}
+            for item in range(len(self._parent)):
+                by_root.setdefault(self.find(item), []).append(item)
+            self._groups = {}
+            for items in by_root.values():
+                self._groups.setdefault(self.net_of(items[0]), []).append(items)
+        return self._groups.get(net_code, [])
+
+    def layer_transitions(self, net_code=None):
+        """Vias where tracks change layers.
+
+        Args:
+            net_code: only vias of this net, or all nets if None
+
+        Returns:
+            list of (via index, sorted list of the layer IDs of the tracks ending on it)
+            for vias with tracks on two or more layers
+        """
+        self._build()
+        vias = self.snapshot.vias
+        return [(i, sorted(layers)) for i, layers in enumerate(self.via_layers)
+                if len(layers) > 1 and (net_code is None or vias.net[i] == net_code)]
+
+    def topology(self, net_code):
+        """Summary of a net: dict with the number of connected groups, tracks, vias
+        and pads, the layers its tracks use and its number of layer transitions."""
+        counts = [0, 0, 0]
+        layers = set()
+        for items in self.groups(net_code):
+            for item in items:
+                kind, index = self.kind_of(item)
+                counts[kind] += 1
+                if kind == self.TRACK:
+                    layers.add(self.snapshot.tracks.layer[index])
+        return {'groups': len(self.groups(net_code)), 'tracks': counts[self.TRACK],
+                'vias': counts[self.VIA], 'pads': counts[self.PAD],
+                'layers': [layer for layer in self.snapshot.copper_layers if layer in layers],
+                'transitions': len(self.layer_transitions(net_code))}
@@ -0,0 +1,726 @@
+"""
+Placement constraints for stitching vias and the pipeline that runs them.
+
+Every constraint decides whether a via may be placed at a candidate position.
+A constraint provides:
+- an index-backed prefilter: only the obstacles near the candidate are looked at
+- a scalar check for one candidate
+- a batch check for many candidates (defaults to the scalar check in a loop;
+  the board edge check is vectorized, the copper and keepout checks share one
+  index query per index cell among the candidates of a batch, see query_by_cell)
+- optionally the intervals along a line where it blocks the candidate, so a
+  rejected candidate can slide to a free position (see ConstraintPipeline.blocked_intervals)
+
+ConstraintPipeline runs the constraints in order of measured cost per rejection,
+so cheap constraints that reject a lot run first. New constraints only have to
+subclass Constraint and be added to the pipeline; the stitch loops don't change.
+"""
+import math
+import time
+
+from .geometry import (SpatialIndex, line_circle_interval, line_segment_interval, point_to_primitive_distance,
+                       point_to_segment_distance_sq)
+
+# Minimum clearance between a via and copper of the net it is checked against
+# (the stitched track's own net, or GND for grid stitching). Keeps vias clear of
+# length tuning patterns and other routing on that net.
+SAME_NET_MIN_CLEARANCE = 300000  # 0.3mm
+
+# Default cell size for the spatial indexes
+INDEX_CELL_SIZE = 2000000  # 2mm
+
+
+class Constraint:
+    """Base class for placement constraints.
+
+    Attributes:
+        name: short name used in statistics
+        dynamic: True if the result can change when vias are placed; dynamic
+                 constraints are checked per candidate right before placement,
+                 static ones can be checked for a whole batch up front
+        cost: initial relative cost estimate, replaced by measured timings
+    """
+    name = 'constraint'
+    dynamic = False
+    cost = 1.0
+
+    def prefilter(self, candidate):
+        """Obstacles (of this constraint's index) near the candidate."""
+        return ()
+
+    def check(self, candidate):
+        """Return True if a via may be placed at the candidate."""
+        raise NotImplementedError
+
+    def check_batch(self, candidates):
+        """check() for many candidates, returns a list of bools."""
+        return [self.check(candidate) for candidate in candidates]
+
+    def blocked_intervals(self, candidate, dx, dy, low, high):
+        """Where the candidate is blocked when moved along a line.
+
+        The candidate moves to (candidate.x + s*dx, candidate.y + s*dy) for s in
+        [low, high]; (dx, dy) is a unit direction.
+
+        Returns:
+            list of (s0, s1) intervals of s where check() fails (may be larger),
+            or None if the constraint can't tell (it is then only checked at
+            the chosen position)
+        """
+        return None
+
+    def via_placed(self, candidate):
+        """Called after a via has been placed at the candidate."""
+        pass
+
+
+def bbox_index(boxes):
+    """Build a SpatialIndex over a list of (left, top, right, bottom) boxes.
+
+    The cell size follows the typical box size, so each box lands in few cells.
+    """
+    sizes = sorted(max(b[2] - b[0], b[3] - b[1]) for b in boxes)
+    cell = sizes[len(sizes) // 2] if sizes else INDEX_CELL_SIZE
+    index = SpatialIndex(max(cell, INDEX_CELL_SIZE // 2))
+    for i, box in enumerate(boxes):
+        index.insert(i, *box)
+    return index
+
+
+def query_by_cell(index, candidates, reach_of):
+    """Obstacles near every candidate, with one index query per index cell.
+
+    Candidates in the same cell of the index (and with the same reach) share one
+    query of the cell grown by the reach, which covers what each candidate's own
+    query (its position grown by the reach) returns. Batches of stitching
+    candidates are close together, so most of them share a query.
+
+    Args:
+        index: SpatialIndex
+        candidates: list of StitchCandidate
+        reach_of: function giving the query reach of a candidate
+
+    Returns:
+        list with a set of obstacles for every candidate (shared, don't change them)
+    """
+    cell = index.cell
+    found = {}
+    obstacles = []
+    for candidate in candidates:
+        reach = reach_of(candidate)
+        key = (candidate.x // cell, candidate.y // cell, reach)
+        items = found.get(key)
+        if items is None:
+            left = key[0] * cell
+            top = key[1] * cell
+            items = index.query(left - reach, top - reach, left + cell + reach, top + cell + reach)
+            found[key] = items
+        obstacles.append(items)
+    return obstacles
+
+
+def polygon_bbox(polygon):
+    return (polygon.left, polygon.top, polygon.right, polygon.bottom)
+
+
+class CourtyardConstraint(Constraint):
+    """Vias must avoid the courtyards on the outer layers they reach.
+
+    Through vias reach both sides, so they must avoid ALL courtyards (F and B).
+
+    A collision occurs if the via center is inside a courtyard, or a courtyard
+    vertex is within the via radius. Courtyards only known by bounding box
+    collide when the via overlaps the box.
+    """
+    name = 'courtyard'
+    cost = 2.0
+
+    def __init__(self, courtyards):
+        self.courtyards = courtyards
+        self.index = bbox_index([polygon_bbox(polygon) for _, polygon, _ in courtyards])
+
+    def prefilter(self, candidate):
+        return self.index.query_radius(candidate.x, candidate.y, candidate.diameter // 2)
+
+    def check(self, candidate):
+        via_x = candidate.x
+        via_y = candidate.y
+        via_radius = candidate.diameter // 2
+
+        for i in self.prefilter(candidate):
+            layers, polygon, exact = self.courtyards[i]
+            if not layers & candidate.layers:
+                continue  # Courtyard on a side the via doesn't reach
+
+            # Bounding box with via radius margin
+            if not (via_x - via_radius < polygon.right and
+                    via_x + via_radius > polygon.left and
+                    via_y - via_radius < polygon.bottom and
+                    via_y + via_radius > polygon.top):
+                continue
+
+            if not exact:
+                return False
+
+            # Check if the via center is inside the polygon
+            if polygon.contains(via_x, via_y):
+                return False
+
+            # Close enough to warrant detailed check: distance to outline vertices
+            radius_sq = via_radius * via_radius
+            for ring in polygon.rings:
+                for pt_x, pt_y in ring:
+                    dx = via_x - pt_x
+                    dy = via_y - pt_y
+                    if dx * dx + dy * dy < radius_sq:
+                        return False
+
+        return True
+
+
+class BoardEdgeConstraint(Constraint):
+    """Vias must keep edge clearance + via radius from the real board outline.
+
+    The outline deflated by that distance is built once (per via size), so each
+    candidate is one indexed point-in-polygon test plus a check against the few
+    edges around it. The batch check is vectorized.
+    """
+    name = 'board edge'
+    cost = 1.0
+
+    def __init__(self, outline, edge_clearance):
+        self.outline = outline
+        self.edge_clearance = edge_clearance
+
+    def region(self, candidate):
+        return self.outline.clearance_region(candidate.diameter // 2 + self.edge_clearance)
+
+    def prefilter(self, candidate):
+        if self.outline is None:
+            return ()
+        region = self.region(candidate)
+        return region.cells.get(((candidate.x - self.outline.left) // region.cell,
+                                 (candidate.y - self.outline.top) // region.cell), ())
+
+    def check(self, candidate):
+        if self.outline is None:
+            return True  # Can't check, assume OK
+        return self.region(candidate).contains(candidate.x, candidate.y)
+
+    def check_batch(self, candidates):
+        if self.outline is None:
+            return [True] * len(candidates)
+
+        # Group by via size, each group is one vectorized region test
+        results = [True] * len(candidates)
+        by_diameter = {}
+        for i, candidate in enumerate(candidates):
+            by_diameter.setdefault(candidate.diameter, []).append(i)
+        for members in by_diameter.values():
+            region = self.region(candidates[members[0]])
+            inside = region.contains_many([candidates[i].x for i in members],
+                                          [candidates[i].y for i in members])
+            for i, ok in zip(members, inside):
+                results[i] = ok
+        return results
+
+
+class TuningAreaConstraint(Constraint):
+    """Vias must not overlap length tuning areas (bounding boxes).
+
+    NOTE: We don't need special detection for length tuning patterns. The copper
+    check already avoids placing vias on or too close to ANY tracks (including
+    squiggly length tuning tracks), so no areas are collected at the moment.
+    """
+    name = 'tuning area'
+    cost = 0.5
+
+    def __init__(self, tuning_areas=()):
+        self.tuning_areas = list(tuning_areas)
+        self.index = bbox_index(self.tuning_areas)
+
+    def prefilter(self, candidate):
+        return self.index.query_radius(candidate.x, candidate.y, candidate.diameter // 2)
+
+    def check(self, candidate):
+        via_radius = candidate.diameter // 2
+        for i in self.prefilter(candidate):
+            left, top, right, bottom = self.tuning_areas[i]
+            # Check if via overlaps with the tuning area (with via radius margin)
+            if (candidate.x - via_radius < right and
+                    candidate.x + via_radius > left and
+                    candidate.y - via_radius < bottom and
+                    candidate.y + via_radius > top):
+                return False
+        return True
+
+
+class KeepoutConstraint(Constraint):
+    """Vias must not be inside (or reach into) a rule area that prohibits vias.
+
+    The via center and 16 points around its circumference are tested against
+    the zone outline. Only rule areas on layers the via spans count.
+    """
+    name = 'via keepout'
+    cost = 3.0
+
+    NUM_POINTS = 16  # Check 16 points around the circle
+
+    def __init__(self, keepouts):
+        self.keepouts = keepouts
+        self.index = bbox_index([polygon_bbox(polygon) for _, polygon in keepouts])
+
+    def prefilter(self, candidate):
+        return self.index.query_radius(candidate.x, candidate.y, candidate.diameter // 2)
+
+    def check(self, candidate):
+        return self.check_obstacles(candidate, self.prefilter(candidate))
+
+    def check_batch(self, candidates):
+        nearby = query_by_cell(self.index, candidates, lambda candidate: candidate.diameter // 2)
+        return [self.check_obstacles(candidate, obstacles) for candidate, obstacles in zip(candidates, nearby)]
+
+    def check_obstacles(self, candidate, obstacles):
+        """check() against the given keepouts (a superset of the ones near the candidate)."""
+        via_x = candidate.x
+        via_y = candidate.y
+        via_radius = candidate.diameter // 2
+
+        for i in obstacles:
+            layers, outline = self.keepouts[i]
+            if not layers & candidate.layers:
+                continue
+            # If center is inside, definitely a violation
+            if outline.contains(via_x, via_y):
+                return False
+            for k in range(self.NUM_POINTS):
+                angle = 2 * math.pi * k / self.NUM_POINTS
+                if outline.contains(int(via_x + via_radius * math.cos(angle)),
+                                    int(via_y + via_radius * math.sin(angle))):
+                    return False
+        return True
+
+
+class MemberGuardConstraint(Constraint):
+    """Merged candidates must keep clearance to the traces of all their members.
+
+    A merged candidate sits at the centroid of its members; every member carries a
+    guard (trace primitive, minimum distance) since its own trace is excluded
+    from the copper check.
+    """
+    name = 'merged guard'
+    cost = 0.5
+
+    def check(self, candidate):
+        if not candidate.check_guards:
+            return True
+        for primitive, min_distance in candidate.guards:
+            if point_to_primitive_distance(candidate.x, candidate.y, primitive) < min_distance:
+                return False
+        return True
+
+
+class CopperConstraint(Constraint):
+    """Vias must keep clearance to existing copper (tracks, arcs, vias, pads) on the layers they span.
+
+    Every obstacle is indexed with the bitmask of its copper layers, so copper
+    outside the span of a blind or buried via is skipped without a distance check.
+    Copper on the candidate's net (the stitched track's net, or GND for grid
+    stitching) only needs SAME_NET_MIN_CLEARANCE. The traces being stitched along
+    are excluded. Zones are NOT checked - the zone will pour around the via.
+    """
+    name = 'copper'
+    cost = 5.0
+
+    # Obstacle kinds in the index
+    TRACK = 0
+    VIA = 1
+    PAD = 2
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.index = SpatialIndex(INDEX_CELL_SIZE)
+
+        tracks = snapshot.tracks
+        self.track_primitives = []
+        for i in range(len(tracks)):
+            half_width = tracks.width[i] // 2
+            primitive = snapshot.track_primitive(i)
+            self.track_primitives.append(primitive)
+            if primitive[0] == 'arc':
+                # Whole circle box: simple and always covers the arc
+                _, cx, cy, radius, _, _ = primitive
+                box = (cx - radius, cy - radius, cx + radius, cy + radius)
+            else:
+                box = (min(tracks.x0[i], tracks.x1[i]), min(tracks.y0[i], tracks.y1[i]),
+                       max(tracks.x0[i], tracks.x1[i]), max(tracks.y0[i], tracks.y1[i]))
+            self.index.insert((self.TRACK, i, snapshot.layer_mask((tracks.layer[i],))), box[0] - half_width, box[1] - half_width,
+                              box[2] + half_width, box[3] + half_width)
+
+        vias = snapshot.vias
+        for i in range(len(vias)):
+            radius = vias.diameter[i] // 2
+            mask = snapshot.span_mask(vias.layer_top[i], vias.layer_bottom[i])
+            self.index.insert((self.VIA, i, mask), vias.x[i] - radius, vias.y[i] - radius,
+                              vias.x[i] + radius, vias.y[i] + radius)
+
+        pads = snapshot.pads
+        self.max_pad_margin = 0
+        for i in range(len(pads)):
+            radius = int(math.ceil(snapshot.pad_shapes[pads.shape[i]].bounding_radius))
+            self.index.insert((self.PAD, i, pads.layers[i]), pads.x[i] - radius, pads.y[i] - radius,
+                              pads.x[i] + radius, pads.y[i] + radius)
+            self.max_pad_margin = max(self.max_pad_margin, pads.local_clearance[i], abs(pads.mask_margin[i]))
+
+    def reach(self, candidate):
+        # Obstacles are indexed with their own extent, so the query only has to
+        # cover via radius + clearance (+ pad keepout)
+        return (candidate.diameter // 2 + max(candidate.clearance, SAME_NET_MIN_CLEARANCE) +
+                max(candidate.clearance, self.max_pad_margin))
+
+    def prefilter(self, candidate):
+        return self.index.query_radius(candidate.x, candidate.y, self.reach(candidate))
+
+    def line_query(self, candidate, dx, dy, low, high):
+        """Obstacles near the candidate anywhere on its line from low to high (one index query)."""
+        reach = self.reach(candidate)
+        xs = (candidate.x + low * dx, candidate.x + high * dx)
+        ys = (candidate.y + low * dy, candidate.y + high * dy)
+        return self.index.query(min(xs) - reach, min(ys) - reach, max(xs) + reach, max(ys) + reach)
+
+    def blocked_intervals(self, candidate, dx, dy, low, high):
+        """Intervals blocked by each obstacle, with the reaches check() uses.
+
+        Arcs block the whole disc of their circle grown by the reach, polygon
+        pads their grown bounding circle.
+        """
+        snapshot = self.snapshot
+        via_x = candidate.x
+        via_y = candidate.y
+        via_radius = candidate.diameter // 2
+        check_radius = via_radius + candidate.clearance
+        same_net_radius = via_radius + SAME_NET_MIN_CLEARANCE
+
+        blocked = []
+        for kind, i, layers in self.line_query(candidate, dx, dy, low, high):
+            if not layers & candidate.layers:
+                continue
+
+            if kind == self.TRACK:
+                if i in candidate.exclude:
+                    continue
+                tracks = snapshot.tracks
+                radius = same_net_radius if tracks.net[i] == candidate.net else check_radius
+                reach = radius + tracks.width[i] // 2
+                primitive = self.track_primitives[i]
+                if primitive[0] == 'arc':
+                    _, cx, cy, arc_radius, _, _ = primitive
+                    interval = line_circle_interval(via_x - cx, via_y - cy, dx, dy, arc_radius + reach)
+                else:
+                    interval = line_segment_interval(via_x, via_y, dx, dy, *primitive[1:], radius=reach)
+
+            elif kind == self.VIA:
+                vias = snapshot.vias
+                radius = same_net_radius if vias.net[i] == candidate.net else check_radius
+                reach = radius + vias.diameter[i] // 2
+                interval = line_circle_interval(via_x - vias.x[i], via_y - vias.y[i], dx, dy, reach)
+
+            else:
+                pads = snapshot.pads
+                radius = same_net_radius if pads.net[i] == candidate.net else check_radius
+                pad_clearance = pads.local_clearance[i] or candidate.clearance
+                reach = radius + max(pad_clearance, abs(pads.mask_margin[i]))
+                shape = snapshot.pad_shapes[pads.shape[i]]
+                interval = shape.line_interval(via_x - pads.x[i], via_y - pads.y[i], dx, dy, reach)
+
+            if interval is not None:
+                blocked.append(interval)
+
+        return blocked
+
+    def check(self, candidate):
+        return self.check_obstacles(candidate, self.prefilter(candidate))
+
+    def check_batch(self, candidates):
+        nearby = query_by_cell(self.index, candidates, self.reach)
+        return [self.check_obstacles(candidate, obstacles) for candidate, obstacles in zip(candidates, nearby)]
+
+    def check_obstacles(self, candidate, obstacles):
+        """check() against the given obstacles (a superset of the ones near the candidate)."""
+        snapshot = self.snapshot
+        via_x = candidate.x
+        via_y = candidate.y
+
+        # Via footprint = via radius + clearance
+        via_radius = candidate.diameter // 2
+        check_radius = via_radius + candidate.clearance
+        same_net_radius = via_radius + SAME_NET_MIN_CLEARANCE
+
+        for kind, i, layers in obstacles:
+            if not layers & candidate.layers:
+                continue  # Not on a layer the via spans
+
+            if kind == self.TRACK:
+                # Skip if this obstacle is part of the track we're stitching
+                if i in candidate.exclude:
+                    continue
+                tracks = snapshot.tracks
+                radius = same_net_radius if tracks.net[i] == candidate.net else check_radius
+                # Check if too close (via footprint + track half-width)
+                reach = radius + tracks.width[i] // 2
+                primitive = self.track_primitives[i]
+                if primitive[0] == 'arc':
+                    if point_to_primitive_distance(via_x, via_y, primitive) < reach:
+                        return False
+                elif point_to_segment_distance_sq(via_x, via_y, *primitive[1:]) < reach * reach:
+                    return False
+
+            elif kind == self.VIA:
+                vias = snapshot.vias
+                radius = same_net_radius if vias.net[i] == candidate.net else check_radius
+                # radius already includes clearance, so just add other via's radius
+                reach = radius + vias.diameter[i] // 2
+                dx = via_x - vias.x[i]
+                dy = via_y - vias.y[i]
+                if dx * dx + dy * dy < reach * reach:
+                    return False
+
+            else:
+                # Pads (including NPTH mechanical holes), using the exact pad shape
+                pads = snapshot.pads
+                radius = same_net_radius if pads.net[i] == candidate.net else check_radius
+                # Keepout around the pad = max(clearance, soldermask_expansion)
+                # We need to stay clear of both the clearance zone AND soldermask opening
+                pad_clearance = pads.local_clearance[i] or candidate.clearance
+                reach = radius + max(pad_clearance, abs(pads.mask_margin[i]))
+                shape = snapshot.pad_shapes[pads.shape[i]]
+                dx = via_x - pads.x[i]
+                dy = via_y - pads.y[i]
+                # Cheap bounding circle rejection before the exact shape distance
+                if dx * dx + dy * dy >= (reach + shape.bounding_radius) ** 2:
+                    continue
+                if shape.distance(dx, dy) < reach:
+                    return False
+
+        return True
+
+
+class PlacedViaConstraint(Constraint):
+    """Vias must keep clearance to the vias placed during this run.
+
+    This is the only dynamic constraint: every placed via is added to its index.
+    Placed vias are on the via net, so a candidate checked against that net
+    (grid stitching) only needs SAME_NET_MIN_CLEARANCE to them. Vias whose
+    layer spans don't overlap don't collide.
+    """
+    name = 'placed via'
+    dynamic = True
+    cost = 1.0
+
+    def __init__(self):
+        self.index = SpatialIndex(INDEX_CELL_SIZE)
+        self.placed = []  # (x, y, diameter, net, layers)
+
+    def prefilter(self, candidate):
+        # Placed vias are indexed with their own extent
+        return self.index.query_radius(candidate.x, candidate.y,
+                                       candidate.diameter // 2 + max(candidate.clearance, SAME_NET_MIN_CLEARANCE))
+
+    def check(self, candidate):
+        via_radius = candidate.diameter // 2
+        for i in self.prefilter(candidate):
+            x, y, diameter, net, layers = self.placed[i]
+            if not layers & candidate.layers:
+                continue
+            if net == candidate.net:
+                reach = via_radius + SAME_NET_MIN_CLEARANCE
+            else:
+                reach = via_radius + candidate.clearance
+            reach += diameter // 2
+            dx = candidate.x - x
+            dy = candidate.y - y
+            if dx * dx + dy * dy < reach * reach:
+                return False
+        return True
+
+    def blocked_intervals(self, candidate, dx, dy, low, high):
+        via_radius = candidate.diameter // 2
+        reach = via_radius + max(candidate.clearance, SAME_NET_MIN_CLEARANCE)
+        xs = (candidate.x + low * dx, candidate.x + high * dx)
+        ys = (candidate.y + low * dy, candidate.y + high * dy)
+        blocked = []
+        for i in self.index.query(min(xs) - reach, min(ys) - reach, max(xs) + reach, max(ys) + reach):
+            x, y, diameter, net, layers = self.placed[i]
+            if not layers & candidate.layers:
+                continue
+            if net == candidate.net:
+                radius = via_radius + SAME_NET_MIN_CLEARANCE
+            else:
+                radius = via_radius + candidate.clearance
+            interval = line_circle_interval(candidate.x - x, candidate.y - y, dx, dy, radius + diameter // 2)
+            if interval is not None:
+                blocked.append(interval)
+        return blocked
+
+    def via_placed(self, candidate):
+        # Store with the real via size; candidate.diameter includes the safety margin
+        # like every existing via obstacle compared against the margin-inflated candidate
+        radius = candidate.via_diameter // 2
+        self.index.insert(len(self.placed), candidate.x - radius, candidate.y - radius,
+                          candidate.x + radius, candidate.y + radius)
+        self.placed.append((candidate.x, candidate.y, candidate.via_diameter, candidate.via_net, candidate.layers))
+
+
+def default_constraints(snapshot):
+    """The built-in constraints, in the order they were historically checked."""
+    return [
+        CourtyardConstraint(snapshot.courtyards),
+        BoardEdgeConstraint(snapshot.outline, snapshot.edge_clearance),
+        TuningAreaConstraint(),
+        KeepoutConstraint(snapshot.keepouts),
+        MemberGuardConstraint(),
+        CopperConstraint(snapshot),
+        PlacedViaConstraint(),
+    ]
+
+
+class ConstraintStats:
+    """Measured behaviour of one constraint in a pipeline."""
+    __slots__ = ('evaluated', 'rejected', 'seconds')
+
+    def __init__(self):
+        self.evaluated = 0
+        self.rejected = 0
+        self.seconds = 0.0
+
+
+class ConstraintPipeline:
+    """Runs constraints, cheapest per rejection first.
+
+    Constraints are ordered by expected cost per rejected candidate:
+    (time per evaluation) / (rejection probability). Both are measured while
+    running; the constraint's cost attribute is used until it has been measured.
+    Rejections are counted for the first constraint that rejects a candidate.
+    """
+
+    # Candidates per batch; constraints are re-ordered between batches
+    BATCH_SIZE = 256
+
+    # Seconds per evaluation assumed for Constraint.cost == 1.0 before measuring
+    COST_UNIT = 1e-6
+
+    def __init__(self, constraints=()):
+        self.constraints = []
+        self.stats = {}
+        for constraint in constraints:
+            self.add(constraint)
+
+    def add(self, constraint):
+        """Add a constraint to the pipeline."""
+        self.constraints.append(constraint)
+        self.stats[constraint] = ConstraintStats()
+
+    def find(self, name):
+        """The constraint with the given name, or None."""
+        for constraint in self.constraints:
+            if constraint.name == name:
+                return constraint
+        return None
+
+    def score(self, constraint):
+        stats = self.stats[constraint]
+        if stats.evaluated:
+            cost = stats.seconds / stats.evaluated
+        else:
+            cost = constraint.cost * self.COST_UNIT
+        # Laplace smoothed rejection rate, so unmeasured constraints start at 1/2
+        reject_rate = (stats.rejected + 1.0) / (stats.evaluated + 2.0)
+        return cost / reject_rate
+
+    def ordered(self, dynamic):
+        """Static or dynamic constraints, cheapest per rejection first."""
+        return sorted((c for c in self.constraints if c.dynamic == dynamic), key=self.score)
+
+    def check_static_batch(self, candidates):
+        """Run the static constraints on all candidates.
+
+        Candidates are processed in batches; within a batch each constraint only
+        sees the candidates that passed the constraints before it.
+
+        Returns:
+            list of bools, True where the candidate passed all static constraints
+        """
+        passed = [True] * len(candidates)
+        for start in range(0, len(candidates), self.BATCH_SIZE):
+            remaining = list(range(start, min(start + self.BATCH_SIZE, len(candidates))))
+            for constraint in self.ordered(dynamic=False):
+                if not remaining:
+                    break
+                stats = self.stats[constraint]
+                t0 = time.perf_counter()
+                results = constraint.check_batch([candidates[i] for i in remaining])
+                stats.seconds += time.perf_counter() - t0
+                stats.evaluated += len(remaining)
+
+                survivors = []
+                for i, ok in zip(remaining, results):
+                    if ok:
+                        survivors.append(i)
+                    else:
+                        passed[i] = False
+                        stats.rejected += 1
+                remaining = survivors
+        return passed
+
+    def check(self, candidate, dynamic=None):
+        """Run the constraints on one candidate.
+
+        Args:
+            candidate: StitchCandidate
+            dynamic: None for all constraints, True/False for only dynamic/static ones
+
+        Returns:
+            True if the candidate passed
+        """
+        groups = (False, True) if dynamic is None else (dynamic,)
+        for group in groups:
+            for constraint in self.ordered(group):
+                stats = self.stats[constraint]
+                t0 = time.perf_counter()
+                ok = constraint.check(candidate)
+                stats.seconds += time.perf_counter() - t0
+                stats.evaluated += 1
+                if not ok:
+                    stats.rejected += 1
+                    return False
+        return True
+
+    def blocked_intervals(self, candidate, dx, dy, low, high, dynamic=None):
+        """Intervals along a line where the candidate is blocked (see Constraint.blocked_intervals).
+
+        Only the constraints that can compute intervals contribute; the others
+        have to be checked at the chosen position.
+
+        Args:
+            dynamic: only the static (False) or dynamic (True) constraints, or all (None)
+
+        Returns:
+            list of (s0, s1)
+        """
+        blocked = []
+        for constraint in self.constraints:
+            if dynamic is not None and constraint.dynamic != dynamic:
+                continue
+            intervals = constraint.blocked_intervals(candidate, dx, dy, low, high)
+            if intervals:
+                blocked.extend(intervals)
+        return blocked
+
+    def via_placed(self, candidate):
+        """Tell all constraints that a via has been placed at the candidate."""
+        for constraint in self.constraints:
+            constraint.via_placed(candidate)
+
+    def rejection_counts(self):
+        """dict mapping constraint name to number of candidates it rejected."""
+        return dict((c.name, self.stats[c].rejected) for c in self.constraints)
@@ -0,0 +1,110 @@
+"""
+Via coverage field for fill-in stitching.
+
+The usable plane area (inside the board outline and the stitching net's
+zones) is rasterized into cells. For every cell the distance to the nearest
+stitching via is kept as a distance transform truncated at the target
+distance: each via only updates the cells within the target around it, so
+adding a via is a small NumPy window update.
+
+Needs NumPy.
+"""
+try:
+    import numpy as np
+except Exception:
+    # NumPy is optional for the rest of the plugin, only coverage stitching needs it
+    np = None
+
+
+class CoverageField:
+    """Distance from every usable plane cell to the nearest via, up to a target distance.
+
+    Attributes:
+        target: target distance in internal units; a cell is covered if a via is
+                at most this far from its center
+        cell: cell size in internal units
+        usable: (rows, cols) bool array, True for cells in the plane area
+        distance_sq: (rows, cols) float array, squared distance to the nearest via;
+                     inf where no via is within the target distance
+    """
+
+    # Maximum number of cells per axis (the cell size grows for large boards)
+    MAX_CELLS = 1024
+
+    def __init__(self, outline, planes, target, cell=None):
+        """
+        Args:
+            outline: PolygonIndex of the board outline
+            planes: list of PolygonIndex of the plane zones; the whole board is
+                    usable if empty
+            target: target distance in internal units
+            cell: cell size in internal units (target / 4 if None)
+        """
+        if np is None:
+            raise Exception("Coverage stitching needs NumPy.")
+
+        self.target = int(target)
+        width = outline.right - outline.left
+        height = outline.bottom - outline.top
+        self.cell = max(int(cell or self.target // 4), width // self.MAX_CELLS + 1,
+                        height // self.MAX_CELLS + 1, 1)
+        self.left = outline.left
+        self.top = outline.top
+
+        cols = width // self.cell + 1
+        rows = height // self.cell + 1
+        # Cell centers
+        self.xs = self.left + self.cell // 2 + np.arange(cols, dtype=np.int64) * self.cell
+        self.ys = self.top + self.cell // 2 + np.arange(rows, dtype=np.int64) * self.cell
+
+        grid_x, grid_y = np.meshgrid(self.xs, self.ys)
+        grid_x = grid_x.ravel()
+        grid_y = grid_y.ravel()
+        usable = np.array(outline.contains_many(grid_x, grid_y), dtype=bool)
+        if planes:
+            in_plane = np.zeros(len(grid_x), dtype=bool)
+            for plane in planes:
+                in_plane |= np.array(plane.contains_many(grid_x, grid_y), dtype=bool)
+            usable &= in_plane
+        self.usable = usable.reshape(rows, cols)
+
+        self.distance_sq = np.full((rows, cols), np.inf)
+
+    def add_via(self, x, y):
+        """Update the distances around a via at x, y."""
+        # Window of cells whose center can be within the target distance
+        col0 = max(0, (x - self.target - self.left) // self.cell)
+        col1 = min(len(self.xs), (x + self.target - self.left) // self.cell + 1)
+        row0 = max(0, (y - self.target - self.top) // self.cell)
+        row1 = min(len(self.ys), (y + self.target - self.top) // self.cell + 1)
+        if col0 >= col1 or row0 >= row1:
+            return
+
+        dx = (self.xs[col0:col1] - x).astype(np.float64)
+        dy = (self.ys[row0:row1] - y).astype(np.float64)
+        d2 = dy[:, None] ** 2 + dx[None, :] ** 2
+        d2[d2 > float(self.target) ** 2] = np.inf
+        window = self.distance_sq[row0:row1, col0:col1]
+        np.minimum(window, d2, out=window)
+
+    def covered(self):
+        """Bool array of the usable cells within the target distance of a via."""
+        return self.usable & np.isfinite(self.distance_sq)
+
+    def is_covered(self, x, y):
+        """True if the cell containing x, y is within the target distance of a via."""
+        col = (x - self.left) // self.cell
+        row = (y - self.top) // self.cell
+        return bool(np.isfinite(self.distance_sq[row, col]))
+
+    def coverage(self):
+        """Fraction of the usable area within the target distance of a via (1.0 if no area)."""
+        usable = int(self.usable.sum())
+        if not usable:
+            return 1.0
+        return int(self.covered().sum()) / float(usable)
+
+    def uncovered_positions(self):
+        """Centers (x, y) of all usable cells not covered yet, row by row."""
+        rows, cols = np.nonzero(self.usable & ~np.isfinite(self.distance_sq))
+        return list(zip(self.xs[cols].tolist(), self.ys[rows].tolist()))
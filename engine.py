@@ -0,0 +1,1081 @@
+"""
+Via stitching engine: generates stitch candidates and places the ones that pass
+all constraints.
+
+The engine only works on a BoardSnapshot (see snapshot module); creating the
+vias on the real board is done through the add_via callback.
+"""
+import math
+import time
+from collections import deque
+
+from .connectivity import COORD_TOLERANCE, coords_match
+from .constraints import INDEX_CELL_SIZE, ConstraintPipeline, default_constraints
+from .coverage import CoverageField
+from .geometry import (SpatialIndex, cluster_points, free_intervals, primitive_endpoints, reverse_primitive,
+                       sample_offset_positions)
+
+
+# Add 50µm safety margin to via diameter for all collision calculations
+# This accounts for rounding errors and manufacturing tolerances
+VIA_SAFETY_MARGIN = 50000  # 50 micrometers = 0.05mm
+
+
+# Net name parts of nets stitched first when there is a time budget
+HIGH_SPEED_NET_PATTERNS = ('CLK', 'USB', 'ETH', 'HDMI', 'PCIE', 'LVDS', 'MIPI', 'DDR', 'SATA', 'SERDES')
+
+# Refinement levels of the coarse-to-fine candidate order (see refinement_level)
+REFINEMENT_LEVELS = 3
+
+# Candidates validated and placed per chunk; the time budget is checked between chunks
+PLACEMENT_CHUNK = 256
+
+# Approximate memory of one StitchCandidate (object, coordinates, empty tuples shared)
+CANDIDATE_BYTES = 320
+
+# Free positions tried (nearest first) when a blocked candidate slides
+SLIDE_TRIES = 3
+
+# Directions searched around a signal via for free return via positions
+RETURN_VIA_DIRECTIONS = 16
+
+# Distance steps within which the second return via prefers the side opposite the first
+RETURN_VIA_DISTANCE_STEP = 100000  # 0.1mm
+
+# Maximum angle between two track segments that still run parallel in a bundle
+BUNDLE_ANGLE_TOLERANCE = math.radians(10)
+
+
+class StitchCandidate:
+    """A via position to validate, with what the constraints need to know about it.
+
+    Attributes:
+        x, y: via center in internal units
+        diameter: via diameter incl. safety margin, used for all checks
+        clearance: clearance to keep to copper of other nets
+        net: net code checked with the reduced same-net clearance (the stitched
+             track's net, or the via net for grid stitching)
+        exclude: track IDs excluded from the copper check (the segments being stitched)
+        guards: list of (path primitive, minimum distance) the via has to keep to the
+                excluded tracks; only checked for merged candidates
+        check_guards: whether guards have to be checked
+        via_diameter, via_drill: size of the via to create
+        via_net: net code of the via to create
+        layers: bitmask (over positions in snapshot.copper_layers) of the layers
+                the via spans; constraints only look at copper on these layers
+        priority: lower values are placed first when there is a time budget
+        slide: (dx, dy, low, high) if the via may slide along a line when the
+               position is blocked: to (x + s*dx, y + s*dy) for s in [low, high]
+               ((dx, dy) is a unit direction), None if it may not
+    """
+    __slots__ = ('x', 'y', 'diameter', 'clearance', 'net', 'exclude', 'guards', 'check_guards',
+                 'via_diameter', 'via_drill', 'via_net', 'layers', 'priority', 'slide')
+
+    def __init__(self, x, y, diameter, clearance, net, via_diameter, via_drill, via_net, layers,
+                 exclude=(), guards=(), check_guards=False, priority=0, slide=None):
+        self.x = x
+        self.y = y
+        self.diameter = diameter
+        self.clearance = clearance
+        self.net = net
+        self.exclude = exclude
+        self.guards = guards
+        self.check_guards = check_guards
+        self.via_diameter = via_diameter
+        self.via_drill = via_drill
+        self.via_net = via_net
+        self.layers = layers
+        self.priority = priority
+        self.slide = slide
+
+    def moved(self, s):
+        """Copy of the candidate slid to s along its slide line (that may not slide further)."""
+        dx, dy = self.slide[0], self.slide[1]
+        return StitchCandidate(int(round(self.x + s * dx)), int(round(self.y + s * dy)), self.diameter,
+                               self.clearance, self.net, self.via_diameter, self.via_drill, self.via_net,
+                               self.layers, self.exclude, self.guards, self.check_guards, self.priority)
+
+
+def refinement_level(*steps):
+    """Coarse-to-fine level of a position on a regular pattern.
+
+    Positions at every 4th step (in all given directions) are level 0, the
+    remaining ones at every 2nd step level 1, all others level 2. Placing level 0
+    first gives an even, coarse stitching that later levels refine.
+    """
+    if all(step % 4 == 0 for step in steps):
+        return 0
+    if all(step % 2 == 0 for step in steps):
+        return 1
+    return 2
+
+
+class StitchingEngine:
+    """Places stitching vias on a board snapshot.
+
+    Placed vias are reported through add_via(x, y, drill, diameter, layer_top,
+    layer_bottom) and are added to the constraints, so later candidates keep
+    clearance to them.
+
+    With a deadline (anytime mode) candidates are placed in priority order and
+    every stitch method stops when the deadline has passed, keeping the vias
+    placed so far. plan records how much of each method's plan was processed.
+    """
+
+    def __init__(self, snapshot, via_net, add_via=None, pipeline=None, blind_buried=False, deadline=None,
+                 plane_only=False, bus_fencing=False):
+        """
+        Args:
+            snapshot: BoardSnapshot of the board
+            via_net: net code of the stitching vias (GND)
+            add_via: callback creating a via on the board, or None
+            pipeline: ConstraintPipeline, the default constraints if None; engines for
+                      several via nets share one pipeline, so they share its indexes
+                      and keep clearance to each other's vias
+            blind_buried: if True, track stitching vias only span from the via net
+                          planes next to the stitched layer (see via_span)
+            deadline: time.perf_counter() value after which no more candidates
+                      are processed, or None for no time limit
+            plane_only: if True, grid vias are only placed inside the via net's zones
+                        (when another net's planes cover the rest of the board)
+            bus_fencing: if True, bundles of parallel tracks (buses) only get track
+                         stitching candidates along their outer edges (see bundle_sides)
+        """
+        self.snapshot = snapshot
+        self.via_net = via_net
+        self.add_via = add_via
+        self.blind_buried = blind_buried
+        self.deadline = deadline
+        self.plane_only = plane_only
+        self.bus_fencing = bus_fencing
+        self.bundles = 0  # bundles of parallel tracks found by bus fencing
+        self.fenced = 0   # track candidates not generated because they were inside a bundle
+        self.slid = 0     # vias placed after sliding away from a blocked position
+        self.plan = {}  # stitch method name -> [candidates processed, candidates planned]
+        self.pipeline = pipeline if pipeline is not None else ConstraintPipeline(default_constraints(snapshot))
+        self.placed = []        # StitchCandidate of every placed via
+        self.placed_items = []  # what add_via returned for every placed via
+        self._segment_intervals = {}  # static slide intervals per segment line, see segment_intervals
+
+    def out_of_time(self):
+        """True if the deadline has passed."""
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def high_speed_net(self, net_code):
+        """Guess from the net name whether a net is high-speed (diff pairs, clocks, serial links)."""
+        net_name = self.snapshot.net_name(net_code).upper()
+        if net_name.endswith('_N') or net_name.endswith('_P'):
+            return True
+        return any(pattern in net_name for pattern in HIGH_SPEED_NET_PATTERNS)
+
+    def gather_tracks_per_layer(self, include_top, include_inner, include_bot):
+        """Gather all traces (track IDs) organized by layer.
+
+        Args:
+            include_top: whether to include top layer
+            include_inner: whether to include inner layers
+            include_bot: whether to include bottom layer
+
+        Returns:
+            dict mapping layer ID to list of track IDs, in top-to-bottom layer order
+        """
+        copper_layers = self.snapshot.copper_layers
+        layers_to_process = []
+        for position, layer in enumerate(copper_layers):
+            if position == 0:
+                included = include_top
+            elif position == len(copper_layers) - 1:
+                included = include_bot
+            else:
+                included = include_inner
+            if included:
+                layers_to_process.append(layer)
+
+        traces_per_layer = dict((layer, []) for layer in layers_to_process)
+        tracks = self.snapshot.tracks
+        for track_id in range(len(tracks)):
+            layer = tracks.layer[track_id]
+            if layer in traces_per_layer:
+                traces_per_layer[layer].append(track_id)
+
+        return dict((layer, ids) for layer, ids in traces_per_layer.items() if ids)
+
+    def sort_track_traces(self, track):
+        """Sort traces in a track so they form a continuous path.
+
+        Args:
+            track: list of track IDs that should connect end-to-end
+
+        Returns:
+            sorted list of track IDs forming a continuous path
+        """
+        if not track or len(track) <= 1:
+            return track
+
+        t = self.snapshot.tracks
+        sorted_traces = [track[0]]
+        remaining = list(track[1:])
+
+        # Build chain by finding traces that connect to current endpoint
+        while remaining:
+            last = sorted_traces[-1]
+            found = False
+
+            for i, trace in enumerate(remaining):
+                if (coords_match(t.x1[last], t.y1[last], t.x0[trace], t.y0[trace]) or
+                        coords_match(t.x1[last], t.y1[last], t.x1[trace], t.y1[trace])):
+                    # A backwards trace is flipped later by track_to_path
+                    sorted_traces.append(trace)
+                    remaining.pop(i)
+                    found = True
+                    break
+
+            if not found:
+                # Try connecting to the start of the chain instead
+                first = sorted_traces[0]
+                for i, trace in enumerate(remaining):
+                    if (coords_match(t.x0[first], t.y0[first], t.x1[trace], t.y1[trace]) or
+                            coords_match(t.x0[first], t.y0[first], t.x0[trace], t.y0[trace])):
+                        sorted_traces.insert(0, trace)
+                        remaining.pop(i)
+                        found = True
+                        break
+
+            if not found:
+                # Disconnected trace - just append remaining
+                sorted_traces.extend(remaining)
+                break
+
+        return sorted_traces
+
+    def track_to_path(self, sorted_track):
+        """Turn a sorted track into a list of oriented path primitives.
+
+        sort_track_traces keeps traces that are stored backwards as they are; here
+        each primitive is flipped where needed so it starts where the previous one ends.
+
+        Args:
+            sorted_track: list of track IDs from sort_track_traces
+
+        Returns:
+            list of primitives, one per track ID
+        """
+        def match(pos1, pos2):
+            return coords_match(pos1[0], pos1[1], pos2[0], pos2[1])
+
+        raw = [self.snapshot.track_primitive(track_id) for track_id in sorted_track]
+        primitives = []
+
+        for primitive in raw:
+            start, end = primitive_endpoints(primitive)
+            if primitives:
+                # Continue from the end of the previous primitive
+                prev_end = primitive_endpoints(primitives[-1])[1]
+                if match(prev_end, end) and not match(prev_end, start):
+                    primitive = reverse_primitive(primitive)
+            elif len(raw) > 1:
+                # Orient the first primitive towards the second one
+                next_start, next_end = primitive_endpoints(raw[1])
+                if ((match(start, next_start) or match(start, next_end)) and
+                        not (match(end, next_start) or match(end, next_end))):
+                    primitive = reverse_primitive(primitive)
+            primitives.append(primitive)
+
+        return primitives
+
+    def diff_pair_gap(self, track, tracks, trace_width):
+        """Estimate the gap to the paired trace if the track is part of a differential pair.
+
+        In KiCAD 9, we need to detect diff pairs by looking for traces with similar
+        net names (e.g., USB2_N <-> USB2_P).
+
+        Args:
+            track: list of track IDs
+            tracks: dict mapping net name to the tracks (lists of track IDs) of that net
+            trace_width: width of the track
+
+        Returns:
+            gap between the pair's trace edges in internal units, 0 if not a pair
+        """
+        t = self.snapshot.tracks
+        net_name = self.snapshot.net_name(t.net[track[0]])
+
+        # Check if this looks like a differential pair net name
+        if not (net_name.endswith('_N') or net_name.endswith('_P')):
+            return 0
+
+        # Find the opposite net
+        if net_name.endswith('_N'):
+            pair_name = net_name[:-2] + '_P'
+        else:
+            pair_name = net_name[:-2] + '_N'
+
+        # Find the closest trace on the paired net to estimate gap
+        min_gap = float('inf')
+        for other_track in tracks.get(pair_name, ()):
+            if other_track != track:
+                # Found the paired net, measure gap between traces
+                for trace1 in track:
+                    for trace2 in other_track:
+                        # Calculate approximate distance between traces
+                        # This is simplified - just center-to-center of closest segments
+                        dx = t.x0[trace2] - t.x0[trace1]
+                        dy = t.y0[trace2] - t.y0[trace1]
+                        dist = math.sqrt(dx*dx + dy*dy)
+                        if dist < min_gap:
+                            min_gap = dist
+
+        if min_gap < float('inf'):
+            # Subtract both trace widths to get the actual gap between edges
+            # min_gap is center-to-center distance
+            # For same width traces: gap = center_to_center - 2*trace_width
+            return int(min_gap - 2 * trace_width)
+        return 0
+
+    def via_span(self, layer):
+        """Bitmask of the layers a stitching via for tracks on the given layer spans.
+
+        Through vias span all layers. With blind_buried, the via runs from the
+        nearest via net plane above the layer to the nearest one below it (e.g.
+        In2-In4 for a track on In3 between two GND planes); without a plane on
+        one side, the via runs to the outer layer on that side.
+        """
+        snapshot = self.snapshot
+        if not self.blind_buried or layer not in snapshot.copper_layers:
+            return snapshot.all_layers_mask()
+
+        position = snapshot.copper_layers.index(layer)
+        planes = snapshot.plane_positions(self.via_net)
+        above = [p for p in planes if p < position]
+        below = [p for p in planes if p > position]
+        top = above[-1] if above else 0
+        bottom = below[0] if below else len(snapshot.copper_layers) - 1
+        return snapshot.span_mask(snapshot.copper_layers[top], snapshot.copper_layers[bottom])
+
+    def bundle_sides(self, paths, half_widths, clearances, via_diameter):
+        """Find where tracks of one layer run so close and parallel that no via fits between them.
+
+        In a bus (e.g. DDR data lines) almost every candidate between two adjacent
+        tracks would be generated, checked and rejected. The straight primitives of
+        all tracks go into a spatial index; for every primitive, the nearly parallel
+        primitives of other tracks closer than a via plus both clearances are looked
+        up, and the stretch they run alongside is recorded on their side. Tracks
+        linked this way form a bundle, fenced only on its outer edges.
+
+        Args:
+            paths: list of tracks, each a list of oriented primitives
+            half_widths: half trace width per track
+            clearances: clearance to keep to each track
+            via_diameter: via diameter incl. safety margin
+
+        Returns:
+            tuple: (dict mapping (track index, primitive index, side) to a list of
+                    (start, end) distances along the primitive that face a
+                    neighbour - side +1 is left of the direction of travel, -1
+                    right, like the two offsets of sample_offset_positions;
+                    number of bundles of two or more tracks)
+        """
+        segments = []
+        index = SpatialIndex(INDEX_CELL_SIZE)
+        for track_idx, path in enumerate(paths):
+            for prim_idx, primitive in enumerate(path):
+                if primitive[0] != 'line':
+                    continue  # Arcs are stitched on both sides
+                _, x0, y0, x1, y1 = primitive
+                length = math.hypot(x1 - x0, y1 - y0)
+                if length < 1:
+                    continue
+                index.insert(len(segments), min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+                segments.append((track_idx, prim_idx, x0, y0, x1, y1, (x1 - x0) / length, (y1 - y0) / length, length))
+
+        reach = 2 * max(half_widths + [0]) + 2 * max(clearances + [0]) + via_diameter
+        max_cross = math.sin(BUNDLE_ANGLE_TOLERANCE)
+        stretches = {}
+        parent = list(range(len(paths)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for track_idx, prim_idx, x0, y0, x1, y1, dx, dy, length in segments:
+            for other in index.query(min(x0, x1) - reach, min(y0, y1) - reach,
+                                     max(x0, x1) + reach, max(y0, y1) + reach):
+                other_track, _, ox0, oy0, ox1, oy1, odx, ody, _ = segments[other]
+                if other_track == track_idx or abs(dx * ody - dy * odx) > max_cross:
+                    continue
+
+                # Both ends of the other primitive on the same side, closer than a via fits
+                limit = (half_widths[track_idx] + clearances[track_idx] + via_diameter +
+                         clearances[other_track] + half_widths[other_track])
+                d0 = dx * (oy0 - y0) - dy * (ox0 - x0)
+                d1 = dx * (oy1 - y0) - dy * (ox1 - x0)
+                if d0 * d1 <= 0 or max(abs(d0), abs(d1)) > limit:
+                    continue
+
+                # Stretch of this primitive the other one runs alongside
+                t0 = dx * (ox0 - x0) + dy * (oy0 - y0)
+                t1 = dx * (ox1 - x0) + dy * (oy1 - y0)
+                start = max(0.0, min(t0, t1))
+                end = min(length, max(t0, t1))
+                if end <= start:
+                    continue
+
+                stretches.setdefault((track_idx, prim_idx, 1 if d0 > 0 else -1), []).append((start, end))
+                parent[find(other_track)] = find(track_idx)
+
+        sizes = {}
+        for track_idx in range(len(paths)):
+            root = find(track_idx)
+            sizes[root] = sizes.get(root, 0) + 1
+        return stretches, sum(1 for size in sizes.values() if size > 1)
+
+    def track_candidates(self, tracks, layer, stitch_distance, via_drill, via_diameter, slide_tolerance=0):
+        """Generate stitch candidates on both sides of every track of one layer.
+
+        Stitch positions for all tracks are sampled by arc length in one pass
+        (arc tracks are followed exactly). With bus_fencing, positions on a side
+        of a track that faces a close parallel track are not generated.
+
+        Candidates along straight segments may slide up to slide_tolerance along
+        the segment (not past its ends) when their position is blocked, see
+        place_batch.
+
+        Args:
+            tracks: list of tracks (each track is a list of track IDs)
+            layer: layer ID of the tracks
+            stitch_distance: distance between via placements in internal units
+            via_drill: via drill diameter in internal units
+            via_diameter: via diameter in internal units
+            slide_tolerance: how far a blocked candidate may slide in internal units
+
+        Returns:
+            list of StitchCandidate in track/station/side order
+        """
+        t = self.snapshot.tracks
+        via_diameter_with_margin = via_diameter + VIA_SAFETY_MARGIN
+        layers = self.via_span(layer)
+
+        # Per track: oriented path primitives, the track IDs behind them, the via
+        # offset from the track center and the track's own parameters
+        paths = []
+        path_ids = []
+        offsets = []
+        track_info = []
+        half_widths = []
+        effective_clearances = []
+
+        # Tracks per net name, so diff pairs only look at the tracks of their paired net
+        tracks_by_name = {}
+        for track in tracks:
+            if track:
+                tracks_by_name.setdefault(self.snapshot.net_name(t.net[track[0]]), []).append(track)
+
+        for track in tracks:
+            if not track:
+                continue
+
+            # Get the first trace to determine net class clearance and trace width
+            first_trace = track[0]
+            track_net = t.net[first_trace]
+            clearance = t.clearance[first_trace]
+
+            # Find the maximum trace width in the track (handles mixed-width tracks)
+            trace_width = max(t.width[trace] for trace in track)
+
+            # Differential pairs need vias placed outside the pair, not between the traces
+            diff_pair_gap = self.diff_pair_gap(track, tracks_by_name, trace_width)
+
+            # Calculate offset from track center to via center
+            # For differential pairs: Add extra half trace width to avoid the paired trace
+            #   offset = trace_width/2 + clearance + via_diameter/2 + (trace_width/2 if diff pair)
+            #   The collision detection will block vias too close to paired trace
+            # For single traces: offset = trace_width/2 + effective_clearance + via_diameter/2
+            #   Use minimum 0.2mm clearance for better same-net spacing
+            # NOTE: Use via_diameter_with_margin for calculations to ensure proper clearance
+            if diff_pair_gap > 0:
+                offset = trace_width // 2 + clearance + via_diameter_with_margin // 2 + trace_width // 2
+            else:
+                effective_clearance = max(clearance, int(0.2e6))  # 0.2mm minimum
+                offset = trace_width // 2 + effective_clearance + via_diameter_with_margin // 2
+
+            # Sort traces so they form a continuous path, as oriented line/arc primitives
+            sorted_track = self.sort_track_traces(track)
+            paths.append(self.track_to_path(sorted_track))
+            path_ids.append(sorted_track)
+            offsets.append(offset)
+
+            # Clearance the via must keep to its own trace (used by merged candidates)
+            guard_distance = trace_width // 2 + clearance + via_diameter_with_margin // 2
+            track_info.append((track_net, clearance, guard_distance))
+            half_widths.append(trace_width // 2)
+            effective_clearances.append(max(clearance, int(0.2e6)))
+
+        # Sample all stitch positions (both sides of every track) in one pass
+        cand_x, cand_y, cand_track, cand_prim = sample_offset_positions(paths, stitch_distance, offsets)
+
+        stretches = {}
+        if self.bus_fencing:
+            stretches, bundles = self.bundle_sides(paths, half_widths, effective_clearances,
+                                                   via_diameter_with_margin)
+            self.bundles += bundles
+
+        candidates = []
+        stations = [0] * len(paths)  # positions seen per track, two (sides) per station
+        for i in range(len(cand_x)):
+            track_idx = cand_track[i]
+            prim_idx = cand_prim[i]
+            track_net, clearance, guard_distance = track_info[track_idx]
+
+            # Priority: high-speed nets first, each coarse to fine along the track
+            priority = refinement_level(stations[track_idx] // 2)
+            stations[track_idx] += 1
+            if not self.high_speed_net(track_net):
+                priority += REFINEMENT_LEVELS
+
+            slide = None
+            primitive = paths[track_idx][prim_idx]
+            if primitive[0] == 'line' and (stretches or slide_tolerance > 0):
+                _, x0, y0, x1, y1 = primitive
+                length = math.hypot(x1 - x0, y1 - y0)
+                if length >= 1:
+                    dx = (x1 - x0) / length
+                    dy = (y1 - y0) / length
+                    along = dx * (cand_x[i] - x0) + dy * (cand_y[i] - y0)
+
+                    # Inside a bundle: the side faces a neighbour track, no via fits there
+                    side = 1 if dx * (cand_y[i] - y0) - dy * (cand_x[i] - x0) > 0 else -1
+                    if any(start <= along <= end for start, end in stretches.get((track_idx, prim_idx, side), ())):
+                        self.fenced += 1
+                        continue
+
+                    # Slide window: within the tolerance and alongside the segment
+                    if slide_tolerance > 0:
+                        slide = (dx, dy, max(-slide_tolerance, -along), min(slide_tolerance, length - along))
+
+            # IMPORTANT: Only exclude the current trace segment we're stitching along
+            # NOT the entire track - this ensures vias stay clear of length tuning wiggles
+            # that are part of the same connected track but on different segments
+            candidates.append(StitchCandidate(
+                cand_x[i], cand_y[i], via_diameter_with_margin, clearance, track_net,
+                via_diameter, via_drill, self.via_net, layers,
+                exclude=(path_ids[track_idx][prim_idx],),
+                guards=((paths[track_idx][prim_idx], guard_distance),),
+                priority=priority, slide=slide))
+
+        return candidates
+
+    def merge_candidates(self, candidates, merge_distance):
+        """Merge near-coincident stitch candidates into one representative each.
+
+        Where tracks run parallel, the +1 side candidates of one track and the -1
+        side candidates of the other land nearly on top of each other; only one of
+        them could ever be placed. Such candidates (closer than merge_distance,
+        from any track or layer) are clustered with a spatial hash and replaced by
+        their centroid, which also gives an even via pitch between dense tracks.
+
+        The representative excludes the traces of all members from the copper check
+        and carries every member's guard, so it still keeps clearance to each of them.
+        Its via spans all layers between the outermost layers of the members' spans.
+
+        Args:
+            candidates: list of StitchCandidate in priority order
+            merge_distance: candidates closer than this are merged (internal units)
+
+        Returns:
+            list of StitchCandidate, in the order of each cluster's first member
+        """
+        clusters = cluster_points([c.x for c in candidates], [c.y for c in candidates], merge_distance)
+
+        merged = []
+        for cluster in clusters:
+            first = candidates[cluster[0]]
+            if len(cluster) == 1:
+                merged.append(first)
+                continue
+
+            members = [candidates[i] for i in cluster]
+            rep_x = int(round(sum(c.x for c in members) / float(len(members))))
+            rep_y = int(round(sum(c.y for c in members) / float(len(members))))
+            exclude = []
+            guards = []
+            layers = 0
+            for member in members:
+                exclude.extend(member.exclude)
+                guards.extend(member.guards)
+                layers |= member.layers
+            layers = self.snapshot.span_mask(*self.snapshot.span_layers(layers))
+            merged.append(StitchCandidate(
+                rep_x, rep_y, max(c.diameter for c in members), max(c.clearance for c in members),
+                first.net, first.via_diameter, first.via_drill, first.via_net, layers,
+                exclude=tuple(exclude), guards=tuple(guards), check_guards=True,
+                priority=min(c.priority for c in members)))
+
+        return merged
+
+    def stitch_tracks(self, tracks_per_layer, stitch_distance, via_drill, via_diameter, slide_tolerance=0):
+        """Place stitching vias along tracks.
+
+        Candidates of all tracks and layers are generated, merged where they nearly
+        coincide, then validated and placed in order. A blocked candidate slides
+        to the nearest free position within slide_tolerance along its segment.
+
+        Args:
+            tracks_per_layer: dict mapping layer ID to list of tracks (each track is a
+                              list of track IDs), in top-to-bottom layer order
+            stitch_distance: distance between via placements in internal units
+            via_drill: via drill diameter in internal units
+            via_diameter: via diameter in internal units
+            slide_tolerance: how far a blocked candidate may slide in internal units, 0 for not at all
+
+        Returns:
+            tuple: (number of vias placed, number of vias skipped)
+        """
+        candidates = []
+        for layer, tracks in tracks_per_layer.items():
+            candidates.extend(self.track_candidates(tracks, layer, stitch_distance, via_drill, via_diameter,
+                                                    slide_tolerance))
+        candidates = self.merge_candidates(candidates, via_diameter + VIA_SAFETY_MARGIN)
+
+        return self.place_candidates(candidates, 'tracks')
+
+    def stitch_return_vias(self, signal_vias, radius, via_drill, via_diameter, count=2):
+        """Place via net vias next to signal vias where tracks change layers, for their return current.
+
+        Around every signal via the nearest free position within radius is
+        searched along RETURN_VIA_DIRECTIONS rays from its center: the stretches
+        of each ray blocked by copper and placed vias come from one index query
+        per constraint (see ConstraintPipeline.blocked_intervals), and the
+        nearest free points of all rays are checked with all constraints,
+        nearest first. A second via goes to the other side of the signal via.
+        Via net vias already within radius count towards count, and return vias
+        are only placed inside the via net's zones (if it has any).
+
+        With a deadline, signal vias of high-speed nets are done first.
+
+        Args:
+            signal_vias: snapshot via indexes of the signal vias
+            radius: maximum distance from a signal via to its return vias in internal units
+            via_drill: via drill diameter in internal units
+            via_diameter: via diameter in internal units
+            count: return vias per signal via, 1 or 2
+
+        Returns:
+            tuple: (number of vias placed, number of vias that found no free position)
+        """
+        snapshot = self.snapshot
+        vias = snapshot.vias
+        planes = snapshot.plane_outlines(self.via_net)
+
+        # Via net vias, existing, placed before and placed here, to count the ones near a signal via
+        near = SpatialIndex(INDEX_CELL_SIZE)
+        centers = []
+        for i in range(len(vias)):
+            if vias.net[i] == self.via_net:
+                near.insert(len(centers), vias.x[i], vias.y[i], vias.x[i], vias.y[i])
+                centers.append((vias.x[i], vias.y[i]))
+        for candidate in self.placed:
+            near.insert(len(centers), candidate.x, candidate.y, candidate.x, candidate.y)
+            centers.append((candidate.x, candidate.y))
+
+        if self.deadline is not None:
+            signal_vias = sorted(signal_vias, key=lambda i: not self.high_speed_net(vias.net[i]))
+        plan = self.plan.setdefault('return', [0, 0])
+        plan[1] += len(signal_vias)
+
+        directions = [(math.cos(2 * math.pi * k / RETURN_VIA_DIRECTIONS),
+                       math.sin(2 * math.pi * k / RETURN_VIA_DIRECTIONS)) for k in range(RETURN_VIA_DIRECTIONS)]
+
+        vias_placed = 0
+        vias_skipped = 0
+        for i in signal_vias:
+            if self.out_of_time():
+                break
+            plan[0] += 1
+            x, y = vias.x[i], vias.y[i]
+            missing = count - sum(1 for j in near.query_radius(x, y, radius)
+                                  if (centers[j][0] - x) ** 2 + (centers[j][1] - y) ** 2 <= radius * radius)
+            if missing <= 0:
+                continue
+
+            # Nearest free point of every free stretch of every ray
+            positions = []
+            for dx, dy in directions:
+                center = self.plane_candidate(x, y, via_drill, via_diameter)
+                center.slide = (dx, dy, 0, radius)
+                blocked = self.pipeline.blocked_intervals(center, dx, dy, 0, radius)
+                for s0, s1 in free_intervals(blocked, 0, radius):
+                    s0 += COORD_TOLERANCE if s0 > 0 else 0
+                    if 0 < s0 <= s1:
+                        positions.append((s0, center))
+            positions = deque(sorted(positions, key=lambda position: position[0]))
+
+            first = None  # direction of the first via placed here
+            while missing > 0 and positions:
+                s, center = positions.popleft()
+                dx, dy = center.slide[0], center.slide[1]
+                if first is not None and dx * first[0] + dy * first[1] > 0:
+                    continue  # Same side as the first one
+                candidate = center.moved(s)
+                if snapshot.outline is not None and not snapshot.outline.contains(candidate.x, candidate.y):
+                    continue
+                if planes and not any(plane.contains(candidate.x, candidate.y) for plane in planes):
+                    continue
+                if not self.pipeline.check(candidate):
+                    continue
+                self.place(candidate)
+                near.insert(len(centers), candidate.x, candidate.y, candidate.x, candidate.y)
+                centers.append((candidate.x, candidate.y))
+                missing -= 1
+                vias_placed += 1
+                if first is None:
+                    first = (dx, dy)
+                    # Nearest first, but about as near and more opposite the first via is better
+                    positions = deque(sorted(positions, key=lambda position: (
+                        int(position[0]) // RETURN_VIA_DISTANCE_STEP,
+                        position[1].slide[0] * dx + position[1].slide[1] * dy)))
+            vias_skipped += missing
+
+        return vias_placed, vias_skipped
+
+    def plane_candidate(self, x, y, via_drill, via_diameter, priority=0):
+        """A through via candidate on the via net, for stitching the planes (grid, coverage)."""
+        # Plane stitching uses same-net clearance (we're placing GND vias on GND planes)
+        # Use a minimum of 0.35mm for same-net clearance
+        same_net_clearance = max(self.snapshot.default_clearance, int(0.35e6))  # 0.35mm minimum
+
+        # Plane vias stitch all planes, so they are always through vias
+        return StitchCandidate(x, y, via_diameter + VIA_SAFETY_MARGIN, same_net_clearance,
+                               self.via_net, via_diameter, via_drill, self.via_net,
+                               self.snapshot.all_layers_mask(), priority=priority)
+
+    def grid_axes(self, grid_spacing):
+        """x and y coordinates of the grid columns and rows over the board outline.
+
+        Returns:
+            tuple: (list of x, list of y), both empty without an outline
+        """
+        outline = self.snapshot.outline
+        if outline is None or grid_spacing <= 0:
+            return [], []
+
+        xs = []
+        x = outline.left
+        while x <= outline.right:
+            xs.append(int(x))
+            x += grid_spacing
+        ys = []
+        y = outline.top
+        while y <= outline.bottom:
+            ys.append(int(y))
+            y += grid_spacing
+        return xs, ys
+
+    def grid_bands(self, grid_spacing, via_drill, via_diameter, memory_limit=0, level=None):
+        """Generate grid stitching candidates lazily, one band of grid rows at a time.
+
+        Only one band of grid candidates exists at a time: it is generated when
+        the previous one has been consumed. The band height follows from
+        memory_limit, so the grid candidates in memory stay below it whatever
+        the board size and grid spacing (at least one grid row per band).
+
+        memory_limit only bounds the grid candidates. The placed vias (placed,
+        placed_items and the placed-via index of the pipeline) are kept for the
+        whole run, since later candidates keep clearance to them and
+        verification checks them; the track candidates of a layer are built at
+        once (see stitch_tracks).
+
+        With plane_only, only grid points inside a zone of the via net are candidates.
+
+        Args:
+            grid_spacing: spacing between grid points in internal units
+            via_drill: via drill diameter in internal units
+            via_diameter: via diameter in internal units
+            memory_limit: bytes of candidates per band, 0 for one band with all rows
+            level: only grid points of this coarse-to-fine level, or None for all
+
+        Yields:
+            tuple: (list of StitchCandidate of the band row by row, number of grid
+            positions looked at for the band); the priority is the coarse-to-fine
+            level of the grid point
+        """
+        outline = self.snapshot.outline
+        xs, ys = self.grid_axes(grid_spacing)
+        if not xs or not ys:
+            return
+
+        planes = self.snapshot.plane_outlines(self.via_net) if self.plane_only else None
+
+        band_rows = len(ys)
+        if memory_limit > 0:
+            band_rows = max(1, int(memory_limit) // (CANDIDATE_BYTES * len(xs)))
+
+        for start in range(0, len(ys), band_rows):
+            band = []
+            positions = 0
+            for row in range(start, min(start + band_rows, len(ys))):
+                via_y = ys[row]
+                for col, via_x in enumerate(xs):
+                    priority = refinement_level(row, col)
+                    if level is not None and priority != level:
+                        continue
+                    positions += 1
+                    # Only positions within the board outline are candidates
+                    if outline.contains(via_x, via_y) and (
+                            planes is None or any(plane.contains(via_x, via_y) for plane in planes)):
+                        band.append(self.plane_candidate(via_x, via_y, via_drill, via_diameter, priority))
+            yield band, positions
+
+    def grid_candidates(self, grid_spacing, via_drill, via_diameter):
+        """All grid stitching candidates inside the board outline, row by row (see grid_bands)."""
+        return [candidate for band, _ in self.grid_bands(grid_spacing, via_drill, via_diameter)
+                for candidate in band]
+
+    def stitch_grid(self, grid_spacing, via_drill, via_diameter, memory_limit=0):
+        """Place stitching vias in a grid pattern across the board.
+
+        The grid is streamed through validation and placement band by band (see
+        grid_bands), each band released before the next is generated. The vias
+        are placed in the same order as with all candidates at once: row by row,
+        or with a deadline coarse-to-fine level by level, each level row by row.
+
+        The grid is counted in plan in grid positions, not candidates (positions
+        outside the board or the planes have none): every band adds its grid
+        positions as planned, and as processed in proportion to its candidates
+        processed. When the deadline stops the grid early, the grid positions of
+        the bands not generated yet are counted as planned too.
+
+        Args:
+            grid_spacing: spacing between grid points in internal units
+            via_drill: via drill diameter in internal units
+            via_diameter: via diameter in internal units
+            memory_limit: bytes of grid candidates per band, 0 for one band with all rows
+
+        Returns:
+            tuple: (number of vias placed, number of vias skipped)
+        """
+        plan = self.plan.setdefault('grid', [0, 0])
+        xs, ys = self.grid_axes(grid_spacing)
+        remaining = len(xs) * len(ys)  # Grid positions not looked at yet
+
+        levels = [None] if self.deadline is None else range(REFINEMENT_LEVELS)
+        vias_placed = 0
+        vias_skipped = 0
+        for level in levels:
+            for band, positions in self.grid_bands(grid_spacing, via_drill, via_diameter, memory_limit, level):
+                remaining -= positions
+                plan[1] += positions
+                band_plan = [0, len(band)]
+                placed, skipped = self.place_batch(band, band_plan)
+                if band_plan[0] == len(band):
+                    plan[0] += positions
+                else:
+                    plan[0] += positions * band_plan[0] // len(band)
+                vias_placed += placed
+                vias_skipped += skipped
+                if self.out_of_time():
+                    plan[1] += remaining
+                    return vias_placed, vias_skipped
+
+        return vias_placed, vias_skipped
+
+    def stitch_coverage(self, target_distance, via_drill, via_diameter):
+        """Fill in stitching vias only where the planes are far from any via-net via.
+
+        Existing vias on the via net and the vias placed so far in this run are
+        rasterized into a CoverageField over the via net's zones. Positions farther
+        than target_distance from every via are tried row by row; each placed via
+        updates the field, so the positions it covers are not tried anymore.
+
+        Args:
+            target_distance: maximum distance from any plane point to a via in internal units
+            via_drill: via drill diameter in internal units
+            via_diameter: via diameter in internal units
+
+        Returns:
+            tuple: (number of vias placed, number of positions skipped,
+                    coverage before, coverage after) - coverage is the fraction of
+                    the plane area within target_distance of a via
+        """
+        snapshot = self.snapshot
+        if snapshot.outline is None or target_distance <= 0:
+            return 0, 0, 1.0, 1.0
+
+        field = CoverageField(snapshot.outline, snapshot.plane_outlines(self.via_net), target_distance)
+        vias = snapshot.vias
+        for i in range(len(vias)):
+            if vias.net[i] == self.via_net:
+                field.add_via(vias.x[i], vias.y[i])
+        for candidate in self.placed:
+            field.add_via(candidate.x, candidate.y)
+        coverage_before = field.coverage()
+
+        vias_placed = 0
+        vias_skipped = 0
+        positions = field.uncovered_positions()
+        plan = self.plan.setdefault('coverage', [0, 0])
+        plan[1] += len(positions)
+        for x, y in positions:
+            if self.out_of_time():
+                break
+            plan[0] += 1
+            if field.is_covered(x, y):
+                continue  # Covered by a via placed since
+            candidate = self.plane_candidate(x, y, via_drill, via_diameter)
+            if not self.pipeline.check(candidate):
+                vias_skipped += 1
+                continue
+            self.place(candidate)
+            field.add_via(x, y)
+            vias_placed += 1
+
+        return vias_placed, vias_skipped, coverage_before, field.coverage()
+
+    def place_candidates(self, candidates, stage):
+        """Validate candidates and place a via for each one that passes.
+
+        With a deadline, candidates are taken in priority order (see place_batch).
+
+        Args:
+            candidates: list of StitchCandidate
+            stage: name the candidates are counted under in plan
+
+        Returns:
+            tuple: (number of vias placed, number of vias skipped)
+        """
+        if self.deadline is not None:
+            candidates = sorted(candidates, key=lambda c: c.priority)
+        plan = self.plan.setdefault(stage, [0, 0])
+        plan[1] += len(candidates)
+        return self.place_batch(candidates, plan)
+
+    def place_batch(self, candidates, plan):
+        """Validate candidates in order and place a via for each one that passes.
+
+        Candidates are processed in chunks: the static constraints are checked for
+        a whole chunk first, the dynamic ones (vias placed during this run) right
+        before placement. A rejected candidate that may slide is placed at the
+        nearest free position along its line instead, if there is one (see
+        slide). With a deadline, processing stops between two candidates once
+        the deadline has passed.
+
+        Args:
+            candidates: list of StitchCandidate
+            plan: [candidates processed, candidates planned] to count processed candidates in
+
+        Returns:
+            tuple: (number of vias placed, number of vias skipped)
+        """
+        vias_placed = 0
+        vias_skipped = 0
+
+        for start in range(0, len(candidates), PLACEMENT_CHUNK):
+            if self.out_of_time():
+                break
+            chunk = candidates[start:start + PLACEMENT_CHUNK]
+            passed = self.pipeline.check_static_batch(chunk)
+            for candidate, ok in zip(chunk, passed):
+                if self.out_of_time():
+                    return vias_placed, vias_skipped
+                plan[0] += 1
+                if not ok or not self.pipeline.check(candidate, dynamic=True):
+                    candidate = self.slide(candidate) if candidate.slide is not None else None
+                    if candidate is None:
+                        vias_skipped += 1
+                        continue
+                    self.slid += 1
+
+                self.place(candidate)
+                vias_placed += 1
+
+        return vias_placed, vias_skipped
+
+    def slide(self, candidate):
+        """The nearest position a blocked candidate can slide to.
+
+        The intervals blocked by the copper are computed once per stitched
+        segment and line (see segment_intervals), the ones blocked by the vias
+        placed so far for the slide window (one index query, see
+        ConstraintPipeline.blocked_intervals). The free positions closest to the
+        original one are then checked with all constraints, nearest first.
+
+        The original position may lie in a free interval when a constraint
+        without intervals (board edge, courtyard, keepout) rejected it: that
+        interval is split there, and each part is tried half a via away from it.
+
+        Returns:
+            moved StitchCandidate that passed all constraints, or None
+        """
+        dx, dy, low, high = candidate.slide
+        blocked = self.segment_intervals(candidate)
+        blocked.extend(self.pipeline.blocked_intervals(candidate, dx, dy, low, high, dynamic=True))
+
+        # Closest point of every free interval, kept off the interval ends so
+        # rounding to integer coordinates doesn't land inside an obstacle
+        step = max(candidate.via_diameter // 2, COORD_TOLERANCE)
+        positions = []
+        for s0, s1 in free_intervals(blocked, low, high):
+            s0 += COORD_TOLERANCE if s0 > low else 0
+            s1 -= COORD_TOLERANCE if s1 < high else 0
+            if s0 > s1:
+                continue
+            if s0 <= 0 <= s1:
+                # The original position (s = 0) has already failed
+                if s1 > 0:
+                    positions.append(min(step, s1))
+                if s0 < 0:
+                    positions.append(max(-step, s0))
+            else:
+                positions.append(s0 if s0 > 0 else s1)
+        positions.sort(key=abs)
+
+        for s in positions[:SLIDE_TRIES]:
+            moved = candidate.moved(s)
+            if self.pipeline.check(moved):
+                return moved
+        return None
+
+    def segment_intervals(self, candidate):
+        """Intervals along the slide line where the static constraints block the candidate.
+
+        Track stitching candidates slide along a line parallel to the segment
+        they stitch (candidate.exclude). The intervals are computed once for the
+        whole segment and shared by all candidates of the same segment, side
+        and via (cached in line coordinates), then shifted to the candidate.
+        Other candidates get the intervals of their own slide window.
+
+        Returns:
+            list of (s0, s1) relative to the candidate's position
+        """
+        dx, dy, low, high = candidate.slide
+        if len(candidate.exclude) != 1:
+            return self.pipeline.blocked_intervals(candidate, dx, dy, low, high, dynamic=False)
+
+        track = candidate.exclude[0]
+        t0 = dx * candidate.x + dy * candidate.y  # Position along the line
+        key = (track, candidate.net, candidate.layers, candidate.diameter, candidate.clearance,
+               round(dx, 9), round(dy, 9), int(round(dx * candidate.y - dy * candidate.x)))
+        cached = self._segment_intervals.get(key)
+        if cached is None:
+            tracks = self.snapshot.tracks
+            ta = dx * tracks.x0[track] + dy * tracks.y0[track] - t0
+            tb = dx * tracks.x1[track] + dy * tracks.y1[track] - t0
+            intervals = self.pipeline.blocked_intervals(candidate, dx, dy, min(ta, tb, low), max(ta, tb, high),
+                                                        dynamic=False)
+            cached = [(s0 + t0, s1 + t0) for s0, s1 in intervals]
+            self._segment_intervals[key] = cached
+        return [(s0 - t0, s1 - t0) for s0, s1 in cached]
+
+    def place(self, candidate):
+        """Place a via at a candidate that passed all constraints."""
+        item = None
+        if self.add_via is not None:
+            layer_top, layer_bottom = self.snapshot.span_layers(candidate.layers)
+            item = self.add_via(candidate.x, candidate.y, candidate.via_drill, candidate.via_diameter,
+                                layer_top, layer_bottom)
+        self.placed.append(candidate)
+        self.placed_items.append(item)
+
+        # Future candidates have to keep clearance to this via
+        self.pipeline.via_placed(candidate)
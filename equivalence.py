@@ -0,0 +1,463 @@
+"""
+Equivalence check: the optimized placement path against a scalar reference.
+
+The placement is fast because of what it does not look at: obstacles come
+from spatial indexes, static constraints run batched (some vectorized, like
+the board edge check), grid candidates are streamed in bands and sliding uses
+blocked intervals along a line. None of that may change which vias are placed.
+This module runs a stitching twice on the same snapshot:
+- optimized: the pipeline and settings as a normal run uses them
+- reference: every index replaced by an exhaustive one (every query returns
+  every obstacle), every static constraint run on one candidate at a time with
+  its scalar check, all grid candidates in one band, and the positions along
+  tracks sampled by the pure Python sampler instead of the NumPy pass
+and compares the via sets within a tolerance. For every via only one run
+placed, it lists the constraints of the other run that reject it; for every
+via of either run, it lists the static constraints whose optimized and scalar
+checks disagree on it; every position the two samplers put apart is counted.
+
+Not cross-checked: both runs share the candidate generation (grid positions,
+track paths and offsets), the merging of close candidates and the sliding
+along a track. A bug in those is made in both runs alike and goes unnoticed.
+
+The reference is slow by design (every check scans all obstacles): use it on
+synthetic boards (see synthetic_snapshot) and on real boards of moderate size.
+Nothing in here needs pcbnew; real boards are read from their snapshot cache
+files (board.kicad_pcb.vscache, written by the batch mode and sweep):
+
+    python -m via_stitching_plugin.equivalence --synthetic 10 boards/*.vscache --preset fab.json
+"""
+import argparse
+import glob
+import random
+import sys
+import time
+
+from . import engine
+from .constraints import INDEX_CELL_SIZE, ConstraintPipeline, default_constraints
+from .geometry import (PadShape, PolygonIndex, SpatialIndex, sample_offset_positions,
+                       sample_offset_positions_python)
+from .metadata import BoardMetadata
+from .snapshot import TRACK_ARC, TRACK_LINE, BoardSnapshot
+from .snapshot_cache import load_snapshot
+from .stitching import DEFAULT_SETTINGS, check_settings, load_preset, run_stitching
+from .sweep import SnapshotBackend
+
+# Default distance within which two vias are the same via
+DEFAULT_TOLERANCE = 1000  # nanometers (1 micron)
+
+# Distance within which the NumPy and Python samplers give the same position
+SAMPLING_TOLERANCE = 1  # nanometers (rounding)
+
+# Settings both runs need to be comparable: no deadline, no changes to the board
+COMPARED_SETTINGS = {'time_budget': 0.0, 'remove_existing_vias': False, 'refill_zones': False,
+                     'verify': False, 'remove_violations': False}
+
+
+class ExhaustiveIndex(SpatialIndex):
+    """Stand-in for a SpatialIndex whose queries return every item."""
+
+    def __init__(self, items=()):
+        SpatialIndex.__init__(self, INDEX_CELL_SIZE)
+        self.items = set(items)
+
+    def insert(self, item, left, top, right, bottom):
+        self.items.add(item)
+
+    def query(self, left, top, right, bottom):
+        return set(self.items)
+
+
+def exhaustive_constraints(snapshot):
+    """The default constraints, with every spatial index replaced by an ExhaustiveIndex."""
+    constraints = default_constraints(snapshot)
+    for constraint in constraints:
+        for name, value in list(vars(constraint).items()):
+            if isinstance(value, SpatialIndex):
+                items = set()
+                for cell_items in value.cells.values():
+                    items.update(cell_items)
+                setattr(constraint, name, ExhaustiveIndex(items))
+    return constraints
+
+
+class RecordingPipeline(ConstraintPipeline):
+    """ConstraintPipeline that keeps the candidate of every via placed."""
+
+    def __init__(self, constraints=()):
+        ConstraintPipeline.__init__(self, constraints)
+        self.placed = []
+
+    def via_placed(self, candidate):
+        self.placed.append(candidate)
+        ConstraintPipeline.via_placed(self, candidate)
+
+    def static_check(self, constraint, candidate):
+        """A static constraint's verdict on a candidate, the way this pipeline runs it."""
+        return constraint.check_batch([candidate])[0]
+
+    def rejected_by(self, candidate):
+        """Names of the constraints that reject a candidate, with the vias placed so far."""
+        names = []
+        for constraint in self.constraints:
+            if constraint.dynamic:
+                ok = constraint.check(candidate)
+            else:
+                ok = self.static_check(constraint, candidate)
+            if not ok:
+                names.append(constraint.name)
+        return names
+
+
+class ReferencePipeline(RecordingPipeline):
+    """RecordingPipeline that runs the static constraints one candidate at a time, scalar."""
+
+    def check_static_batch(self, candidates):
+        return [self.check(candidate, dynamic=False) for candidate in candidates]
+
+    def static_check(self, constraint, candidate):
+        return constraint.check(candidate)
+
+
+class MissingVia:
+    """A via only one of the two runs placed.
+
+    Attributes:
+        x, y: via center in internal units
+        net: net code of the via
+        rejected_by: names of the constraints of the other run that reject it
+                     (empty: the other run never got to try it there, e.g. an
+                     earlier difference changed the candidates or their order)
+    """
+    __slots__ = ('x', 'y', 'net', 'rejected_by')
+
+    def __init__(self, x, y, net, rejected_by):
+        self.x = x
+        self.y = y
+        self.net = net
+        self.rejected_by = rejected_by
+
+
+class Disagreement:
+    """A static constraint whose optimized and scalar checks disagree on a via position.
+
+    Attributes:
+        constraint: constraint name
+        x, y: via center in internal units
+        optimized, reference: verdict (True = passes) of each implementation
+    """
+    __slots__ = ('constraint', 'x', 'y', 'optimized', 'reference')
+
+    def __init__(self, constraint, x, y, optimized, reference):
+        self.constraint = constraint
+        self.x = x
+        self.y = y
+        self.optimized = optimized
+        self.reference = reference
+
+
+class EquivalenceReport:
+    """Result of an equivalence check.
+
+    Attributes:
+        name: board name
+        optimized, reference: number of vias each run placed
+        matched: vias placed by both (same net, size and layers, within the tolerance)
+        only_optimized, only_reference: list of MissingVia
+        disagreements: list of Disagreement
+        sampling_differences: number of positions along tracks the NumPy and
+                              the Python sampler put more than SAMPLING_TOLERANCE apart
+        seconds: dict mapping run ('optimized', 'reference') to seconds
+    """
+
+    # Vias and disagreements listed by position in the messages
+    MAX_LISTED = 10
+
+    def __init__(self, name=''):
+        self.name = name
+        self.optimized = 0
+        self.reference = 0
+        self.matched = 0
+        self.only_optimized = []
+        self.only_reference = []
+        self.disagreements = []
+        self.sampling_differences = 0
+        self.seconds = {}
+
+    @property
+    def equivalent(self):
+        return not (self.only_optimized or self.only_reference or self.disagreements or
+                    self.sampling_differences)
+
+    def messages(self):
+        """Lines for the summary shown to the user."""
+        messages = ["%s: %s, %d vias optimized (%.1f s), %d reference (%.1f s), %d matched" % (
+            self.name, 'equivalent' if self.equivalent else 'DIFFERENT', self.optimized,
+            self.seconds.get('optimized', 0.0), self.reference, self.seconds.get('reference', 0.0), self.matched)]
+        for label, missing in (('only optimized', self.only_optimized), ('only reference', self.only_reference)):
+            if missing:
+                messages.append("  %d vias %s:" % (len(missing), label))
+                for via in missing[:self.MAX_LISTED]:
+                    messages.append("    (%.3f, %.3f) mm: rejected by %s in the other run" % (
+                        via.x / 1e6, via.y / 1e6, ", ".join(via.rejected_by) or "nothing"))
+                if len(missing) > self.MAX_LISTED:
+                    messages.append("    ...")
+        if self.disagreements:
+            messages.append("  %d constraint disagreements:" % len(self.disagreements))
+            for d in self.disagreements[:self.MAX_LISTED]:
+                messages.append("    (%.3f, %.3f) mm: %s %s optimized, %s reference" % (
+                    d.x / 1e6, d.y / 1e6, d.constraint, 'passes' if d.optimized else 'rejects',
+                    'passes' if d.reference else 'rejects'))
+            if len(self.disagreements) > self.MAX_LISTED:
+                messages.append("    ...")
+        if self.sampling_differences:
+            messages.append("  %d positions along tracks differ between the NumPy and the Python sampler" %
+                            self.sampling_differences)
+        return messages
+
+
+class ReferenceSampler:
+    """Stand-in for engine.sample_offset_positions during the reference run.
+
+    Returns the positions of the pure Python sampler and counts the positions
+    the NumPy sampler (what the optimized run uses) puts elsewhere.
+    """
+
+    def __init__(self):
+        self.differences = 0
+
+    def __call__(self, paths, pitch, offsets, min_length=1):
+        expected = sample_offset_positions_python(paths, pitch, offsets, min_length)
+        sampled = sample_offset_positions(paths, pitch, offsets, min_length)
+        if len(sampled[0]) != len(expected[0]):
+            self.differences += abs(len(sampled[0]) - len(expected[0]))
+        for x, y, ex, ey in zip(sampled[0], sampled[1], expected[0], expected[1]):
+            if abs(x - ex) > SAMPLING_TOLERANCE or abs(y - ey) > SAMPLING_TOLERANCE:
+                self.differences += 1
+        return expected
+
+
+def same_via(a, b, tolerance):
+    """True if two placed candidates are the same via within tolerance."""
+    return (a.via_net == b.via_net and a.via_drill == b.via_drill and a.via_diameter == b.via_diameter and
+            a.layers == b.layers and abs(a.x - b.x) <= tolerance and abs(a.y - b.y) <= tolerance)
+
+
+def match_vias(optimized, reference, tolerance=DEFAULT_TOLERANCE):
+    """Pair the vias of two runs, each with the nearest unpaired same via of the other.
+
+    Args:
+        optimized, reference: lists of placed StitchCandidate
+
+    Returns:
+        tuple: (number of pairs, unpaired optimized candidates, unpaired reference candidates)
+    """
+    index = SpatialIndex(INDEX_CELL_SIZE)
+    for i, candidate in enumerate(reference):
+        index.insert(i, candidate.x, candidate.y, candidate.x, candidate.y)
+
+    paired = set()
+    unpaired = []
+    for candidate in optimized:
+        best = None
+        best_distance = None
+        for i in index.query_radius(candidate.x, candidate.y, tolerance):
+            other = reference[i]
+            if i in paired or not same_via(candidate, other, tolerance):
+                continue
+            distance = (candidate.x - other.x) ** 2 + (candidate.y - other.y) ** 2
+            if best is None or distance < best_distance or (distance == best_distance and i < best):
+                best = i
+                best_distance = distance
+        if best is None:
+            unpaired.append(candidate)
+        else:
+            paired.add(best)
+    return len(paired), unpaired, [candidate for i, candidate in enumerate(reference) if i not in paired]
+
+
+def check_equivalence(snapshot, settings=None, tolerance=DEFAULT_TOLERANCE, metadata=None, name=''):
+    """Stitch a snapshot with the optimized and the reference path and compare the vias.
+
+    Args:
+        snapshot: BoardSnapshot
+        settings: settings dict (see stitching.DEFAULT_SETTINGS), DEFAULT_SETTINGS
+                  if None; COMPARED_SETTINGS are applied to both runs
+        tolerance: distance in internal units within which two vias are the same
+        metadata: BoardMetadata, from the snapshot if None
+        name: board name for the report
+
+    Returns:
+        EquivalenceReport
+
+    Raises:
+        ValueError: invalid settings, or a reference net is not on the board
+    """
+    settings = dict(settings if settings is not None else DEFAULT_SETTINGS)
+    settings.update(COMPARED_SETTINGS)
+    check_settings(settings)
+    if metadata is None:
+        metadata = BoardMetadata.from_snapshot(snapshot)
+    report = EquivalenceReport(name)
+
+    runs = [('optimized', RecordingPipeline(default_constraints(snapshot)), settings),
+            ('reference', ReferencePipeline(exhaustive_constraints(snapshot)), dict(settings, memory_limit=0.0))]
+    sampler = ReferenceSampler()
+    for run, pipeline, run_settings in runs:
+        t0 = time.perf_counter()
+        if run == 'reference':
+            # The engine module is shared with everything else in the process; put it back
+            engine_sampler = engine.sample_offset_positions
+            engine.sample_offset_positions = sampler
+            try:
+                run_stitching(SnapshotBackend(snapshot, metadata), run_settings, pipeline=pipeline)
+            finally:
+                engine.sample_offset_positions = engine_sampler
+        else:
+            run_stitching(SnapshotBackend(snapshot, metadata), run_settings, pipeline=pipeline)
+        report.seconds[run] = time.perf_counter() - t0
+    report.sampling_differences = sampler.differences
+    optimized = runs[0][1]
+    reference = runs[1][1]
+
+    report.optimized = len(optimized.placed)
+    report.reference = len(reference.placed)
+    report.matched, only_optimized, only_reference = match_vias(optimized.placed, reference.placed, tolerance)
+    report.only_optimized = [MissingVia(c.x, c.y, c.via_net, reference.rejected_by(c)) for c in only_optimized]
+    report.only_reference = [MissingVia(c.x, c.y, c.via_net, optimized.rejected_by(c)) for c in only_reference]
+
+    # Both implementations of every static constraint, on every via either run placed;
+    # both pipelines hold the same constraints in the same order
+    pairs = [(a, b) for a, b in zip(optimized.constraints, reference.constraints) if not a.dynamic]
+    for candidate in optimized.placed + only_reference:
+        for ours, theirs in pairs:
+            ok = optimized.static_check(ours, candidate)
+            expected = reference.static_check(theirs, candidate)
+            if ok != expected:
+                report.disagreements.append(Disagreement(ours.name, candidate.x, candidate.y, ok, expected))
+    return report
+
+
+def synthetic_snapshot(seed=0, width=60.0, height=40.0, signals=30):
+    """A random 4 layer board with GND planes, routing, pads, courtyards and a keepout.
+
+    Args:
+        seed: random seed; the same seed gives the same board
+        width, height: board size in mm
+        signals: number of signal routes (track chains, some changing layers through a via)
+
+    Returns:
+        BoardSnapshot
+    """
+    mm = 1000000
+    rng = random.Random(seed)
+    snapshot = BoardSnapshot()
+    snapshot.copper_layers = [0, 4, 6, 2]
+    snapshot.layer_names = {0: 'F.Cu', 4: 'In1.Cu', 6: 'In2.Cu', 2: 'B.Cu'}
+    snapshot.nets = {1: 'GND'}
+    width = int(width * mm)
+    height = int(height * mm)
+    snapshot.outline = PolygonIndex.from_rect(0, 0, width, height)
+    # GND planes on the inner layers
+    snapshot.zones.append(1, 0b0110, PolygonIndex.from_rect(0, 0, width, height))
+
+    def point(margin=3 * mm):
+        return rng.randint(margin, width - margin), rng.randint(margin, height - margin)
+
+    for n in range(signals):
+        net = n + 2
+        snapshot.nets[net] = ('CLK%d' if n % 5 == 0 else 'SIG%d') % n
+        track_width = rng.choice((150000, 200000, 250000))
+        layer = rng.choice((0, 2))
+        x, y = point()
+        for _ in range(rng.randint(1, 4)):
+            if rng.random() < 0.3:
+                # Layer change through a signal via
+                snapshot.vias.append(x, y, 600000, 300000, net, 0, 2)
+                layer = 2 if layer == 0 else 0
+            nx, ny = point()
+            if rng.random() < 0.5:
+                nx = x  # Manhattan routing: vertical then horizontal
+            if rng.random() < 0.15:
+                # Arc through a mid point off the chord
+                mx = (x + nx) // 2 + (ny - y) // 4
+                my = (y + ny) // 2 - (nx - x) // 4
+                snapshot.tracks.append(TRACK_ARC, x, y, nx, ny, mx, my, track_width, layer, net, 200000)
+            else:
+                snapshot.tracks.append(TRACK_LINE, x, y, nx, ny, 0, 0, track_width, layer, net, 200000)
+            x, y = nx, ny
+
+    # Existing GND vias and footprints with pads and courtyards
+    for _ in range(signals // 3):
+        x, y = point()
+        snapshot.vias.append(x, y, 600000, 300000, 1, 0, 2)
+    shapes = [PadShape(400000, 300000), PadShape(500000, 250000, 125000, 45.0), PadShape(300000, 300000, 300000)]
+    snapshot.pad_shapes = shapes
+    for _ in range(signals // 5 + 1):
+        x, y = point(6 * mm)
+        side = rng.choice((0, 2))
+        mask = snapshot.layer_mask([side])
+        for k in range(4):
+            net = rng.choice(list(snapshot.nets))
+            snapshot.pads.append(x - 1500000 + k * 1000000, y, rng.randrange(len(shapes)), net, mask, 0, 50000)
+        snapshot.courtyards.append((mask, PolygonIndex.from_rect(x - 2500000, y - 1000000, x + 2500000, y + 1000000),
+                                    True))
+
+    # A via keepout on all layers
+    x, y = point(8 * mm)
+    snapshot.keepouts.append((snapshot.all_layers_mask(), PolygonIndex.from_rect(x - 3 * mm, y - 2 * mm, x, y)))
+    return snapshot
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m via_stitching_plugin.equivalence',
+                                     description="Check that the optimized via placement places the same vias "
+                                                 "as the scalar reference, on synthetic boards and snapshot "
+                                                 "cache files.")
+    parser.add_argument('caches', nargs='*', help="snapshot cache files (.vscache) or glob patterns")
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N', help="also check N synthetic boards")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the first synthetic board")
+    parser.add_argument('--preset', help="JSON file with stitching settings (defaults: the dialog defaults)")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE / 1e6,
+                        help="distance in mm within which two vias are the same (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    try:
+        settings = load_preset(args.preset) if args.preset else dict(DEFAULT_SETTINGS)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    tolerance = int(args.tolerance * 1e6)
+
+    boards = [('synthetic %d' % seed, lambda seed=seed: synthetic_snapshot(seed))
+              for seed in range(args.seed, args.seed + args.synthetic)]
+    for pattern in args.caches:
+        for path in sorted(glob.glob(pattern)) or [pattern]:
+            boards.append((path, lambda path=path: load_snapshot(path, None)))
+    if not boards:
+        parser.error("nothing to check, give cache files or --synthetic N")
+
+    failed = 0
+    for name, load in boards:
+        snapshot = load()
+        if snapshot is None:
+            print("%s: not a snapshot cache file" % name)
+            failed += 1
+            continue
+        try:
+            report = check_equivalence(snapshot, settings, tolerance, name=name)
+        except ValueError as e:
+            print("%s: %s" % (name, e))
+            failed += 1
+            continue
+        print("\n".join(report.messages()))
+        sys.stdout.flush()
+        if not report.equivalent:
+            failed += 1
+
+    print()
+    print("%d boards, %d not equivalent" % (len(boards), failed))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,769 @@
+"""
+Plain geometry helpers used by the via stitching plugin.
+
+Everything in this module works on integer coordinates in KiCad internal units
+(nanometers) and does not need pcbnew, so it can be used and inspected outside KiCad.
+"""
+import math
+
+try:
+    import numpy as np
+except Exception:
+    # NumPy is optional, the pure Python code paths are used without it
+    np = None
+
+
+class PolygonIndex:
+    """Polygon set (outlines and holes) with edge indexes for fast exact queries.
+
+    All rings are treated with the even-odd rule, so board outlines, cutouts, slots
+    and several separate outlines are handled the same way.
+
+    Two indexes are built once:
+    - horizontal bands holding the non-horizontal edges, used by the ray crossing
+      point-in-polygon test (only the edges in the point's band are looked at)
+    - a uniform grid of edge bounding boxes, built per clearance (see
+      clearance_region), used for nearest-edge distance checks
+    """
+
+    def __init__(self, rings):
+        """
+        Args:
+            rings: list of rings, each a list of (x, y) points in internal units.
+                   Rings may be open or closed (first point repeated at the end).
+        """
+        self.rings = []
+        self.edges = []
+
+        for ring in rings:
+            points = [(int(p[0]), int(p[1])) for p in ring]
+            if len(points) > 1 and points[0] == points[-1]:
+                points = points[:-1]
+            if len(points) < 3:
+                continue
+            self.rings.append(points)
+            for i in range(len(points)):
+                x0, y0 = points[i]
+                x1, y1 = points[(i + 1) % len(points)]
+                if (x0, y0) != (x1, y1):
+                    self.edges.append((x0, y0, x1, y1))
+
+        if self.edges:
+            xs = [e[0] for e in self.edges]
+            ys = [e[1] for e in self.edges]
+            self.left, self.right = min(xs), max(xs)
+            self.top, self.bottom = min(ys), max(ys)
+        else:
+            self.left = self.right = self.top = self.bottom = 0
+
+        # Band index for the crossing test: roughly sqrt(n) bands keeps both the
+        # number of bands and the number of edges per band small
+        self.band_count = max(1, int(math.sqrt(len(self.edges))))
+        self.band_height = max(1, (self.bottom - self.top) // self.band_count + 1)
+        self.bands = [[] for _ in range(self.band_count)]
+        for edge in self.edges:
+            x0, y0, x1, y1 = edge
+            if y0 == y1:
+                continue  # Horizontal edges never cross a horizontal ray
+            first = self._band_of(min(y0, y1))
+            last = self._band_of(max(y0, y1))
+            for band in range(first, last + 1):
+                self.bands[band].append(edge)
+
+        self._regions = {}
+        self._band_arrays = {}
+
+    @classmethod
+    def from_rect(cls, left, top, right, bottom):
+        """Build a polygon index for an axis aligned rectangle."""
+        return cls([[(left, top), (right, top), (right, bottom), (left, bottom)]])
+
+    def _band_of(self, y):
+        band = (y - self.top) // self.band_height
+        return min(max(band, 0), self.band_count - 1)
+
+    def contains(self, x, y):
+        """Exact even-odd point-in-polygon test."""
+        if not self.edges or x < self.left or x > self.right or y < self.top or y > self.bottom:
+            return False
+
+        inside = False
+        for x0, y0, x1, y1 in self.bands[self._band_of(y)]:
+            if (y0 > y) != (y1 > y):
+                # Is x left of where the edge crosses the horizontal line through y?
+                # Cross-multiplied so the test stays exact in integer arithmetic.
+                den = y1 - y0
+                num = (y - y0) * (x1 - x0)
+                if (den > 0 and (x - x0) * den < num) or (den < 0 and (x - x0) * den > num):
+                    inside = not inside
+        return inside
+
+    def contains_many(self, xs, ys):
+        """Vectorized contains() for many points.
+
+        Args:
+            xs, ys: sequences of point coordinates in internal units
+
+        Returns:
+            list of bools, one per point
+        """
+        if np is None:
+            return [self.contains(x, y) for x, y in zip(xs, ys)]
+
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        inside = np.zeros(len(xs), dtype=bool)
+        if not self.edges or not len(xs):
+            return inside.tolist()
+
+        in_bbox = (xs >= self.left) & (xs <= self.right) & (ys >= self.top) & (ys <= self.bottom)
+        bands = np.clip((ys - self.top) // self.band_height, 0, self.band_count - 1)
+
+        # One broadcast crossing test per band: points in the band x edges in the band
+        for band in np.unique(bands[in_bbox]):
+            edges = self._band_array(band)
+            if not len(edges):
+                continue
+            sel = np.nonzero(in_bbox & (bands == band))[0]
+            px = xs[sel][:, None]
+            py = ys[sel][:, None]
+            x0, y0, x1, y1 = edges[:, 0], edges[:, 1], edges[:, 2], edges[:, 3]
+            den = y1 - y0
+            lhs = (px - x0) * den
+            rhs = (py - y0) * (x1 - x0)
+            hits = ((y0 > py) != (y1 > py)) & (((den > 0) & (lhs < rhs)) | ((den < 0) & (lhs > rhs)))
+            inside[sel] = (hits.sum(axis=1) % 2) == 1
+
+        return inside.tolist()
+
+    def _band_array(self, band):
+        """Edges of one band as an (n, 4) int64 array (cached)."""
+        arr = self._band_arrays.get(band)
+        if arr is None:
+            arr = np.array(self.bands[band], dtype=np.int64).reshape(-1, 4)
+            self._band_arrays[band] = arr
+        return arr
+
+    def clearance_region(self, inset):
+        """Get the region of this polygon deflated by inset (memoized per inset).
+
+        Args:
+            inset: distance to keep from every edge in internal units
+
+        Returns:
+            ClearanceRegion
+        """
+        inset = int(inset)
+        region = self._regions.get(inset)
+        if region is None:
+            region = ClearanceRegion(self, inset)
+            self._regions[inset] = region
+        return region
+
+
+class ClearanceRegion:
+    """A PolygonIndex deflated by a fixed distance.
+
+    A point is inside the region when it is inside the polygon and at least
+    `inset` away from every edge. This is exactly the polygon eroded by a disc of
+    radius `inset` (round corners), without having to build the offset polygon.
+    """
+
+    # Upper bound for the number of grid cells along one axis
+    MAX_CELLS_PER_AXIS = 512
+
+    def __init__(self, polygon, inset):
+        self.polygon = polygon
+        self.inset = inset
+        self.inset_sq = inset * inset
+
+        width = max(1, polygon.right - polygon.left)
+        height = max(1, polygon.bottom - polygon.top)
+        self.cell = max(inset, width // self.MAX_CELLS_PER_AXIS + 1, height // self.MAX_CELLS_PER_AXIS + 1, 1)
+
+        # Register every edge in every cell its bounding box touches
+        self.cells = {}
+        for edge in polygon.edges:
+            x0, y0, x1, y1 = edge
+            for cx in range(self._cell_of(min(x0, x1), polygon.left), self._cell_of(max(x0, x1), polygon.left) + 1):
+                for cy in range(self._cell_of(min(y0, y1), polygon.top), self._cell_of(max(y0, y1), polygon.top) + 1):
+                    self.cells.setdefault((cx, cy), []).append(edge)
+
+        self._neighbourhoods = {}
+
+    def _cell_of(self, value, origin):
+        return (value - origin) // self.cell
+
+    def edge_too_close(self, x, y):
+        """Check whether any polygon edge is closer than the inset to (x, y)."""
+        left = self.polygon.left
+        top = self.polygon.top
+        seen = set()
+        for cx in range(self._cell_of(x - self.inset, left), self._cell_of(x + self.inset, left) + 1):
+            for cy in range(self._cell_of(y - self.inset, top), self._cell_of(y + self.inset, top) + 1):
+                for edge in self.cells.get((cx, cy), ()):
+                    if edge in seen:
+                        continue
+                    seen.add(edge)
+                    if point_to_segment_distance_sq(x, y, *edge) < self.inset_sq:
+                        return True
+        return False
+
+    def contains(self, x, y):
+        """Check whether (x, y) is inside the polygon and at least inset from its edges."""
+        return self.polygon.contains(x, y) and not self.edge_too_close(x, y)
+
+    def contains_many(self, xs, ys):
+        """Vectorized contains() for many points.
+
+        Args:
+            xs, ys: sequences of point coordinates in internal units
+
+        Returns:
+            list of bools, one per point
+        """
+        if np is None:
+            return [self.contains(x, y) for x, y in zip(xs, ys)]
+
+        result = np.array(self.polygon.contains_many(xs, ys), dtype=bool)
+        if not result.any():
+            return result.tolist()
+
+        xs = np.asarray(xs, dtype=np.int64)
+        ys = np.asarray(ys, dtype=np.int64)
+        cell_x = (xs - self.polygon.left) // self.cell
+        cell_y = (ys - self.polygon.top) // self.cell
+
+        # Points in the same cell share the same neighbourhood of candidate edges
+        # (cell >= inset, so the 3x3 block around the cell covers the whole inset)
+        inside_idx = np.nonzero(result)[0]
+        keys = cell_x[inside_idx] * (1 << 32) + cell_y[inside_idx]
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        boundaries = np.nonzero(np.diff(sorted_keys))[0] + 1
+        for group in np.split(inside_idx[order], boundaries):
+            cx = int(cell_x[group[0]])
+            cy = int(cell_y[group[0]])
+            edges = self._neighbourhood_array(cx, cy)
+            if not len(edges):
+                continue
+            px = xs[group][:, None].astype(np.float64)
+            py = ys[group][:, None].astype(np.float64)
+            x0, y0 = edges[:, 0], edges[:, 1]
+            sx = edges[:, 2] - x0
+            sy = edges[:, 3] - y0
+            dx = px - x0
+            dy = py - y0
+            t = np.clip((dx * sx + dy * sy) / (sx * sx + sy * sy), 0.0, 1.0)
+            dist_x = dx - t * sx
+            dist_y = dy - t * sy
+            too_close = ((dist_x * dist_x + dist_y * dist_y) < self.inset_sq).any(axis=1)
+            result[group[too_close]] = False
+
+        return result.tolist()
+
+    def _neighbourhood_array(self, cx, cy):
+        """Unique edges of the 3x3 cells around (cx, cy) as an (n, 4) float array (cached)."""
+        arr = self._neighbourhoods.get((cx, cy))
+        if arr is None:
+            edges = set()
+            for nx in range(cx - 1, cx + 2):
+                for ny in range(cy - 1, cy + 2):
+                    edges.update(self.cells.get((nx, ny), ()))
+            arr = np.array(sorted(edges), dtype=np.float64).reshape(-1, 4)
+            self._neighbourhoods[(cx, cy)] = arr
+        return arr
+
+
+def point_to_segment_distance_sq(px, py, x1, y1, x2, y2):
+    """Squared minimum distance from point (px, py) to segment (x1,y1)-(x2,y2)."""
+    dx = px - x1
+    dy = py - y1
+    sx = x2 - x1
+    sy = y2 - y1
+    seg_len_sq = sx * sx + sy * sy
+
+    if seg_len_sq == 0:
+        return dx * dx + dy * dy
+
+    # Project point onto segment (clamped to [0, 1])
+    t = max(0.0, min(1.0, (dx * sx + dy * sy) / seg_len_sq))
+    dist_x = dx - t * sx
+    dist_y = dy - t * sy
+    return dist_x * dist_x + dist_y * dist_y
+
+
+# Blocked intervals along a line: for a point moving along p(s) = (x + s*dx, y + s*dy)
+# with (dx, dy) a unit direction, the range of s where it is closer than a
+# distance to an obstacle. Obstacles are convex, so the range is one open interval
+# (s0, s1), or None if the line stays clear.
+
+def line_circle_interval(x, y, dx, dy, radius):
+    """Interval where the moving point is closer than radius to the origin."""
+    b = x * dx + y * dy
+    disc = b * b - (x * x + y * y - radius * radius)
+    if disc <= 0:
+        return None
+    root = math.sqrt(disc)
+    return -b - root, -b + root
+
+
+def line_box_interval(x, y, dx, dy, left, top, right, bottom):
+    """Interval where the moving point is inside an axis aligned box."""
+    s0 = -math.inf
+    s1 = math.inf
+    for p, d, low, high in ((x, dx, left, right), (y, dy, top, bottom)):
+        if abs(d) < 1e-12:
+            if not low < p < high:
+                return None
+            continue
+        a = (low - p) / d
+        b = (high - p) / d
+        s0 = max(s0, min(a, b))
+        s1 = min(s1, max(a, b))
+    if s0 >= s1:
+        return None
+    return s0, s1
+
+
+def interval_hull(intervals):
+    """Smallest interval containing all given intervals (None entries are skipped), or None."""
+    intervals = [interval for interval in intervals if interval is not None]
+    if not intervals:
+        return None
+    return min(s0 for s0, _ in intervals), max(s1 for _, s1 in intervals)
+
+
+def line_segment_interval(x, y, dx, dy, x0, y0, x1, y1, radius):
+    """Interval where the moving point is closer than radius to the segment (x0,y0)-(x1,y1)."""
+    length = math.hypot(x1 - x0, y1 - y0)
+    if length < 1:
+        return line_circle_interval(x - x0, y - y0, dx, dy, radius)
+    # Segment frame: segment from (0, 0) to (length, 0)
+    ex = (x1 - x0) / length
+    ey = (y1 - y0) / length
+    px = (x - x0) * ex + (y - y0) * ey
+    py = -(x - x0) * ey + (y - y0) * ex
+    qx = dx * ex + dy * ey
+    qy = -dx * ey + dy * ex
+    # The stadium around the segment: two end circles and the band between them
+    return interval_hull([line_circle_interval(px, py, qx, qy, radius),
+                          line_circle_interval(px - length, py, qx, qy, radius),
+                          line_box_interval(px, py, qx, qy, 0, -radius, length, radius)])
+
+
+def free_intervals(blocked, low, high):
+    """Parts of [low, high] not covered by any of the blocked intervals, sorted."""
+    free = []
+    start = low
+    for s0, s1 in sorted(blocked):
+        if s0 > start:
+            free.append((start, min(s0, high)))
+        start = max(start, s1)
+        if start >= high:
+            break
+    if start < high:
+        free.append((start, high))
+    return [(s0, s1) for s0, s1 in free if s0 < s1]
+
+
+# Track path primitives used for arc-length sampling:
+#   ('line', x0, y0, x1, y1)
+#   ('arc', cx, cy, radius, start_angle, sweep_angle)   angles in radians, sweep signed
+# Primitives are oriented: each one starts where the previous one ends.
+
+def arc_from_three_points(sx, sy, mx, my, ex, ey):
+    """Build an arc primitive through start, mid and end points.
+
+    Returns:
+        ('arc', cx, cy, radius, start_angle, sweep_angle), or None if the points
+        are collinear (the caller should use a line instead)
+    """
+    d = 2.0 * (sx * (my - ey) + mx * (ey - sy) + ex * (sy - my))
+    if abs(d) < 1e-9:
+        return None
+
+    s_sq = sx * sx + sy * sy
+    m_sq = mx * mx + my * my
+    e_sq = ex * ex + ey * ey
+    cx = (s_sq * (my - ey) + m_sq * (ey - sy) + e_sq * (sy - my)) / d
+    cy = (s_sq * (ex - mx) + m_sq * (sx - ex) + e_sq * (mx - sx)) / d
+    radius = math.hypot(sx - cx, sy - cy)
+
+    a_start = math.atan2(sy - cy, sx - cx)
+    a_mid = math.atan2(my - cy, mx - cx)
+    a_end = math.atan2(ey - cy, ex - cx)
+
+    # Counterclockwise sweep from start to end; if the mid point is not on that
+    # side, the arc goes the other way round
+    ccw_sweep = (a_end - a_start) % (2 * math.pi)
+    ccw_mid = (a_mid - a_start) % (2 * math.pi)
+    sweep = ccw_sweep if ccw_mid <= ccw_sweep else ccw_sweep - 2 * math.pi
+
+    return ('arc', cx, cy, radius, a_start, sweep)
+
+
+def primitive_length(primitive):
+    """Arc length of a path primitive."""
+    if primitive[0] == 'arc':
+        return abs(primitive[3] * primitive[5])
+    return math.hypot(primitive[3] - primitive[1], primitive[4] - primitive[2])
+
+
+def primitive_endpoints(primitive):
+    """Start and end point of a path primitive as ((x, y), (x, y))."""
+    if primitive[0] == 'arc':
+        _, cx, cy, radius, a0, sweep = primitive
+        return ((cx + radius * math.cos(a0), cy + radius * math.sin(a0)),
+                (cx + radius * math.cos(a0 + sweep), cy + radius * math.sin(a0 + sweep)))
+    return (primitive[1], primitive[2]), (primitive[3], primitive[4])
+
+
+def reverse_primitive(primitive):
+    """Same primitive walked in the opposite direction."""
+    if primitive[0] == 'arc':
+        _, cx, cy, radius, a0, sweep = primitive
+        return ('arc', cx, cy, radius, a0 + sweep, -sweep)
+    return ('line', primitive[3], primitive[4], primitive[1], primitive[2])
+
+
+def point_to_primitive_distance(px, py, primitive):
+    """Minimum distance from a point to a line or arc primitive (center line)."""
+    if primitive[0] == 'arc':
+        _, cx, cy, radius, a0, sweep = primitive
+        # Is the point's direction from the center within the arc's sweep?
+        rel = (math.atan2(py - cy, px - cx) - a0) * (1.0 if sweep >= 0 else -1.0)
+        if rel % (2 * math.pi) <= abs(sweep):
+            return abs(math.hypot(px - cx, py - cy) - radius)
+        (sx, sy), (ex, ey) = primitive_endpoints(primitive)
+        return min(math.hypot(px - sx, py - sy), math.hypot(px - ex, py - ey))
+    return math.sqrt(point_to_segment_distance_sq(px, py, *primitive[1:]))
+
+
+def cluster_points(xs, ys, radius):
+    """Group near-coincident points with a spatial hash.
+
+    Points are visited in order. A point joins the cluster whose seed (first
+    point) is nearest and closer than radius, otherwise it seeds a new cluster.
+    Comparing against the seed keeps every cluster within radius of its seed.
+
+    Args:
+        xs, ys: point coordinates in internal units
+        radius: merge distance in internal units
+
+    Returns:
+        list of clusters (lists of point indices), in the order of their seeds
+    """
+    cell = max(1, int(radius))
+    radius_sq = radius * radius
+    grid = {}
+    clusters = []
+
+    for i in range(len(xs)):
+        x = xs[i]
+        y = ys[i]
+        cx = x // cell
+        cy = y // cell
+
+        best = None
+        best_dist_sq = radius_sq
+        for nx in (cx - 1, cx, cx + 1):
+            for ny in (cy - 1, cy, cy + 1):
+                for cluster_idx in grid.get((nx, ny), ()):
+                    seed = clusters[cluster_idx][0]
+                    dx = x - xs[seed]
+                    dy = y - ys[seed]
+                    dist_sq = dx * dx + dy * dy
+                    if dist_sq < best_dist_sq:
+                        best = cluster_idx
+                        best_dist_sq = dist_sq
+
+        if best is None:
+            grid.setdefault((cx, cy), []).append(len(clusters))
+            clusters.append([i])
+        else:
+            clusters[best].append(i)
+
+    return clusters
+
+
+def sample_offset_positions(paths, pitch, offsets, min_length=1):
+    """Sample stitch positions along whole tracks by arc length, offset to both sides.
+
+    For every track a station is placed at arc length 0, pitch, 2*pitch, ... along the
+    track (stations continue across segment and arc boundaries). At every station
+    two positions are emitted, offset perpendicular to the track direction by
+    -offset and +offset (in that order). Arcs are followed exactly.
+
+    With NumPy all tracks of a layer are sampled in one vectorized pass.
+
+    Args:
+        paths: list of tracks, each a list of oriented primitives
+        pitch: distance between stations along the track in internal units
+        offsets: list with the perpendicular offset for every track
+        min_length: primitives shorter than this are ignored
+
+    Returns:
+        tuple of lists (xs, ys, track_indices, primitive_indices), one entry per
+        position; primitive_indices index into the primitives of that track
+    """
+    flat = _flatten_paths(paths, min_length)
+    if not flat or pitch <= 0:
+        return [], [], [], []
+
+    if np is None:
+        return _sample_offset_positions_python(flat, len(paths), pitch, offsets)
+
+    count = len(flat)
+    track_of = np.array([f[0] for f in flat], dtype=np.int64)
+    prim_of = np.array([f[1] for f in flat], dtype=np.int64)
+    lengths = np.array([f[3] for f in flat], dtype=np.float64)
+    is_arc = np.array([f[2][0] == 'arc' for f in flat], dtype=bool)
+
+    # Line parameters (start point and unit direction) and arc parameters
+    p = np.zeros((count, 5), dtype=np.float64)
+    for i, (_, _, primitive, length) in enumerate(flat):
+        if primitive[0] == 'arc':
+            _, cx, cy, radius, a0, sweep = primitive
+            p[i] = (cx, cy, radius, a0, 1.0 if sweep >= 0 else -1.0)
+        else:
+            _, x0, y0, x1, y1 = primitive
+            p[i] = (x0, y0, (x1 - x0) / length, (y1 - y0) / length, 0.0)
+
+    # Global arc length: tracks laid out one after the other. Track start and
+    # length come from the same sums as the primitive starts, so a station never
+    # lands on a primitive of the neighbouring track through float rounding
+    prim_start = np.concatenate(([0.0], np.cumsum(lengths)[:-1]))
+    tracks = np.arange(len(paths))
+    first_prim = np.searchsorted(track_of, tracks, side='left')
+    last_prim = np.searchsorted(track_of, tracks, side='right') - 1
+    has_prims = last_prim >= first_prim
+    first_clipped = np.minimum(first_prim, count - 1)
+    last_clipped = np.maximum(last_prim, 0)
+    track_start = prim_start[first_clipped]
+    track_lengths = np.where(has_prims, prim_start[last_clipped] + lengths[last_clipped] - track_start, 0.0)
+
+    # Stations k * pitch < track length for every track
+    station_counts = np.ceil(track_lengths / pitch).astype(np.int64)
+    station_track = np.repeat(np.arange(len(paths)), station_counts)
+    first_station = np.concatenate(([0], np.cumsum(station_counts)[:-1]))
+    station_k = np.arange(len(station_track)) - np.repeat(first_station, station_counts)
+    station_s = track_start[station_track] + station_k * float(pitch)
+
+    # Primitive each station falls on and distance along that primitive
+    idx = np.searchsorted(prim_start, station_s, side='right') - 1
+    idx = np.clip(idx, first_prim[station_track], last_prim[station_track])
+    t = np.minimum(station_s - prim_start[idx], lengths[idx])
+
+    arc = is_arc[idx]
+    pp = p[idx]
+    angle = pp[:, 3] + pp[:, 4] * t / np.where(arc, pp[:, 2], 1.0)
+    cos_a = np.cos(angle)
+    sin_a = np.sin(angle)
+    base_x = np.where(arc, pp[:, 0] + pp[:, 2] * cos_a, pp[:, 0] + pp[:, 2] * t)
+    base_y = np.where(arc, pp[:, 1] + pp[:, 2] * sin_a, pp[:, 1] + pp[:, 3] * t)
+    dir_x = np.where(arc, -pp[:, 4] * sin_a, pp[:, 2])
+    dir_y = np.where(arc, pp[:, 4] * cos_a, pp[:, 3])
+
+    # Round the on-track position first, then offset along the perpendicular
+    base_x = np.round(base_x)
+    base_y = np.round(base_y)
+    offset = np.asarray(offsets, dtype=np.float64)[track_of[idx]]
+    perp_x = -dir_y * offset
+    perp_y = dir_x * offset
+
+    # Interleave sides: station 0 side -1, station 0 side +1, station 1 side -1, ...
+    xs = np.column_stack((np.round(base_x - perp_x), np.round(base_x + perp_x))).ravel()
+    ys = np.column_stack((np.round(base_y - perp_y), np.round(base_y + perp_y))).ravel()
+    track_ids = np.repeat(track_of[idx], 2)
+    prim_ids = np.repeat(prim_of[idx], 2)
+
+    return (xs.astype(np.int64).tolist(), ys.astype(np.int64).tolist(),
+            track_ids.tolist(), prim_ids.tolist())
+
+
+def sample_offset_positions_python(paths, pitch, offsets, min_length=1):
+    """sample_offset_positions, always without NumPy (the reference for the vectorized pass)."""
+    flat = _flatten_paths(paths, min_length)
+    if not flat or pitch <= 0:
+        return [], [], [], []
+    return _sample_offset_positions_python(flat, len(paths), pitch, offsets)
+
+
+def _flatten_paths(paths, min_length):
+    """(track index, primitive index, primitive, length) of all primitives, dropping the degenerate ones."""
+    flat = []
+    for track_idx, path in enumerate(paths):
+        for prim_idx, primitive in enumerate(path):
+            length = primitive_length(primitive)
+            if length >= min_length:
+                flat.append((track_idx, prim_idx, primitive, length))
+    return flat
+
+
+def _sample_offset_positions_python(flat, track_count, pitch, offsets):
+    """Pure Python version of sample_offset_positions (same output)."""
+    xs, ys, track_ids, prim_ids = [], [], [], []
+
+    by_track = [[] for _ in range(track_count)]
+    for entry in flat:
+        by_track[entry[0]].append(entry)
+
+    for track_idx, entries in enumerate(by_track):
+        offset = offsets[track_idx]
+        distance = 0.0          # arc length at the start of the current primitive
+        next_station = 0.0
+        for _, prim_idx, primitive, length in entries:
+            end_distance = distance + length
+            while next_station < end_distance:
+                t = next_station - distance
+                if primitive[0] == 'arc':
+                    _, cx, cy, radius, a0, sweep = primitive
+                    direction = 1.0 if sweep >= 0 else -1.0
+                    angle = a0 + direction * t / radius
+                    base_x = round(cx + radius * math.cos(angle))
+                    base_y = round(cy + radius * math.sin(angle))
+                    dir_x = -direction * math.sin(angle)
+                    dir_y = direction * math.cos(angle)
+                else:
+                    _, x0, y0, x1, y1 = primitive
+                    dir_x = (x1 - x0) / length
+                    dir_y = (y1 - y0) / length
+                    base_x = round(x0 + dir_x * t)
+                    base_y = round(y0 + dir_y * t)
+
+                for side in (-1, 1):
+                    xs.append(int(round(base_x - dir_y * offset * side)))
+                    ys.append(int(round(base_y + dir_x * offset * side)))
+                    track_ids.append(track_idx)
+                    prim_ids.append(prim_idx)
+
+                next_station += pitch
+            distance = end_distance
+
+    return xs, ys, track_ids, prim_ids
+
+
+class PadShape:
+    """Exact pad outline, relative to the pad shape center.
+
+    Rect, rounded rect, oval and circle pads are stored as a rounded rectangle
+    (half sizes + corner radius) and rotation. Custom and other shapes are stored
+    as a polygon in board orientation. Shapes only depend on the pad definition
+    and rotation, so identical pads share one instance.
+    """
+
+    def __init__(self, half_x, half_y, corner_radius=0, angle_deg=0.0, polygon=None):
+        """
+        Args:
+            half_x, half_y: half size of the pad in its own (unrotated) frame
+            corner_radius: corner rounding radius (half the smaller size for ovals)
+            angle_deg: pad orientation in degrees (KiCad convention)
+            polygon: optional PolygonIndex relative to the pad shape center; if
+                     given it is used instead of the rounded rectangle
+        """
+        self.half_x = half_x
+        self.half_y = half_y
+        self.corner_radius = min(corner_radius, half_x, half_y)
+        self.angle_deg = angle_deg
+        self.polygon = polygon
+
+        angle = math.radians(angle_deg)
+        self.cos_a = math.cos(angle)
+        self.sin_a = math.sin(angle)
+
+        if polygon is not None:
+            corners = [(e[0], e[1]) for e in polygon.edges]
+            self.bounding_radius = max(math.hypot(x, y) for x, y in corners) if corners else 0
+        else:
+            self.bounding_radius = math.hypot(half_x, half_y)
+
+    def distance(self, dx, dy):
+        """Signed distance from the pad outline to a point (negative inside).
+
+        Args:
+            dx, dy: point relative to the pad shape center in internal units
+        """
+        if self.polygon is not None:
+            dist = math.sqrt(min(point_to_segment_distance_sq(dx, dy, *edge) for edge in self.polygon.edges))
+            return -dist if self.polygon.contains(dx, dy) else dist
+
+        # Rotate the point into the pad frame (inverse of KiCad's RotatePoint)
+        local_x = dx * self.cos_a - dy * self.sin_a
+        local_y = dx * self.sin_a + dy * self.cos_a
+
+        # Rounded rectangle signed distance
+        r = self.corner_radius
+        qx = abs(local_x) - (self.half_x - r)
+        qy = abs(local_y) - (self.half_y - r)
+        outside = math.hypot(max(qx, 0.0), max(qy, 0.0))
+        inside = min(max(qx, qy), 0.0)
+        return outside + inside - r
+
+    def line_interval(self, x, y, dx, dy, reach):
+        """Interval where a point moving along a line is closer than reach to the pad.
+
+        Args:
+            x, y: start of the line relative to the pad shape center
+            dx, dy: unit direction of the line
+            reach: distance to keep
+
+        Returns:
+            (s0, s1) or None, see line_circle_interval; for polygon pads the
+            interval of the bounding circle (larger than the exact one)
+        """
+        if self.polygon is not None:
+            return line_circle_interval(x, y, dx, dy, reach + self.bounding_radius)
+
+        # Into the pad frame, like distance()
+        local_x = x * self.cos_a - y * self.sin_a
+        local_y = x * self.sin_a + y * self.cos_a
+        local_dx = dx * self.cos_a - dy * self.sin_a
+        local_dy = dx * self.sin_a + dy * self.cos_a
+
+        # The rounded rectangle grown by reach: the core rectangle grown by
+        # r + reach, i.e. two bands and four corner circles
+        r = self.corner_radius
+        hx = self.half_x - r
+        hy = self.half_y - r
+        grow = r + reach
+        intervals = [line_box_interval(local_x, local_y, local_dx, local_dy, -hx - grow, -hy, hx + grow, hy),
+                     line_box_interval(local_x, local_y, local_dx, local_dy, -hx, -hy - grow, hx, hy + grow)]
+        for cx in (-hx, hx):
+            for cy in (-hy, hy):
+                intervals.append(line_circle_interval(local_x - cx, local_y - cy, local_dx, local_dy, grow))
+        return interval_hull(intervals)
+
+
+class SpatialIndex:
+    """Uniform grid hash of axis aligned bounding boxes.
+
+    Items are registered in every cell their box touches; a query returns the
+    items registered in the cells the query box touches (a superset of the items
+    whose boxes really overlap it).
+    """
+
+    def __init__(self, cell_size):
+        self.cell = max(1, int(cell_size))
+        self.cells = {}
+
+    def insert(self, item, left, top, right, bottom):
+        cell = self.cell
+        for cx in range(int(left) // cell, int(right) // cell + 1):
+            for cy in range(int(top) // cell, int(bottom) // cell + 1):
+                self.cells.setdefault((cx, cy), []).append(item)
+
+    def query(self, left, top, right, bottom):
+        """Items whose cells overlap the box, as a set."""
+        cell = self.cell
+        found = set()
+        for cx in range(int(left) // cell, int(right) // cell + 1):
+            for cy in range(int(top) // cell, int(bottom) // cell + 1):
+                items = self.cells.get((cx, cy))
+                if items:
+                    found.update(items)
+        return found
+
+    def query_radius(self, x, y, radius):
+        """Items whose cells overlap the square of half size radius around (x, y)."""
+        return self.query(x - radius, y - radius, x + radius, y + radius)
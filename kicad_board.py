@@ -0,0 +1,649 @@
+"""
+Reading from and writing to a pcbnew board through KiCad's SWIG Python bindings.
+
+read_snapshot walks the board once and turns everything the stitching checks
+need into a BoardSnapshot; add_via creates the stitching vias on the board.
+"""
+try:
+    import pcbnew
+except Exception:
+    # When this module is inspected outside KiCad, imports may fail. Allow that.
+    pcbnew = None
+
+from .geometry import PadShape, PolygonIndex
+from .metadata import BoardMetadata
+from .snapshot import TRACK_ARC, TRACK_LINE, BoardSnapshot
+
+# Name of the board group holding every via placed by the plugin
+STITCH_GROUP_NAME = 'via stitching'
+
+
+def read_metadata(board):
+    """Read the nets, copper layers and netclass clearances of the board, in one pass each.
+
+    Returns:
+        metadata.BoardMetadata, with the pcbnew net objects as net_items
+    """
+    metadata = BoardMetadata()
+    for layer in get_copper_layers(board):
+        metadata.add_layer(layer, board.GetLayerName(layer))
+
+    try:
+        metadata.default_clearance = board.GetDesignSettings().GetDefault().GetClearance()
+    except:
+        pass
+
+    netinfo = board.GetNetInfo()
+    for net_code in range(netinfo.GetNetCount()):
+        net = netinfo.GetNetItem(net_code)
+        if net is None:
+            continue
+        try:
+            netclass = net.GetNetClass()
+            netclass_name, clearance = netclass.GetName(), netclass.GetClearance()
+        except:
+            netclass_name, clearance = None, None
+        metadata.add_net(net.GetNetCode(), net.GetNetname(), net, netclass_name, clearance)
+    return metadata
+
+
+def get_copper_layers(board):
+    """Copper layer IDs of the board from top to bottom."""
+    copper_layers = []
+    layer_count = board.GetCopperLayerCount()
+    for i in range(layer_count):
+        if i == 0:
+            copper_layers.append(pcbnew.F_Cu)
+        elif i == layer_count - 1:
+            copper_layers.append(pcbnew.B_Cu)
+        else:
+            # Inner layers
+            copper_layers.append(pcbnew.In1_Cu + (i - 1) * 2)
+    return copper_layers
+
+
+def is_via(track):
+    return hasattr(track, 'GetViaType') or track.Type() == pcbnew.PCB_VIA_T
+
+
+def line_chain_points(chain):
+    """Convert a SHAPE_LINE_CHAIN into a list of (x, y) tuples."""
+    points = []
+    for pt_idx in range(chain.PointCount()):
+        pt = chain.CPoint(pt_idx)
+        points.append((pt.x, pt.y))
+    return points
+
+
+def poly_set_rings(poly_set, dx=0, dy=0):
+    """All outlines and holes of a SHAPE_POLY_SET as rings of (x, y) tuples.
+
+    Args:
+        poly_set: SHAPE_POLY_SET
+        dx, dy: offset subtracted from every point
+    """
+    rings = []
+    for outline_idx in range(poly_set.OutlineCount()):
+        rings.append(line_chain_points(poly_set.Outline(outline_idx)))
+        for hole_idx in range(poly_set.HoleCount(outline_idx)):
+            rings.append(line_chain_points(poly_set.Hole(outline_idx, hole_idx)))
+    if dx or dy:
+        rings = [[(x - dx, y - dy) for x, y in ring] for ring in rings]
+    return rings
+
+
+def read_snapshot(board, metadata=None):
+    """Read everything the stitching engine needs from the board.
+
+    Args:
+        board: pcbnew board object
+        metadata: BoardMetadata of the board, read if None
+
+    Returns:
+        BoardSnapshot
+    """
+    if metadata is None:
+        metadata = read_metadata(board)
+    snapshot = BoardSnapshot()
+    metadata.fill_snapshot(snapshot)
+    try:
+        snapshot.hole_clearance = board.GetDesignSettings().m_HoleToHoleMin
+    except:
+        pass
+    snapshot.edge_clearance = get_board_edge_clearance(board)
+    snapshot.outline = get_board_outline(board)
+
+    read_tracks(board, snapshot, metadata)
+    read_pads(board, snapshot)
+    read_zones(board, snapshot)
+
+    # Courtyards belong to the outer copper layer on their side
+    sides = {pcbnew.F_CrtYd: snapshot.layer_mask([pcbnew.F_Cu]),
+             pcbnew.B_CrtYd: snapshot.layer_mask([pcbnew.B_Cu])}
+    snapshot.courtyards = [(sides[layer], polygon, exact)
+                           for layer, polygon, exact in get_all_courtyards(board)]
+    snapshot.keepouts = [(layer_set_mask(snapshot, layer_set), polygon)
+                         for layer_set, polygon in get_via_keepout_zones(board)]
+
+    return snapshot
+
+
+def layer_set_mask(snapshot, layer_set):
+    """Bitmask (over positions in snapshot.copper_layers) of a pcbnew LSET."""
+    mask = 0
+    for position, layer in enumerate(snapshot.copper_layers):
+        if layer_set.Contains(layer):
+            mask |= 1 << position
+    return mask
+
+
+def read_tracks(board, snapshot, metadata):
+    """Add all tracks, arcs and vias of the board to the snapshot.
+
+    The clearance of a track is read through pcbnew once per (net, layer) and
+    shared by all tracks of the net on that layer (see BoardMetadata.clearance).
+    """
+    for track in board.GetTracks():
+        if is_via(track):
+            # Via - affects all layers it spans
+            try:
+                layer_top, layer_bottom = track.TopLayer(), track.BottomLayer()
+            except:
+                layer_top, layer_bottom = pcbnew.F_Cu, pcbnew.B_Cu
+            pos = track.GetPosition()
+            snapshot.vias.append(pos.x, pos.y, track.GetWidth(), track.GetDrillValue(),
+                                 track.GetNetCode(), layer_top, layer_bottom)
+            continue
+
+        layer = track.GetLayer()
+        start = track.GetStart()
+        end = track.GetEnd()
+        if track.Type() == pcbnew.PCB_ARC_T:
+            kind = TRACK_ARC
+            mid = track.GetMid()
+            mid_x, mid_y = mid.x, mid.y
+        else:
+            kind = TRACK_LINE
+            mid_x, mid_y = (start.x + end.x) // 2, (start.y + end.y) // 2
+
+        # Get clearance - use the board's design rules
+        # GetOwnClearance() returns the actual clearance for that object
+        net_code = track.GetNetCode()
+        clearance = metadata.clearance(net_code, layer, lambda: track.GetOwnClearance(layer))
+
+        snapshot.tracks.append(kind, start.x, start.y, end.x, end.y, mid_x, mid_y,
+                               track.GetWidth(), layer, net_code, clearance)
+
+
+def read_pads(board, snapshot):
+    """Add all pads to the snapshot, with their exact (cached) shapes.
+
+    The pad shape is read through pcbnew only once per (footprint definition,
+    side, pad index, pad number, size, rotation) and shared by every identical
+    pad on the board; the side is part of the key since custom pad outlines of
+    flipped footprints are mirrored, the index since pads of one footprint may
+    share a number (exposed pad with sub-pads, shield tabs). Local clearance and soldermask expansion can be overridden per
+    footprint instance, so they are read for every pad.
+    """
+    shape_cache = {}
+
+    for footprint in board.GetFootprints():
+        try:
+            footprint_id = footprint.GetFPIDAsString()
+        except:
+            footprint_id = None
+        try:
+            flipped = bool(footprint.IsFlipped())
+        except:
+            footprint_id = None  # Side unknown, don't share shapes
+
+        for pad_idx, pad in enumerate(footprint.Pads()):
+            try:
+                shape_pos = pad.ShapePos()
+            except:
+                shape_pos = pad.GetPosition()
+
+            orientation = pad.GetOrientationDegrees()
+            key = None
+            if footprint_id:
+                size = pad.GetSize()
+                key = (footprint_id, flipped, pad_idx, pad.GetNumber(), size.x, size.y, round(orientation, 3))
+
+            shape_idx = shape_cache.get(key) if key is not None else None
+            if shape_idx is None:
+                snapshot.pad_shapes.append(build_pad_shape(pad, orientation, shape_pos))
+                shape_idx = len(snapshot.pad_shapes) - 1
+                if key is not None:
+                    shape_cache[key] = shape_idx
+
+            # Pad local clearance (None/0 means: use the clearance of the check)
+            try:
+                local_clearance = pad.GetLocalClearance() or 0
+            except:
+                local_clearance = 0
+
+            # Soldermask expansion - the soldermask opening is larger than the pad
+            try:
+                mask_margin = pad.GetSolderMaskExpansion() or 0
+            except:
+                mask_margin = 0
+
+            # Pads can span multiple layers; a drilled pad (PTH or NPTH) goes
+            # through the whole board, so it blocks vias of any span
+            try:
+                drilled = pad.GetDrillSize().x > 0
+            except:
+                drilled = False
+            if drilled:
+                layers = snapshot.all_layers_mask()
+            else:
+                layers = layer_set_mask(snapshot, pad.GetLayerSet())
+
+            snapshot.pads.append(shape_pos.x, shape_pos.y, shape_idx, pad.GetNetCode(), layers,
+                                 local_clearance, mask_margin)
+
+
+def read_zones(board, snapshot):
+    """Add the net, layers and outline of all copper zones (not rule areas) to the snapshot."""
+    try:
+        for zone in board.Zones():
+            if zone.GetIsRuleArea():
+                continue
+            try:
+                outline = PolygonIndex(poly_set_rings(zone.Outline()))
+                if not outline.edges:
+                    outline = None
+            except:
+                outline = None
+            snapshot.zones.append(zone.GetNetCode(), layer_set_mask(snapshot, zone.GetLayerSet()), outline)
+    except:
+        pass
+
+
+def build_pad_shape(pad, orientation, shape_pos):
+    """Build the exact PadShape of a pad.
+
+    Rect, rounded rect, oval and circle pads use the analytic rounded rectangle,
+    custom (and any other) pads use the pad's effective polygon. If nothing
+    else works the pad is modeled as a circle of radius max(size)/2.
+    """
+    pad_size = pad.GetSize()
+    half_x = pad_size.x / 2.0
+    half_y = pad_size.y / 2.0
+
+    try:
+        pad_shape = pad.GetShape()
+        if pad_shape == pcbnew.PAD_SHAPE_CIRCLE:
+            radius = max(half_x, half_y)
+            return PadShape(radius, radius, radius)
+        if pad_shape == pcbnew.PAD_SHAPE_RECT:
+            return PadShape(half_x, half_y, 0, orientation)
+        if pad_shape == pcbnew.PAD_SHAPE_OVAL:
+            return PadShape(half_x, half_y, min(half_x, half_y), orientation)
+        if pad_shape in (pcbnew.PAD_SHAPE_ROUNDRECT, pcbnew.PAD_SHAPE_CHAMFERED_RECT):
+            # A chamfered rect lies inside its rounded rect, so this is conservative
+            return PadShape(half_x, half_y, pad.GetRoundRectCornerRadius(), orientation)
+
+        # Custom, trapezoid, ...: use the effective polygon (already rotated)
+        poly = pad.GetEffectivePolygon(pad.GetPrincipalLayer(), pcbnew.ERROR_OUTSIDE)
+        polygon = PolygonIndex(poly_set_rings(poly, shape_pos.x, shape_pos.y))
+        if polygon.edges:
+            return PadShape(half_x, half_y, 0, orientation, polygon)
+    except:
+        pass
+
+    # Fallback: circle with radius max(size)/2
+    radius = max(half_x, half_y)
+    return PadShape(radius, radius, radius)
+
+
+def get_all_courtyards(board):
+    """Collect all courtyard polygons from footprints (front and back).
+
+    Returns:
+        list of (layer, PolygonIndex, exact) tuples; exact is False for courtyards
+        that could only be read as graphical items and are checked by bounding box
+    """
+    courtyards = []
+
+    for footprint in board.GetFootprints():
+        # Get both front and back courtyards - vias must avoid both!
+        for layer in [pcbnew.F_CrtYd, pcbnew.B_CrtYd]:
+            # Get courtyard outlines for this layer
+            try:
+                # Try getting the courtyard polygon directly
+                courtyard_poly = footprint.GetCourtyard(layer)
+                if courtyard_poly and courtyard_poly.OutlineCount() > 0:
+                    polygon = PolygonIndex(poly_set_rings(courtyard_poly))
+                    if polygon.edges:
+                        courtyards.append((layer, polygon, True))
+            except:
+                # Fallback: iterate through graphical items
+                for item in footprint.GraphicalItems():
+                    if item.GetLayer() == layer:
+                        bbox = item.GetBoundingBox()
+                        polygon = PolygonIndex.from_rect(bbox.GetLeft(), bbox.GetTop(),
+                                                         bbox.GetRight(), bbox.GetBottom())
+                        courtyards.append((layer, polygon, False))
+
+    return courtyards
+
+
+def get_via_keepout_zones(board):
+    """Collect the outlines of all rule areas (keepouts) prohibiting vias.
+
+    Returns:
+        list of (LSET, PolygonIndex); the LSET holds the layers the rule area is on
+    """
+    via_keepout_zones = []
+
+    try:
+        # Iterate through all zones on the board
+        for zone in board.Zones():
+            # Check if it's a rule area (keepout zone) that prohibits vias
+            if zone.GetIsRuleArea() and zone.GetDoNotAllowVias():
+                polygon = PolygonIndex(poly_set_rings(zone.Outline()))
+                if polygon.edges:
+                    via_keepout_zones.append((zone.GetLayerSet(), polygon))
+    except Exception as e:
+        # If something goes wrong, just return what we have
+        pass
+
+    return via_keepout_zones
+
+
+def get_board_outline(board):
+    """Get the board outline as an edge-indexed polygon.
+
+    The real Edge.Cuts outline is used, including holes (cutouts, slots) and
+    non-rectangular shapes. If KiCad can't build a closed outline, the board
+    edges bounding box is used as a rectangle instead.
+
+    Returns:
+        PolygonIndex or None if not available
+    """
+    try:
+        outlines = pcbnew.SHAPE_POLY_SET()
+        if board.GetBoardPolygonOutlines(outlines):
+            polygon = PolygonIndex(poly_set_rings(outlines))
+            if polygon.edges:
+                return polygon
+    except:
+        pass
+
+    try:
+        # Fallback: treat the board as its bounding box
+        bbox = board.GetBoardEdgesBoundingBox()
+        return PolygonIndex.from_rect(bbox.GetLeft(), bbox.GetTop(), bbox.GetRight(), bbox.GetBottom())
+    except:
+        return None
+
+
+def get_board_edge_clearance(board):
+    """Get the board edge clearance constraint from design settings.
+
+    Returns:
+        int: edge clearance in internal units (nanometers)
+    """
+    try:
+        design_settings = board.GetDesignSettings()
+        # Edge clearance is typically 0.5mm (500000 nm)
+        # Try to get it from design rules
+        edge_clearance = design_settings.GetCopperEdgeClearance()
+        if edge_clearance and edge_clearance > 0:
+            return edge_clearance
+    except:
+        pass
+
+    # Default to 0.5mm if can't get from settings
+    return 500000  # 0.5mm in nanometers
+
+
+def in_region(position, region):
+    """True if a position is inside region (left, top, right, bottom), or region is None."""
+    if region is None:
+        return True
+    left, top, right, bottom = region
+    return left <= position.x <= right and top <= position.y <= bottom
+
+
+def via_box(x, y, diameter):
+    """Bounding box (left, top, right, bottom) of a via."""
+    radius = diameter // 2
+    return x - radius, y - radius, x + radius, y + radius
+
+
+def touches_any(box, boxes):
+    """True if box (left, top, right, bottom) overlaps one of boxes."""
+    left, top, right, bottom = box
+    return any(l <= right and left <= r and t <= bottom and top <= b for l, t, r, b in boxes)
+
+
+def refill_zones(board, boxes):
+    """Refill the copper zones touched by the boxes, in one fill.
+
+    Only zones whose bounding box overlaps a box are refilled (all nets: the
+    zones of other nets have to pour around a new via too), so the cost grows
+    with the changed area instead of the board.
+
+    Args:
+        board: pcbnew board object
+        boxes: (left, top, right, bottom) boxes of the changed items
+
+    Returns:
+        number of zones refilled
+    """
+    zones = []
+    for zone in board.Zones():
+        try:
+            if zone.GetIsRuleArea():
+                continue
+        except:
+            pass
+        bbox = zone.GetBoundingBox()
+        if touches_any((bbox.GetLeft(), bbox.GetTop(), bbox.GetRight(), bbox.GetBottom()), boxes):
+            zones.append(zone)
+
+    if zones:
+        pcbnew.ZONE_FILLER(board).Fill(zones)
+    return len(zones)
+
+
+def remove_vias(board, net_codes, region=None, touched=None):
+    """Remove all vias on some nets from the board, placed by the plugin or not.
+
+    This walks all tracks of the board; see remove_stitching_vias for removing
+    only the vias the plugin placed.
+
+    Args:
+        board: pcbnew board object
+        net_codes: codes of the nets whose vias are removed
+        region: (left, top, right, bottom) in internal units, only vias inside
+                are removed; the whole board if None
+        touched: list the bounding box of every removed via is appended to, or None
+
+    Returns:
+        number of vias removed
+    """
+    net_codes = set(net_codes)
+    # Collect vias first, the track list must not change while iterating it
+    vias_to_remove = [track for track in board.GetTracks()
+                      if is_via(track) and track.GetNetCode() in net_codes and in_region(track.GetPosition(), region)]
+
+    for via in vias_to_remove:
+        if touched is not None:
+            touched.append(via_box(via.GetPosition().x, via.GetPosition().y, via.GetWidth()))
+        if via.GetParentGroup() is not None:
+            via.GetParentGroup().RemoveItem(via)
+        board.Remove(via)
+    remove_empty_group(board, find_stitch_group(board))
+
+    return len(vias_to_remove)
+
+
+def find_stitch_group(board, create=False):
+    """The board group tagging the vias placed by the plugin.
+
+    Args:
+        create: create the group if the board has none
+
+    Returns:
+        PCB_GROUP, or None if there is none and create is False
+    """
+    for group in board.Groups():
+        if group.GetName() == STITCH_GROUP_NAME:
+            return group
+    if not create:
+        return None
+    group = pcbnew.PCB_GROUP(board)
+    group.SetName(STITCH_GROUP_NAME)
+    board.Add(group)
+    return group
+
+
+def remove_empty_group(board, group):
+    """Remove the stitching group from the board once it holds no vias anymore."""
+    if group is not None and len(list(group.GetItems())) == 0:
+        board.Remove(group)
+
+
+def remove_stitching_vias(board, net_codes, region=None, touched=None):
+    """Remove the vias placed by the plugin (see STITCH_GROUP_NAME) on some nets.
+
+    Only the group members are visited, so this takes time proportional to the
+    number of stitching vias, and hand-placed vias on the same nets (thermal
+    vias, vias in BGA fanouts) are kept.
+
+    Args:
+        board: pcbnew board object
+        net_codes: codes of the nets whose stitching vias are removed
+        region: (left, top, right, bottom) in internal units, only vias inside
+                are removed; the whole board if None
+        touched: list the bounding box of every removed via is appended to, or None
+
+    Returns:
+        number of vias removed
+    """
+    group = find_stitch_group(board)
+    if group is None:
+        return 0
+
+    net_codes = set(net_codes)
+    vias_to_remove = [item for item in group.GetItems()
+                      if is_via(item) and item.GetNetCode() in net_codes and in_region(item.GetPosition(), region)]
+    for via in vias_to_remove:
+        if touched is not None:
+            touched.append(via_box(via.GetPosition().x, via.GetPosition().y, via.GetWidth()))
+        group.RemoveItem(via)
+        board.Remove(via)
+    remove_empty_group(board, group)
+
+    return len(vias_to_remove)
+
+
+def add_via(board, x, y, drill, diameter, net, layer_top=None, layer_bottom=None, group=None):
+    """Create a via on the board.
+
+    Args:
+        board: pcbnew board object
+        x, y: via center in internal units
+        drill, diameter: via drill and diameter in internal units
+        net: pcbnew net object of the via
+        layer_top, layer_bottom: copper layers the via spans; a through via
+                                 (F.Cu to B.Cu) if not given
+        group: PCB_GROUP to add the via to (see find_stitch_group), or None
+
+    Returns:
+        the new PCB_VIA
+    """
+    if layer_top is None:
+        layer_top = pcbnew.F_Cu
+    if layer_bottom is None:
+        layer_bottom = pcbnew.B_Cu
+
+    via = pcbnew.PCB_VIA(board)
+    via.SetPosition(pcbnew.VECTOR2I(x, y))
+    via.SetDrill(drill)
+    via.SetWidth(diameter)
+    via.SetNet(net)
+
+    if layer_top != pcbnew.F_Cu or layer_bottom != pcbnew.B_Cu:
+        # Blind (reaches an outer layer) or buried via. KiCad 9 has one type for
+        # both, newer versions have separate ones.
+        if layer_top == pcbnew.F_Cu or layer_bottom == pcbnew.B_Cu:
+            via_type = getattr(pcbnew, 'VIATYPE_BLIND', None)
+        else:
+            via_type = getattr(pcbnew, 'VIATYPE_BURIED', None)
+        if via_type is None:
+            via_type = pcbnew.VIATYPE_BLIND_BURIED
+        via.SetViaType(via_type)
+
+    # Set the layers the via spans
+    via.SetLayerPair(layer_top, layer_bottom)
+
+    board.Add(via)
+    if group is not None:
+        group.AddItem(via)
+    return via
+
+
+class SwigBackend:
+    """The board operations of a stitching run, through the SWIG bindings.
+
+    The stitching run (see stitching.run_stitching) only talks to the board
+    through a backend; kicad_ipc.IpcBackend is the same interface over KiCad's
+    IPC API. Nets are (net code, net name) tuples.
+    """
+
+    def __init__(self, board):
+        self.board = board
+        self._metadata = None
+        self._group = None  # stitching group, created with the first new via
+        self.touched = []   # bounding boxes of the vias removed and added
+
+    def metadata(self):
+        """BoardMetadata of the board, read on first use."""
+        if self._metadata is None:
+            self._metadata = read_metadata(self.board)
+        return self._metadata
+
+    def find_gnd_net(self):
+        return self.metadata().gnd_net()
+
+    def find_net(self, net_name):
+        return self.metadata().net(net_name)
+
+    def remove_vias(self, net_codes, tagged_only=True, region=None):
+        if tagged_only:
+            return remove_stitching_vias(self.board, net_codes, region, self.touched)
+        return remove_vias(self.board, net_codes, region, self.touched)
+
+    def read_snapshot(self):
+        return read_snapshot(self.board, self.metadata())
+
+    def add_via(self, x, y, drill, diameter, net_code, layer_top=None, layer_bottom=None):
+        if self._group is None:
+            self._group = find_stitch_group(self.board, create=True)
+        self.touched.append(via_box(x, y, diameter))
+        return add_via(self.board, x, y, drill, diameter, self.metadata().net_items[net_code], layer_top, layer_bottom,
+                       self._group)
+
+    def remove_item(self, item):
+        if self._group is not None:
+            self._group.RemoveItem(item)
+        self.board.Remove(item)
+
+    def refill_zones(self):
+        """Refill the zones touched by the removed and added vias (see refill_zones).
+
+        Returns:
+            number of zones refilled
+        """
+        if not self.touched:
+            return 0
+        return refill_zones(self.board, self.touched)
+
+    def commit(self):
+        """SWIG changes are applied to the board right away, only drop an empty stitching group."""
+        remove_empty_group(self.board, self._group)
+        return None
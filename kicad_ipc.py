@@ -0,0 +1,661 @@
+"""
+Stitching through KiCad's IPC API instead of the SWIG bindings.
+
+With the SWIG bindings every obstacle is read through many getter calls and
+every via is built with a handful of setters plus board.Add. Over the IPC API
+the board geometry is read in two bulk requests and all changes (removed and
+new vias) go to KiCad in one commit request, which is one undo step.
+
+The stitching run itself is shared with the SWIG backend (see
+stitching.run_stitching); IpcBackend only turns the replies into a
+BoardSnapshot and collects the changes. Requests go through a transport
+with a single method:
+
+    transport.call(method, params) -> result (plain JSON values)
+
+KipyTransport talks to a running KiCad through kicad-python (kipy), with
+the approximations listed in its docstring (courtyards, netclass clearances,
+custom pads, full refills); SocketTransport speaks the same requests as JSON
+lines over a socket, so the backend can be run against a local mock server.
+The requests:
+
+get_board() ->
+    {"copper_layers": [[layer id, name], ...] top to bottom,
+     "nets": [[code, name], ...],
+     "default_clearance", "hole_clearance", "edge_clearance": int or null,
+     "outline": rings or null}
+
+get_items() ->
+    {"tracks": [["line" | "arc", x0, y0, x1, y1, mx, my, width, layer, net, clearance or null], ...],
+     "vias": [[id, x, y, diameter, drill, net, layer_top, layer_bottom, tagged], ...],
+     "pads": [[x, y, net, [layer ids], drilled, local_clearance, mask_margin,
+               [half_x, half_y, corner_radius, angle_deg, rings or null]], ...],
+     "zones": [[net, [layer ids], rings], ...],
+     "keepouts": [[[layer ids], rings], ...],
+     "courtyards": [["F" | "B", rings, exact], ...]}
+
+commit({"remove": [via ids], "create": [[x, y, drill, diameter, net, layer_top, layer_bottom], ...],
+        "group": name, "message": text, "refill": [[left, top, right, bottom], ...]})
+    -> {"created": count}
+
+A via is tagged if it is in the group the plugin puts its vias in
+(kicad_board.STITCH_GROUP_NAME); created vias are added to that group.
+refill lists the boxes of the removed and created vias; the zones they touch
+are refilled after the changes, in the same request (missing or empty: no refill).
+
+Coordinates are in internal units (nanometers), rings are lists of [x, y]
+point lists. A JSON line request is {"id": n, "method": ..., "params": ...},
+the reply {"id": n, "result": ...} or {"id": n, "error": message}.
+
+Run it with Python next to a running KiCad (IPC API server enabled in the
+preferences), from the folder that contains the plugin folder:
+
+    python -m via_stitching_plugin.kicad_ipc --preset fab.json
+"""
+import argparse
+import json
+import math
+import socket
+import sys
+
+from .geometry import PadShape, PolygonIndex
+from .kicad_board import STITCH_GROUP_NAME, touches_any, via_box
+from .metadata import BoardMetadata
+from .snapshot import TRACK_ARC, TRACK_LINE, BoardSnapshot
+
+try:
+    import kipy
+    from kipy.board_types import ArcTrack, Via
+    from kipy.geometry import Vector2
+    from kipy.proto.board.board_types_pb2 import BoardLayer, PadStackShape, ViaType
+except Exception:
+    # kicad-python is only needed for KipyTransport
+    kipy = None
+try:
+    from kipy.board_types import Group
+except Exception:
+    # Older kicad-python without groups: vias are not tagged
+    Group = None
+
+
+class IpcError(Exception):
+    """A request failed, or the IPC API is not available."""
+
+
+class SocketTransport:
+    """JSON line requests over a TCP ("host:port") or Unix domain socket (path)."""
+
+    # The server refills only the zones the commit's refill boxes touch
+    refills_all_zones = False
+
+    def __init__(self, address, timeout=60.0):
+        if ':' in address and not address.startswith('/'):
+            host, port = address.rsplit(':', 1)
+            self.sock = socket.create_connection((host, int(port)), timeout)
+        else:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(address)
+        self.stream = self.sock.makefile('rwb')
+        self.next_id = 0
+
+    def call(self, method, params=None):
+        self.next_id += 1
+        request = {'id': self.next_id, 'method': method, 'params': params or {}}
+        self.stream.write(json.dumps(request).encode('utf-8') + b'\n')
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise IpcError("Connection closed during %s" % method)
+        reply = json.loads(line.decode('utf-8'))
+        if reply.get('error') is not None:
+            raise IpcError("%s failed: %s" % (method, reply['error']))
+        return reply.get('result')
+
+    def close(self):
+        self.stream.close()
+        self.sock.close()
+
+
+def _point(vector):
+    return [vector.x, vector.y]
+
+
+def _arc_points(start, mid, end, max_error):
+    """Points of the arc through start, mid and end, from start to end.
+
+    Every chord is within max_error of the arc, the way KiCad turns arcs into
+    polygons. start and end are kept exactly, so the arc still joins its
+    neighbours; a degenerate (straight) arc is its chord.
+    """
+    (x0, y0), (x1, y1), (x2, y2) = start, mid, end
+    d = 2.0 * (x0 * (y1 - y2) + x1 * (y2 - y0) + x2 * (y0 - y1))
+    if abs(d) < 1e-9:
+        return [list(start), list(end)]
+    cx = ((x0 * x0 + y0 * y0) * (y1 - y2) + (x1 * x1 + y1 * y1) * (y2 - y0) + (x2 * x2 + y2 * y2) * (y0 - y1)) / d
+    cy = ((x0 * x0 + y0 * y0) * (x2 - x1) + (x1 * x1 + y1 * y1) * (x0 - x2) + (x2 * x2 + y2 * y2) * (x1 - x0)) / d
+    radius = math.hypot(x0 - cx, y0 - cy)
+
+    a0 = math.atan2(y0 - cy, x0 - cx)
+    a1 = math.atan2(y1 - cy, x1 - cx)
+    a2 = math.atan2(y2 - cy, x2 - cx)
+    sweep = (a2 - a0) % (2 * math.pi)
+    if (a1 - a0) % (2 * math.pi) > sweep:
+        sweep -= 2 * math.pi  # mid is not on the counter-clockwise way: clockwise
+
+    return [list(start)] + _circle_points(cx, cy, radius, a0, sweep, max_error)[1:-1] + [list(end)]
+
+
+def _circle_points(cx, cy, radius, a0, sweep, max_error):
+    """Points from angle a0 over sweep on a circle, every chord within max_error of it."""
+    step = 2 * math.acos(max(0.0, 1 - max_error / radius)) if radius > max_error else math.pi / 2
+    count = max(2, int(math.ceil(abs(sweep) / max(step, 1e-6))))
+    return [[int(round(cx + radius * math.cos(a0 + sweep * i / count))),
+             int(round(cy + radius * math.sin(a0 + sweep * i / count)))] for i in range(count + 1)]
+
+
+def _rotated(dx, dy, angle_deg):
+    """(dx, dy) rotated by a KiCad angle (counter-clockwise on screen, y down), like RotatePoint."""
+    angle = math.radians(angle_deg)
+    cos_a, sin_a = math.cos(angle), math.sin(angle)
+    return dx * cos_a + dy * sin_a, dy * cos_a - dx * sin_a
+
+
+def _polygon_rings(polygons):
+    """Rings of a kipy PolygonWithHoles list."""
+    rings = []
+    for polygon in polygons:
+        rings.append([_point(node.point) for node in polygon.outline.nodes if node.has_point])
+        for hole in polygon.holes:
+            rings.append([_point(node.point) for node in hole.nodes if node.has_point])
+    return rings
+
+
+def _chain_rings(segments):
+    """Join (start, end) point pairs that share end points into closed rings."""
+    rings = []
+    remaining = list(segments)
+    while remaining:
+        start, end = remaining.pop()
+        ring = [start, end]
+        extended = True
+        while extended and ring[-1] != ring[0]:
+            extended = False
+            for n, (a, b) in enumerate(remaining):
+                if a == ring[-1] or b == ring[-1]:
+                    ring.append(b if a == ring[-1] else a)
+                    del remaining[n]
+                    extended = True
+                    break
+        if len(ring) > 3:
+            rings.append(ring)
+    return rings
+
+
+class KipyTransport:
+    """Requests answered by a running KiCad through kicad-python (kipy).
+
+    The IPC API doesn't expose everything the SWIG bindings do, so a few things
+    are approximated on the safe side: courtyards are the footprints' bounding
+    boxes (which contain the courtyards), netclass clearances are the snapshot
+    defaults, and custom and trapezoid pads are the circle around their anchor
+    pad (custom primitives reaching past it are not seen). Arcs and circles of
+    the board outline become segments within OUTLINE_ARC_ERROR of them. Pads
+    are placed at their shape center (position plus the rotated pad offset).
+    Without group support in kicad-python the vias are not tagged. A refill
+    refills all zones, kicad-python has no refill of single zones.
+
+    Pad local clearance and soldermask expansion are read from the pad's
+    overrides where kicad-python has them. A pad without a clearance override
+    gets 0 (the clearance of the check applies, as with the SWIG bindings); a
+    pad whose mask expansion can't be read gets PAD_MASK_MARGIN_FALLBACK, which
+    only ever widens the keep-away around the pad.
+    """
+
+    # kicad-python can only refill every zone of the board (see IpcBackend.refill_zones)
+    refills_all_zones = True
+
+    # Maximum distance between an arc or circle of the board outline and its segments
+    OUTLINE_ARC_ERROR = 5000  # nanometers (5 microns, like KiCad's high definition arcs)
+
+    # Soldermask expansion of pads where kicad-python doesn't give it
+    PAD_MASK_MARGIN_FALLBACK = 100000  # nanometers (0.1 mm)
+
+    def __init__(self, socket_path=None):
+        if kipy is None:
+            raise IpcError("The KiCad IPC API needs the kicad-python package (pip install kicad-python).")
+        self.kicad = kipy.KiCad(socket_path=socket_path) if socket_path else kipy.KiCad()
+        self.board = self.kicad.get_board()
+        self.vias = {}  # via id -> kipy Via, for removal
+        self.nets = {}  # net code -> kipy Net, for new vias
+
+    def call(self, method, params=None):
+        handler = getattr(self, '_' + method, None)
+        if handler is None:
+            raise IpcError("Unknown request %s" % method)
+        return handler(**(params or {}))
+
+    def _copper_layers(self):
+        layers = [layer for layer in self.board.get_enabled_layers()
+                  if layer == BoardLayer.BL_F_Cu or layer == BoardLayer.BL_B_Cu or
+                  BoardLayer.BL_In1_Cu <= layer <= BoardLayer.BL_In30_Cu]
+        # Top to bottom: F.Cu, inner layers in order, B.Cu
+        return sorted(layers, key=lambda layer: (layer == BoardLayer.BL_B_Cu, layer))
+
+    def _get_board(self):
+        nets = []
+        for net in self.board.get_nets():
+            self.nets[net.code] = net
+            nets.append([net.code, net.name])
+
+        segments = []
+        for shape in self.board.get_shapes():
+            if shape.layer != BoardLayer.BL_Edge_Cuts:
+                continue
+            kind = type(shape).__name__
+            if kind == 'Segment':
+                segments.append((_point(shape.start), _point(shape.end)))
+            elif kind == 'Arc':
+                points = _arc_points(_point(shape.start), _point(shape.mid), _point(shape.end),
+                                     self.OUTLINE_ARC_ERROR)
+                segments.extend((points[i - 1], points[i]) for i in range(1, len(points)))
+            elif kind == 'Rectangle':
+                (x0, y0), (x1, y1) = _point(shape.top_left), _point(shape.bottom_right)
+                corners = [[x0, y0], [x1, y0], [x1, y1], [x0, y1]]
+                segments.extend((corners[i - 1], corners[i]) for i in range(4))
+            elif kind == 'Circle':
+                cx, cy = _point(shape.center)
+                r = math.hypot(shape.radius_point.x - cx, shape.radius_point.y - cy)
+                ring = _circle_points(cx, cy, r, 0.0, 2 * math.pi, self.OUTLINE_ARC_ERROR)[:-1]
+                segments.extend((ring[i - 1], ring[i]) for i in range(len(ring)))
+            elif kind == 'Polygon':
+                for ring in _polygon_rings(shape.polygons):
+                    segments.extend((ring[i - 1], ring[i]) for i in range(len(ring)))
+
+        return {'copper_layers': [[layer, BoardLayer.Name(layer)[3:].replace('_', '.')]
+                                  for layer in self._copper_layers()],
+                'nets': nets, 'default_clearance': None, 'hole_clearance': None, 'edge_clearance': None,
+                'outline': _chain_rings(segments) or None}
+
+    def _stitch_group(self):
+        """The kipy Group the plugin's vias are in, or None."""
+        if Group is None:
+            return None
+        try:
+            for group in self.board.get_groups():
+                if group.name == STITCH_GROUP_NAME:
+                    return group
+        except:
+            pass
+        return None
+
+    def _get_items(self):
+        copper_layers = self._copper_layers()
+        group = self._stitch_group()
+        tagged = set(item.value for item in group.items) if group is not None else set()
+
+        tracks = []
+        for track in self.board.get_tracks():
+            start, end = _point(track.start), _point(track.end)
+            if isinstance(track, ArcTrack):
+                mid = _point(track.mid)
+                kind = 'arc'
+            else:
+                mid = [(start[0] + end[0]) // 2, (start[1] + end[1]) // 2]
+                kind = 'line'
+            tracks.append([kind] + start + end + mid + [track.width, track.layer, track.net.code, None])
+
+        vias = []
+        for via in self.board.get_vias():
+            via_id = via.id.value
+            self.vias[via_id] = via
+            try:
+                layer_top, layer_bottom = via.padstack.drill.start_layer, via.padstack.drill.end_layer
+            except:
+                layer_top, layer_bottom = copper_layers[0], copper_layers[-1]
+            vias.append([via_id] + _point(via.position) +
+                        [via.diameter, via.drill_diameter, via.net.code, layer_top, layer_bottom,
+                         via_id in tagged])
+
+        pads = []
+        for pad in self.board.get_pads():
+            padstack = pad.padstack
+            copper = padstack.copper_layers[0]
+            half_x, half_y = copper.size.x // 2, copper.size.y // 2
+            angle_deg = padstack.angle.degrees
+            if copper.shape in (PadStackShape.PSS_CIRCLE, PadStackShape.PSS_OVAL):
+                corner_radius = min(half_x, half_y)
+            elif copper.shape == PadStackShape.PSS_RECTANGLE:
+                corner_radius = 0
+            elif copper.shape in (PadStackShape.PSS_ROUNDRECT, PadStackShape.PSS_CHAMFEREDRECT):
+                # A chamfered rect lies inside its rounded rect, so this is conservative
+                corner_radius = int(getattr(copper, 'corner_rounding_ratio', 0) * 2 * min(half_x, half_y))
+            else:
+                # Custom, trapezoid, ...: the circle around the anchor pad
+                half_x = half_y = corner_radius = max(half_x, half_y)
+            x, y = _point(pad.position)
+            offset = getattr(copper, 'offset', None) or getattr(getattr(copper, 'proto', None), 'offset', None)
+            if offset is not None and (offset.x or offset.y):
+                dx, dy = _rotated(offset.x, offset.y, angle_deg)
+                x, y = int(round(x + dx)), int(round(y + dy))
+            try:
+                drilled = padstack.drill.diameter.x > 0
+            except:
+                drilled = False
+            local_clearance, mask_margin = self._pad_margins(pad)
+            pads.append([x, y, pad.net.code, list(padstack.layers), drilled, local_clearance, mask_margin,
+                         [half_x, half_y, corner_radius, angle_deg, None]])
+
+        zones = []
+        keepouts = []
+        for zone in self.board.get_zones():
+            rings = _polygon_rings(zone.outline)
+            if zone.is_rule_area():
+                if zone.proto.rule_area_settings.keepout_vias:
+                    keepouts.append([list(zone.layers), rings])
+            else:
+                zones.append([zone.net.code, list(zone.layers), rings])
+
+        courtyards = []
+        for footprint in self.board.get_footprints():
+            box = self.board.get_item_bounding_box(footprint)
+            if box is None:
+                continue
+            x0, y0 = box.pos.x, box.pos.y
+            x1, y1 = x0 + box.size.x, y0 + box.size.y
+            side = 'B' if footprint.layer == BoardLayer.BL_B_Cu else 'F'
+            courtyards.append([side, [[[x0, y0], [x1, y0], [x1, y1], [x0, y1]]], False])
+
+        return {'tracks': tracks, 'vias': vias, 'pads': pads, 'zones': zones,
+                'keepouts': keepouts, 'courtyards': courtyards}
+
+    def _pad_margins(self, pad):
+        """(local clearance, soldermask expansion) of a kipy Pad, see the class docstring."""
+        local_clearance = 0
+        try:
+            overrides = pad.proto.overrides
+            if overrides.HasField('clearance'):
+                local_clearance = overrides.clearance.value_nm
+        except:
+            pass
+
+        mask_margin = self.PAD_MASK_MARGIN_FALLBACK
+        try:
+            mask = pad.proto.pad_stack.front_outer_layers.solder_mask_settings
+            if mask.HasField('solder_mask_margin'):
+                mask_margin = mask.solder_mask_margin.value_nm
+        except:
+            pass
+        return local_clearance, mask_margin
+
+    def _commit(self, remove=(), create=(), group=None, message='', refill=()):
+        copper_layers = self._copper_layers()
+        commit = self.board.begin_commit()
+        try:
+            if remove:
+                self.board.remove_items([self.vias[via_id] for via_id in remove if via_id in self.vias])
+            new_vias = []
+            for x, y, drill, diameter, net, layer_top, layer_bottom in create:
+                via = Via()
+                via.position = Vector2.from_xy(x, y)
+                via.diameter = diameter
+                via.drill_diameter = drill
+                via.net = self.nets[net]
+                if (layer_top, layer_bottom) != (copper_layers[0], copper_layers[-1]):
+                    via.type = ViaType.VT_BLIND_BURIED
+                    via.padstack.drill.start_layer = layer_top
+                    via.padstack.drill.end_layer = layer_bottom
+                new_vias.append(via)
+            created = self.board.create_items(new_vias) if new_vias else []
+            if created and group is not None:
+                self._tag(group, created)
+            self.board.push_commit(commit, message)
+        except:
+            self.board.drop_commit(commit)
+            raise
+        if refill and hasattr(self.board, 'refill_zones'):
+            self.board.refill_zones()
+        return {'created': len(created)}
+
+    def _tag(self, name, vias):
+        """Add new vias to the stitching group, creating it if needed."""
+        if Group is None:
+            return
+        existing = self._stitch_group()
+        if existing is None:
+            new_group = Group()
+            new_group.name = name
+            new_group.items = [via.id for via in vias]
+            self.board.create_items([new_group])
+        else:
+            existing.items = list(existing.items) + [via.id for via in vias]
+            self.board.update_items([existing])
+
+
+def metadata_from_ipc(board):
+    """Build a BoardMetadata from the get_board reply."""
+    metadata = BoardMetadata()
+    for layer, name in board['copper_layers']:
+        metadata.add_layer(layer, name)
+    for code, name in board['nets']:
+        metadata.add_net(code, name)
+    if board.get('default_clearance') is not None:
+        metadata.default_clearance = board['default_clearance']
+    return metadata
+
+
+def snapshot_from_ipc(board, items, skip_vias=(), metadata=None):
+    """Build a BoardSnapshot from the get_board and get_items replies.
+
+    Args:
+        board: get_board result
+        items: get_items result
+        skip_vias: ids of vias to leave out (removed in this run)
+        metadata: BoardMetadata of the board, built from board if None
+
+    Returns:
+        BoardSnapshot
+    """
+    if metadata is None:
+        metadata = metadata_from_ipc(board)
+    snapshot = BoardSnapshot()
+    metadata.fill_snapshot(snapshot)
+    for key in ('hole_clearance', 'edge_clearance'):
+        if board.get(key) is not None:
+            setattr(snapshot, key, board[key])
+    if board.get('outline'):
+        snapshot.outline = PolygonIndex(board['outline'])
+
+    for kind, x0, y0, x1, y1, mx, my, width, layer, net, clearance in items['tracks']:
+        if clearance is None:
+            clearance = metadata.clearance(net, layer)
+        snapshot.tracks.append(TRACK_ARC if kind == 'arc' else TRACK_LINE, x0, y0, x1, y1, mx, my,
+                               width, layer, net, clearance)
+
+    skip_vias = set(skip_vias)
+    for via_id, x, y, diameter, drill, net, layer_top, layer_bottom, _ in items['vias']:
+        if via_id not in skip_vias:
+            snapshot.vias.append(x, y, diameter, drill, net, layer_top, layer_bottom)
+
+    # Identical pad shapes are shared, like read_pads does
+    shapes = {}
+    for x, y, net, layers, drilled, local_clearance, mask_margin, shape in items['pads']:
+        half_x, half_y, corner_radius, angle_deg, rings = shape
+        key = None if rings else (half_x, half_y, corner_radius, angle_deg)
+        shape_idx = shapes.get(key) if key is not None else None
+        if shape_idx is None:
+            polygon = PolygonIndex(rings) if rings else None
+            snapshot.pad_shapes.append(PadShape(half_x, half_y, corner_radius, angle_deg, polygon))
+            shape_idx = len(snapshot.pad_shapes) - 1
+            if key is not None:
+                shapes[key] = shape_idx
+        mask = snapshot.all_layers_mask() if drilled else snapshot.layer_mask(layers)
+        snapshot.pads.append(x, y, shape_idx, net, mask, local_clearance, mask_margin)
+
+    for net, layers, rings in items['zones']:
+        outline = PolygonIndex(rings)
+        snapshot.zones.append(net, snapshot.layer_mask(layers), outline if outline.edges else None)
+
+    snapshot.keepouts = [(snapshot.layer_mask(layers), PolygonIndex(rings)) for layers, rings in items['keepouts']]
+
+    # Courtyards belong to the outer copper layer on their side
+    sides = {'F': 1, 'B': 1 << (len(snapshot.copper_layers) - 1)}
+    snapshot.courtyards = [(sides[side], PolygonIndex(rings), exact) for side, rings, exact in items['courtyards']]
+
+    return snapshot
+
+
+class IpcBackend:
+    """The board operations of a stitching run over the IPC API (see kicad_board.SwigBackend).
+
+    The board is read with one get_board and one get_items request. Removed and
+    new vias are only collected, and sent to KiCad in one commit request.
+    """
+
+    COMMIT_MESSAGE = "Via stitching"
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._board = None
+        self._items = None
+        self._metadata = None
+        self.removed = set()  # ids of vias to remove
+        self.created = []     # new via rows, see the commit request
+        self._dropped = set()  # id() of new via rows removed again before the commit
+        self.touched = []      # bounding boxes of the vias removed and added
+        self.refill = []       # boxes whose zones are refilled with the commit
+        self.full_refill = False  # True if the commit refills every zone of the board
+
+    def board(self):
+        if self._board is None:
+            self._board = self.transport.call('get_board')
+        return self._board
+
+    def items(self):
+        if self._items is None:
+            self._items = self.transport.call('get_items')
+        return self._items
+
+    def metadata(self):
+        """BoardMetadata of the board, from the get_board reply (which has no netclasses)."""
+        if self._metadata is None:
+            self._metadata = metadata_from_ipc(self.board())
+        return self._metadata
+
+    def find_gnd_net(self):
+        return self.metadata().gnd_net()
+
+    def find_net(self, net_name):
+        return self.metadata().net(net_name)
+
+    def remove_vias(self, net_codes, tagged_only=True, region=None):
+        removed = []
+        for via_id, x, y, diameter, _, net, _, _, tagged in self.items()['vias']:
+            if net not in net_codes or (tagged_only and not tagged) or via_id in self.removed:
+                continue
+            if region is not None and not (region[0] <= x <= region[2] and region[1] <= y <= region[3]):
+                continue
+            removed.append(via_id)
+            self.touched.append(via_box(x, y, diameter))
+        self.removed.update(removed)
+        return len(removed)
+
+    def read_snapshot(self):
+        return snapshot_from_ipc(self.board(), self.items(), self.removed, self.metadata())
+
+    def add_via(self, x, y, drill, diameter, net_code, layer_top=None, layer_bottom=None):
+        copper_layers = self.board()['copper_layers']
+        if layer_top is None:
+            layer_top = copper_layers[0][0]
+        if layer_bottom is None:
+            layer_bottom = copper_layers[-1][0]
+        row = [x, y, drill, diameter, net_code, layer_top, layer_bottom]
+        self.created.append(row)
+        self.touched.append(via_box(x, y, diameter))
+        return row
+
+    def remove_item(self, item):
+        self._dropped.add(id(item))
+
+    def refill_zones(self):
+        """Refill the zones touched by the removed and added vias, with the commit.
+
+        A transport that can only refill the whole board (refills_all_zones,
+        like KipyTransport) refills every zone; full_refill is then set and the
+        count is that of all zones.
+
+        Returns:
+            number of zones refilled (from the get_items zones)
+        """
+        self.refill = list(self.touched)
+        if not self.refill:
+            return 0
+        if getattr(self.transport, 'refills_all_zones', False):
+            self.full_refill = True
+            return len(self.items()['zones'])
+        count = 0
+        for _, _, rings in self.items()['zones']:
+            xs = [x for ring in rings for x, _ in ring]
+            ys = [y for ring in rings for _, y in ring]
+            if xs and touches_any((min(xs), min(ys), max(xs), max(ys)), self.refill):
+                count += 1
+        return count
+
+    def commit(self):
+        """Send all removed and new vias to KiCad in one commit.
+
+        Returns:
+            commit result, or None if there was nothing to send
+        """
+        create = [row for row in self.created if id(row) not in self._dropped]
+        if not create and not self.removed:
+            return None
+        result = self.transport.call('commit', {'remove': sorted(self.removed), 'create': create,
+                                                'group': STITCH_GROUP_NAME, 'message': self.COMMIT_MESSAGE,
+                                                'refill': self.refill})
+        self.removed = set()
+        self.refill = []
+        self.created = []
+        self._dropped = set()
+        return result
+
+
+def main(argv=None):
+    from .stitching import DEFAULT_SETTINGS, check_settings, load_preset, run_stitching
+
+    parser = argparse.ArgumentParser(prog='python -m via_stitching_plugin.kicad_ipc',
+                                     description="Stitch the board open in KiCad through the IPC API.")
+    parser.add_argument('--preset', help="JSON file with stitching settings")
+    parser.add_argument('--socket', help="KiCad IPC API socket (default: KiCad's default socket)")
+    parser.add_argument('--connect', help="host:port or socket path of a JSON line server "
+                                          "(e.g. a mock server) instead of KiCad")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.preset:
+            settings = load_preset(args.preset)
+        else:
+            settings = dict(DEFAULT_SETTINGS)
+            check_settings(settings)
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    try:
+        if args.connect:
+            transport = SocketTransport(args.connect)
+        else:
+            transport = KipyTransport(args.socket)
+        report = run_stitching(IpcBackend(transport), settings)
+    except (IpcError, OSError, ValueError) as e:
+        print("Error: %s" % e)
+        return 1
+
+    if not report.gnd_found:
+        print("No GND net found in the board.")
+        return 1
+    print("\n".join(report.messages()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
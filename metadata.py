@@ -0,0 +1,132 @@
+"""
+Net, layer and design rule metadata of a board, looked up in both directions.
+
+The backend reads it once per run (see kicad_board.read_metadata and
+kicad_ipc.IpcBackend.metadata), and everything that needs a net or layer by
+name or a clearance reads it from here: finding the reference nets and the GND
+net, the snapshot's layers and net names, and the clearance of every track.
+
+Nothing in here needs pcbnew.
+"""
+
+# Net names recognized as the GND net when no reference nets are given
+GND_NET_NAMES = ['GND', 'GROUND', 'VSS']
+
+
+class BoardMetadata:
+    """Names and clearances of a board's nets and copper layers.
+
+    Attributes:
+        nets: dict mapping net code to net name
+        layers: dict mapping copper layer ID to layer name, top to bottom
+        net_items: dict mapping net code to the backend's net object (e.g. the
+                   pcbnew NETINFO_ITEM), for backends that need it to add vias
+        net_classes: dict mapping net code to netclass name
+        netclass_clearances: dict mapping netclass name to its clearance
+        default_clearance: clearance of the default netclass
+    """
+
+    def __init__(self):
+        self.nets = {}
+        self.layers = {}
+        self.net_items = {}
+        self.net_classes = {}
+        self.netclass_clearances = {}
+        self.default_clearance = 200000  # 0.2mm
+        self._net_codes = {}   # upper case net name -> net code
+        self._layer_ids = {}   # layer name -> layer ID
+        self._clearances = {}  # (net code, layer ID) -> clearance
+
+    def add_net(self, code, name, item=None, netclass=None, clearance=None):
+        """Add a net, optionally with its backend object and its netclass and clearance."""
+        self.nets[code] = name
+        # The first net wins when names only differ in case
+        self._net_codes.setdefault(name.upper(), code)
+        if item is not None:
+            self.net_items[code] = item
+        if netclass is not None:
+            self.net_classes[code] = netclass
+            if clearance is not None:
+                self.netclass_clearances[netclass] = clearance
+
+    def add_layer(self, layer, name):
+        """Add a copper layer; layers are added top to bottom."""
+        self.layers[layer] = name
+        self._layer_ids.setdefault(name, layer)
+
+    def net_code(self, name):
+        """Code of a net by name (case-insensitive), or None."""
+        return self._net_codes.get(name.upper())
+
+    def net(self, name):
+        """(net code, net name) of a net by name (case-insensitive), or None."""
+        code = self.net_code(name)
+        if code is None:
+            return None
+        return code, self.nets[code]
+
+    def gnd_net(self):
+        """(net code, net name) of the GND net (see GND_NET_NAMES), or None."""
+        for code, name in self.nets.items():
+            if name.upper() in GND_NET_NAMES:
+                return code, name
+        return None
+
+    def layer_id(self, name):
+        """ID of a copper layer by name, or None."""
+        return self._layer_ids.get(name)
+
+    def layer_name(self, layer):
+        """Name of a copper layer, or '' if unknown."""
+        return self.layers.get(layer, '')
+
+    def netclass_clearance(self, net_code):
+        """Clearance of a net's netclass, the default clearance if unknown."""
+        clearance = self.netclass_clearances.get(self.net_classes.get(net_code))
+        return clearance if clearance is not None else self.default_clearance
+
+    def clearance(self, net_code, layer, resolve=None):
+        """Clearance of copper of a net on a layer, resolved once per (net, layer).
+
+        Args:
+            net_code: net code
+            layer: layer ID
+            resolve: function returning the clearance from the board's design
+                     rules (e.g. an item's own clearance), called on the first
+                     lookup of the pair; without it, or if it fails, the netclass
+                     clearance is used
+
+        Returns:
+            clearance in internal units
+        """
+        key = (net_code, layer)
+        clearance = self._clearances.get(key)
+        if clearance is None:
+            if resolve is not None:
+                try:
+                    clearance = resolve()
+                except:
+                    clearance = None
+            if clearance is None:
+                clearance = self.netclass_clearance(net_code)
+            self._clearances[key] = clearance
+        return clearance
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Metadata with the layers, net names and default clearance of a BoardSnapshot
+        (e.g. one loaded from a cache file), the reverse of fill_snapshot."""
+        metadata = cls()
+        for layer in snapshot.copper_layers:
+            metadata.add_layer(layer, snapshot.layer_names.get(layer, ''))
+        for code, name in snapshot.nets.items():
+            metadata.add_net(code, name)
+        metadata.default_clearance = snapshot.default_clearance
+        return metadata
+
+    def fill_snapshot(self, snapshot):
+        """Set the copper layers, layer and net names and default clearance of a BoardSnapshot."""
+        snapshot.copper_layers = list(self.layers)
+        snapshot.layer_names = dict(self.layers)
+        snapshot.nets = dict(self.nets)
+        snapshot.default_clearance = self.default_clearance
@@ -0,0 +1,58 @@
+"""
+KiCad ActionPlugin registration stub.
+
+KiCad imports every plugin at pcbnew startup, so this module is kept tiny: it
+only imports pcbnew (already loaded by KiCad). wx, the dialog, the stitching
+engine and numpy are imported on the first Run().
+"""
+import os
+
+try:
+    import pcbnew
+except Exception:
+    # When this module is inspected outside KiCad, imports may fail. Allow that.
+    pcbnew = None
+
+
+class ViaStitchingPlugin(pcbnew.ActionPlugin if pcbnew is not None else object):
+    """ActionPlugin to add a toolbar button and show the dialog.
+
+    In KiCad: place this folder under your KiCad plugins path or add the path to
+    the plugin search paths so KiCad imports it at startup.
+    """
+
+    def defaults(self):
+        # Called by pcbnew to query plugin metadata.
+        self.name = "Via Stitching"
+        self.category = "Modify PCB"
+        self.description = "Tools for via stitching (UI skeleton)."
+
+        # Icon path (place via_icon.png next to this file)
+        this_dir = os.path.dirname(__file__)
+        icon_path = os.path.join(this_dir, 'via_icon.png')
+        if os.path.exists(icon_path):
+            self.icon_file_name = icon_path
+        else:
+            self.icon_file_name = ''
+
+        # Show toolbar button in the PCB editor
+        try:
+            self.show_toolbar_button = True
+        except Exception:
+            pass
+
+    def Run(self):
+        # Show the dialog in the PCB editor context
+        try:
+            import wx
+        except Exception:
+            print('ViaStitchingPlugin: wx not available, cannot display dialog.')
+            return
+
+        # The dialog (and everything it needs) is only loaded when it's used
+        from .via_stitching_action import ViaStitchingDialog
+
+        # Don't pass a parent to avoid bringing other windows to front
+        dlg = ViaStitchingDialog(parent=None)
+        res = dlg.ShowModal()
+        dlg.Destroy()
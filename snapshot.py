@@ -0,0 +1,173 @@
+"""
+Board snapshot: the plain geometry of everything the via stitching checks look at.
+
+The snapshot is read from the board once per run (see kicad_board.read_snapshot).
+The stitching engine and its constraints only work on the snapshot, so nothing
+in here needs pcbnew. All coordinates are in KiCad internal units (nanometers).
+"""
+from .connectivity import Connectivity
+from .geometry import arc_from_three_points
+
+# Track kinds
+TRACK_LINE = 0
+TRACK_ARC = 1
+
+
+class ColumnTable:
+    """A table of records stored as one list per column.
+
+    Columns are plain attributes, so record i of column x is table.x[i].
+    """
+
+    def __init__(self, *names):
+        self.names = names
+        for name in names:
+            setattr(self, name, [])
+
+    def append(self, *values):
+        """Append one record, values in column order. Returns the record index."""
+        for name, value in zip(self.names, values):
+            getattr(self, name).append(value)
+        return len(self) - 1
+
+    def __len__(self):
+        return len(getattr(self, self.names[0]))
+
+
+class BoardSnapshot:
+    """Everything the stitching engine needs to know about a board.
+
+    Attributes:
+        copper_layers: copper layer IDs from top to bottom
+        layer_names: dict mapping layer ID to layer name
+        nets: dict mapping net code to net name
+        tracks: tracks and arcs (kind, x0, y0, x1, y1, mx, my, width, layer, net,
+                clearance); mx, my is the arc mid point (unused for lines)
+        vias: vias (x, y, diameter, drill, net, layer_top, layer_bottom)
+        pads: pads (x, y, shape, net, layers, local_clearance, mask_margin); x, y is
+              the pad shape center, shape indexes pad_shapes, layers is a bitmask
+              over the positions in copper_layers
+        pad_shapes: list of PadShape, shared by identical pads
+        zones: copper zones (net, layers, outline); layers is a bitmask like for
+               pads, outline the PolygonIndex of the zone outline (None if unknown)
+        courtyards: list of (layers, PolygonIndex, exact); layers is the bitmask of
+                    the outer copper layer on the courtyard's side, exact is False
+                    for courtyards only known by their bounding box
+        keepouts: list of (layers, PolygonIndex) of rule areas that prohibit vias
+        outline: PolygonIndex of the board outline, or None
+        edge_clearance: copper to board edge clearance
+        default_clearance: default netclass clearance
+        hole_clearance: minimum distance between drill holes
+    """
+
+    def __init__(self):
+        self.copper_layers = []
+        self.layer_names = {}
+        self.nets = {}
+        self.tracks = ColumnTable('kind', 'x0', 'y0', 'x1', 'y1', 'mx', 'my', 'width', 'layer', 'net', 'clearance')
+        self.vias = ColumnTable('x', 'y', 'diameter', 'drill', 'net', 'layer_top', 'layer_bottom')
+        self.pads = ColumnTable('x', 'y', 'shape', 'net', 'layers', 'local_clearance', 'mask_margin')
+        self.pad_shapes = []
+        self.zones = ColumnTable('net', 'layers', 'outline')
+        self.courtyards = []
+        self.keepouts = []
+        self.outline = None
+        self.edge_clearance = 500000      # 0.5mm
+        self.default_clearance = 200000   # 0.2mm
+        self.hole_clearance = 250000      # 0.25mm
+        self._connectivity = None
+
+    def net_name(self, net_code):
+        """Name of a net, or '' if unknown."""
+        return self.nets.get(net_code, '')
+
+    def layer_mask(self, layers):
+        """Bitmask (over positions in copper_layers) for an iterable of layer IDs."""
+        mask = 0
+        for position, layer in enumerate(self.copper_layers):
+            if layer in layers:
+                mask |= 1 << position
+        return mask
+
+    def all_layers_mask(self):
+        """Bitmask of all copper layers."""
+        return (1 << len(self.copper_layers)) - 1
+
+    def span_mask(self, layer_top, layer_bottom):
+        """Bitmask of all copper layers from layer_top to layer_bottom (inclusive).
+
+        Unknown layers are treated as the outer layers, so a via with odd layers
+        is never checked on fewer layers than it could span.
+        """
+        if layer_top in self.copper_layers:
+            top = self.copper_layers.index(layer_top)
+        else:
+            top = 0
+        if layer_bottom in self.copper_layers:
+            bottom = self.copper_layers.index(layer_bottom)
+        else:
+            bottom = len(self.copper_layers) - 1
+        top, bottom = min(top, bottom), max(top, bottom)
+        return (1 << (bottom + 1)) - (1 << top)
+
+    def span_layers(self, mask):
+        """(top layer ID, bottom layer ID) of the outermost layers in a bitmask."""
+        top = (mask & -mask).bit_length() - 1
+        bottom = mask.bit_length() - 1
+        return self.copper_layers[top], self.copper_layers[bottom]
+
+    def plane_positions(self, net_code):
+        """Sorted positions (in copper_layers) of the layers with a zone on the net."""
+        mask = 0
+        for i in range(len(self.zones)):
+            if self.zones.net[i] == net_code:
+                mask |= self.zones.layers[i]
+        return [position for position in range(len(self.copper_layers)) if mask & (1 << position)]
+
+    def plane_outlines(self, net_code):
+        """Outlines (PolygonIndex) of all zones on the net."""
+        return [self.zones.outline[i] for i in range(len(self.zones))
+                if self.zones.net[i] == net_code and self.zones.outline[i] is not None]
+
+    def nearest_plane_net(self, x, y, layer, net_codes):
+        """Of several plane nets, the one whose zone at x, y is on the layer closest to the given one.
+
+        This is the plane a track on that layer returns its current through.
+
+        Returns:
+            net code from net_codes, or None if none of them has a zone at x, y
+        """
+        position = self.copper_layers.index(layer) if layer in self.copper_layers else 0
+        best_net = None
+        best_distance = None
+        for i in range(len(self.zones)):
+            net = self.zones.net[i]
+            outline = self.zones.outline[i]
+            if net not in net_codes or outline is None or not outline.contains(x, y):
+                continue
+            layers = self.zones.layers[i]
+            for p in range(len(self.copper_layers)):
+                if layers & (1 << p):
+                    distance = abs(p - position)
+                    # Ties go to the net listed first
+                    if (best_distance is None or distance < best_distance or
+                            (distance == best_distance and net_codes.index(net) < net_codes.index(best_net))):
+                        best_net = net
+                        best_distance = distance
+        return best_net
+
+    def connectivity(self):
+        """Connectivity (see connectivity module) of the snapshot, built once and shared."""
+        if self._connectivity is None:
+            self._connectivity = Connectivity(self)
+        return self._connectivity
+
+    def track_primitive(self, track_id):
+        """Path primitive (see geometry module) of a track, oriented start to end."""
+        t = self.tracks
+        if t.kind[track_id] == TRACK_ARC:
+            arc = arc_from_three_points(t.x0[track_id], t.y0[track_id], t.mx[track_id], t.my[track_id],
+                                        t.x1[track_id], t.y1[track_id])
+            if arc is not None:
+                return arc
+        return ('line', t.x0[track_id], t.y0[track_id], t.x1[track_id], t.y1[track_id])
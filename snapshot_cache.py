@@ -0,0 +1,248 @@
+"""
+On-disk cache of board snapshots, memory-mapped on load.
+
+Reading a board through pcbnew (tracks, pads, courtyards, keepouts) is repeated
+on every run, even when the board file has not changed. The snapshot of a
+board is saved to a cache file next to it (board.kicad_pcb.vscache), keyed by
+a hash of the board file's content and of the project and custom rules files
+next to it (board.kicad_pro, board.kicad_dru): since KiCad 6 the netclass
+clearances and design rules baked into the snapshot live there.
+
+The file is versioned and binary: a small JSON header (layers, nets, design
+rules, pad shapes, where every column is) followed by the table columns and
+polygon points as raw int64 arrays. On load the file is memory-mapped and the
+columns are int64 memoryviews into the mapping, not lists. Processes that
+load the same cache share the mapped pages through the OS page cache instead
+of each receiving a pickled copy: the sweep's worker processes (see sweep)
+each load the board's cache file instead of getting the snapshot from the
+parent. Mapped snapshots can't be pickled.
+
+Nothing in here needs pcbnew.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from .geometry import PadShape, PolygonIndex
+from .snapshot import BoardSnapshot
+
+# Bump when the snapshot or the file layout changes; old cache files are then ignored
+CACHE_VERSION = 1
+
+CACHE_SUFFIX = '.vscache'
+
+MAGIC = b'VSSNAP\0\0'
+
+# magic, version, header length, key (sha256 digest)
+PREAMBLE = struct.Struct('<8sII32s')
+
+# Table columns stored as int64 arrays (zone outlines are stored as polygon references)
+TABLES = ('tracks', 'vias', 'pads', 'zones')
+
+# Files next to the board whose design rules end up in the snapshot
+DESIGN_RULE_SUFFIXES = ('.kicad_pro', '.kicad_dru')
+
+
+def cache_path(board_path):
+    """Cache file of a board file."""
+    return board_path + CACHE_SUFFIX
+
+
+def content_key(board_path, *extra):
+    """Cache key of a board file: hash of the cache version, the file content, the
+    content of its project and custom rules files (see DESIGN_RULE_SUFFIXES) and
+    extra strings.
+
+    extra describes what is done to the board between loading and reading the
+    snapshot (e.g. which nets' vias are removed first).
+    """
+    digest = hashlib.sha256(b'%d\0' % CACHE_VERSION)
+    _hash_file(digest, board_path)
+    base = os.path.splitext(board_path)[0]
+    for suffix in DESIGN_RULE_SUFFIXES:
+        digest.update(b'\0' + suffix.encode('utf-8') + b'\0')
+        try:
+            _hash_file(digest, base + suffix)
+        except OSError:
+            digest.update(b'missing')
+    for value in extra:
+        digest.update(b'\0' + str(value).encode('utf-8'))
+    return digest.digest()
+
+
+def _hash_file(digest, path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+
+
+def save_snapshot(snapshot, path, key):
+    """Write a snapshot to a cache file.
+
+    The file is written next to its final name and renamed, so a reader never
+    sees a partial file.
+
+    Args:
+        snapshot: BoardSnapshot
+        path: cache file path
+        key: cache key (see content_key)
+    """
+    chunks = []
+    offset = [0]
+
+    def add_array(values):
+        data = array('q', [int(v) for v in values]).tobytes()
+        chunks.append(data)
+        start = offset[0]
+        offset[0] += len(data)
+        return [start, len(data) // 8]
+
+    polygons = []
+    points = []
+
+    def add_polygon(polygon):
+        if polygon is None:
+            return -1
+        polygons.append([len(ring) for ring in polygon.rings])
+        for ring in polygon.rings:
+            for x, y in ring:
+                points.append(x)
+                points.append(y)
+        return len(polygons) - 1
+
+    columns = {}
+    for name in TABLES:
+        table = getattr(snapshot, name)
+        columns[name] = {}
+        for column in table.names:
+            values = getattr(table, column)
+            if name == 'zones' and column == 'outline':
+                values = [add_polygon(polygon) for polygon in values]
+            columns[name][column] = add_array(values)
+
+    header = {
+        'byteorder': sys.byteorder,
+        'copper_layers': snapshot.copper_layers,
+        'layer_names': [[layer, name] for layer, name in snapshot.layer_names.items()],
+        'nets': [[code, name] for code, name in snapshot.nets.items()],
+        'edge_clearance': snapshot.edge_clearance,
+        'default_clearance': snapshot.default_clearance,
+        'hole_clearance': snapshot.hole_clearance,
+        'outline': add_polygon(snapshot.outline),
+        'pad_shapes': [[shape.half_x, shape.half_y, shape.corner_radius, shape.angle_deg,
+                        add_polygon(shape.polygon)] for shape in snapshot.pad_shapes],
+        'courtyards': [[layers, add_polygon(polygon), exact] for layers, polygon, exact in snapshot.courtyards],
+        'keepouts': [[layers, add_polygon(polygon)] for layers, polygon in snapshot.keepouts],
+        'columns': columns,
+        'polygons': polygons,
+    }
+    header['points'] = add_array(points)
+
+    header_data = json.dumps(header).encode('utf-8')
+    # Pad the header so the arrays start 8-byte aligned
+    header_data += b' ' * (-(PREAMBLE.size + len(header_data)) % 8)
+
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(PREAMBLE.pack(MAGIC, CACHE_VERSION, len(header_data), key))
+            f.write(header_data)
+            for data in chunks:
+                f.write(data)
+        os.replace(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except:
+            pass
+        raise
+
+
+def load_snapshot(path, key):
+    """Load a snapshot from a cache file, memory-mapped.
+
+    Args:
+        path: cache file path
+        key: cache key the file must have been saved with, or None to take the
+             file whatever it was saved with (e.g. to look at a board's geometry
+             without the board file or pcbnew)
+
+    Returns:
+        BoardSnapshot, or None if there is no usable cache file (missing, other
+        version or key, written on a machine with another byte order, truncated
+        or corrupt)
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        magic, version, header_length, file_key = PREAMBLE.unpack_from(mapping, 0)
+        if magic != MAGIC or version != CACHE_VERSION or (key is not None and file_key != key):
+            return None
+        start = PREAMBLE.size + header_length
+        header = json.loads(bytes(mapping[PREAMBLE.size:start]).decode('utf-8'))
+        if header['byteorder'] != sys.byteorder:
+            return None
+    except (struct.error, ValueError, KeyError):
+        return None
+
+    data = memoryview(mapping)[start:]
+
+    def get_array(location):
+        first, count = location
+        if first < 0 or count < 0 or first % 8 or first + count * 8 > len(data):
+            raise ValueError("column outside the cache file")
+        return data[first:first + count * 8].cast('q')
+
+    try:
+        return _build_snapshot(header, get_array)
+    except (ValueError, TypeError, KeyError, IndexError):
+        return None
+
+
+def _build_snapshot(header, get_array):
+    """The BoardSnapshot of a cache file header, with its columns from get_array."""
+    points = get_array(header['points'])
+    polygons = []
+    position = 0
+    for ring_lengths in header['polygons']:
+        rings = []
+        for length in ring_lengths:
+            ring = points[position:position + 2 * length]
+            rings.append(list(zip(ring[0::2], ring[1::2])))
+            position += 2 * length
+        polygons.append(PolygonIndex(rings))
+
+    def get_polygon(ref):
+        return polygons[ref] if ref >= 0 else None
+
+    snapshot = BoardSnapshot()
+    snapshot.copper_layers = header['copper_layers']
+    snapshot.layer_names = dict((layer, name) for layer, name in header['layer_names'])
+    snapshot.nets = dict((code, name) for code, name in header['nets'])
+    snapshot.edge_clearance = header['edge_clearance']
+    snapshot.default_clearance = header['default_clearance']
+    snapshot.hole_clearance = header['hole_clearance']
+    snapshot.outline = get_polygon(header['outline'])
+    snapshot.pad_shapes = [PadShape(half_x, half_y, corner_radius, angle_deg, get_polygon(ref))
+                           for half_x, half_y, corner_radius, angle_deg, ref in header['pad_shapes']]
+    snapshot.courtyards = [(layers, get_polygon(ref), exact) for layers, ref, exact in header['courtyards']]
+    snapshot.keepouts = [(layers, get_polygon(ref)) for layers, ref in header['keepouts']]
+
+    # Table columns stay in the mapping; only the zone outlines become objects
+    for name in TABLES:
+        table = getattr(snapshot, name)
+        for column, location in header['columns'][name].items():
+            values = get_array(location)
+            if name == 'zones' and column == 'outline':
+                values = [get_polygon(ref) for ref in values]
+            setattr(table, column, values)
+
+    return snapshot
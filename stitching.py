@@ -0,0 +1,733 @@
+"""
+Stitching a pcbnew board with a set of settings.
+
+This is what the dialog's "go!" button does, without any UI, so the same
+settings can be applied to boards in batch mode (see batch module).
+
+Settings are a dict with the keys of DEFAULT_SETTINGS; lengths are in mm.
+
+reference_nets lists the nets to stitch (e.g. AGND, DGND and chassis ground).
+An entry is a net name, or a dict {"net": name, "via_drill": mm,
+"via_diameter": mm} for a net with its own via size. All nets are stitched in
+one run over the same board snapshot and constraint indexes. An empty list
+stitches the GND net (see metadata.GND_NET_NAMES).
+
+For scripts (e.g. the KiCad scripting console), stitch() takes the settings as
+a StitchConfig and returns the StitchReport with the placed vias, rejections
+per constraint and timings.
+"""
+import json
+import time
+
+from .engine import StitchingEngine
+from .kicad_board import SwigBackend
+from .snapshot_cache import cache_path, content_key, load_snapshot, save_snapshot
+from .verify import verify_vias
+
+DEFAULT_SETTINGS = {
+    'reference_nets': [],           # nets to stitch, [] = the GND net
+    'remove_existing_vias': False,  # remove the vias placed by the plugin before, on the stitched nets
+    'remove_untagged_vias': False,  # also remove all other vias of the stitched nets
+    'remove_region': None,          # [left, top, right, bottom], only remove vias inside; None = everywhere
+    'stitch_top': True,             # stitch along top traces
+    'stitch_inner': True,           # stitch along inner traces
+    'stitch_bottom': True,          # stitch along bottom traces
+    'along_traces': True,           # vias along the traces of the layers above
+    'return_vias': False,           # vias next to signal vias where traces of those layers change layers
+    'return_via_radius': 1.5,       # maximum distance of a return via from its signal via
+    'return_via_count': 2,          # return vias per signal via, 1 or 2
+    'blind_buried': False,          # blind/buried vias between adjacent GND planes
+    'bus_fencing': True,            # bundles of parallel traces: stitch only their outer edges
+    'stitch_distance': 3.0,         # stitch distance along traces
+    'slide_tolerance': 1.0,         # how far a blocked via may slide along its trace, 0 = not at all
+    'via_drill': 0.3,
+    'via_diameter': 0.6,
+    'grid_stitch': True,            # grid stitching in planes
+    'grid_spacing': 10.0,
+    'coverage_stitch': False,       # fill in where no GND via is near
+    'coverage_distance': 5.0,       # maximum distance from the planes to a GND via
+    'verify': True,                 # re-check the new vias with exact geometry
+    'remove_violations': False,     # remove new vias that fail verification
+    'refill_zones': True,           # refill the zones touched by the new and removed vias
+    'time_budget': 0.0,             # seconds for the whole run, 0 = no limit
+    'memory_limit': 64.0,           # MB of grid candidates per band, 0 = one band (see engine.grid_bands)
+}
+
+# Settings that may be 0
+ZERO_ALLOWED = ('slide_tolerance', 'time_budget', 'memory_limit')
+
+MIN_VIA_RING = 0.1  # mm
+
+# Keys of a reference_nets entry given as a dict
+REFERENCE_NET_KEYS = ('net', 'via_drill', 'via_diameter')
+
+
+def load_preset(path):
+    """Load settings from a JSON preset file.
+
+    The preset only needs the keys that differ from DEFAULT_SETTINGS.
+
+    Returns:
+        complete settings dict
+
+    Raises:
+        ValueError: unknown keys or invalid values in the preset
+    """
+    with open(path) as f:
+        preset = json.load(f)
+    if not isinstance(preset, dict):
+        raise ValueError("Preset %s must be a JSON object" % path)
+
+    unknown = sorted(set(preset) - set(DEFAULT_SETTINGS))
+    if unknown:
+        raise ValueError("Unknown preset keys in %s: %s" % (path, ", ".join(unknown)))
+
+    settings = dict(DEFAULT_SETTINGS)
+    settings.update(preset)
+    check_settings(settings)
+    return settings
+
+
+def check_settings(settings):
+    """Check settings for values the stitching can't work with.
+
+    Raises:
+        ValueError: with a message for the user
+    """
+    for key, default in DEFAULT_SETTINGS.items():
+        value = settings[key]
+        if default is None:
+            continue  # Optional settings, checked below
+        if isinstance(default, list):
+            if not isinstance(value, list):
+                raise ValueError("Setting %s must be a list" % key)
+        elif isinstance(default, bool):
+            if not isinstance(value, bool):
+                raise ValueError("Setting %s must be true or false" % key)
+        elif isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("Setting %s must be a number" % key)
+        elif value < 0 or (value == 0 and key not in ZERO_ALLOWED):
+            raise ValueError("Setting %s must be a positive number" % key)
+
+    if settings['return_via_count'] not in (1, 2):
+        raise ValueError("Setting return_via_count must be 1 or 2")
+
+    region = settings['remove_region']
+    if region is not None:
+        if (not isinstance(region, (list, tuple)) or len(region) != 4 or
+                any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in region)):
+            raise ValueError("Setting remove_region must be [left, top, right, bottom] in mm")
+        if region[0] > region[2] or region[1] > region[3]:
+            raise ValueError("Setting remove_region: left/top must not be larger than right/bottom")
+
+    for entry in settings['reference_nets']:
+        if isinstance(entry, dict):
+            unknown = sorted(set(entry) - set(REFERENCE_NET_KEYS))
+            if unknown:
+                raise ValueError("Unknown reference net keys: %s" % ", ".join(unknown))
+            for key in ('via_drill', 'via_diameter'):
+                value = entry.get(key, 1)
+                if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+                    raise ValueError("Reference net %s: %s must be a positive number" % (entry.get('net'), key))
+            name = entry.get('net')
+        else:
+            name = entry
+        if not isinstance(name, str) or not name.strip():
+            raise ValueError("Reference nets must be given by net name")
+
+    # Validate via ring size, for every via size in use
+    for name, via_drill, via_diameter in reference_net_entries(settings):
+        via_ring = (via_diameter - via_drill) / 2.0
+        if via_ring < MIN_VIA_RING:
+            raise ValueError(
+                "Via ring too small%s!\n\n"
+                "Via diameter - Via drill = %.3f mm\n"
+                "Ring width = %.3f mm\n"
+                "Minimum required = %.2f mm\n\n"
+                "Please increase via diameter or decrease drill size." %
+                (" for net %s" % name if name else "", via_diameter - via_drill, via_ring, MIN_VIA_RING))
+
+
+def reference_net_entries(settings):
+    """The nets to stitch with their via sizes.
+
+    Returns:
+        list of (net name, via drill, via diameter) in mm; the net name is None
+        for the GND net (empty reference_nets)
+    """
+    if not settings['reference_nets']:
+        return [(None, settings['via_drill'], settings['via_diameter'])]
+
+    entries = []
+    for entry in settings['reference_nets']:
+        if isinstance(entry, dict):
+            entries.append((entry['net'].strip(), entry.get('via_drill', settings['via_drill']),
+                            entry.get('via_diameter', settings['via_diameter'])))
+        else:
+            entries.append((entry.strip(), settings['via_drill'], settings['via_diameter']))
+    return entries
+
+
+def parse_reference_nets(text):
+    """Parse reference nets typed by the user.
+
+    Nets are separated by commas; a net can have its own via size as
+    NAME:drill/diameter, e.g. "GND, AGND:0.25/0.5".
+
+    Returns:
+        list for the reference_nets setting
+
+    Raises:
+        ValueError: a via size that is not drill/diameter in mm
+    """
+    reference_nets = []
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        if ':' not in item:
+            reference_nets.append(item)
+            continue
+        name, size = item.split(':', 1)
+        try:
+            via_drill, via_diameter = [float(value) for value in size.split('/')]
+        except ValueError:
+            raise ValueError("Invalid via size for net %s, expected drill/diameter in mm" % name.strip())
+        reference_nets.append({'net': name.strip(), 'via_drill': via_drill, 'via_diameter': via_diameter})
+    return reference_nets
+
+
+class StitchConfig:
+    """Settings for stitch(), as attributes instead of a dict.
+
+    Every key of DEFAULT_SETTINGS is an attribute with the same default and
+    type: bool for the on/off settings, a number in mm (or seconds for
+    time_budget) for the others, a list for reference_nets and None or
+    [left, top, right, bottom] in mm for remove_region.
+
+    Example:
+        config = StitchConfig(reference_nets=['GND', 'AGND'], grid_spacing=5.0)
+        config.coverage_stitch = True
+    """
+
+    def __init__(self, **settings):
+        """Create a config with DEFAULT_SETTINGS, changed by the given settings.
+
+        Raises:
+            TypeError: an unknown setting
+        """
+        unknown = sorted(set(settings) - set(DEFAULT_SETTINGS))
+        if unknown:
+            raise TypeError("Unknown settings: %s" % ", ".join(unknown))
+        for key, default in DEFAULT_SETTINGS.items():
+            value = settings.get(key, default)
+            if isinstance(value, list):
+                value = list(value)
+            setattr(self, key, value)
+
+    @classmethod
+    def from_preset(cls, path):
+        """Config from a JSON preset file (see load_preset)."""
+        return cls(**load_preset(path))
+
+    def settings(self):
+        """Checked settings dict (see DEFAULT_SETTINGS).
+
+        Raises:
+            ValueError: invalid values, see check_settings
+        """
+        settings = dict((key, getattr(self, key)) for key in DEFAULT_SETTINGS)
+        check_settings(settings)
+        return settings
+
+
+class PlacedVia:
+    """A via placed by a stitching run (and still on the board).
+
+    Attributes:
+        x, y: via center in mm
+        drill, diameter: via size in mm
+        net: net name
+        layer_top, layer_bottom: names of the layers the via spans
+        stage: stitch stage that placed it ('return', 'tracks', 'grid' or 'coverage')
+    """
+    __slots__ = ('x', 'y', 'drill', 'diameter', 'net', 'layer_top', 'layer_bottom', 'stage')
+
+    def __init__(self, x, y, drill, diameter, net, layer_top, layer_bottom, stage):
+        self.x = x
+        self.y = y
+        self.drill = drill
+        self.diameter = diameter
+        self.net = net
+        self.layer_top = layer_top
+        self.layer_bottom = layer_bottom
+        self.stage = stage
+
+
+class StitchReport:
+    """What stitch_board did to a board.
+
+    Attributes:
+        gnd_found: False if the board has no GND net and no reference nets were
+                   given (nothing was done)
+        nets: list of (net name, vias placed) for every stitched net
+        removed: number of vias of the stitched nets removed (only the ones placed
+                 by the plugin, unless remove_untagged_vias), None if removal
+                 was not requested
+        layers: list of (layer name, traces found, tracks reconstructed)
+        return_signal_vias: signal vias where traces change layers, found for return vias
+        return_placed, return_skipped: return vias placed / not placed for lack of
+                                       a free position within the radius
+        track_placed, track_skipped: track stitching vias placed / skipped
+        bundles: bundles of parallel tracks found by bus fencing
+        track_fenced: track stitching positions inside bundles, not tried
+        track_slid: track stitching vias placed after sliding from a blocked position
+        grid_placed, grid_skipped: grid vias placed / skipped
+        coverage_placed, coverage_skipped: fill-in vias placed / positions skipped
+        coverage: list of (net name, coverage before, coverage after) - the
+                  fraction of the net's plane area within coverage_distance of
+                  one of its vias - for every net, empty if coverage stitching
+                  was not run
+        violations: list of verify.Violation for the new vias, None if not verified
+        violations_removed: number of new vias removed because they failed verification
+        verify_seconds: time the verification took
+        zones_refilled: number of zones refilled because new or removed vias
+                        touch them, None if refilling was not requested
+        all_zones_refilled: True if the backend could only refill every zone of
+                            the board (zones_refilled is then the number of zones)
+        snapshot_cached: True if the board snapshot was loaded from the cache file,
+                         False if it was read from the board (and cached), None
+                         if no cache was used
+        plan: dict mapping stitch stage ('return', 'tracks', 'grid', 'coverage') to
+              [candidates processed, candidates planned]
+        out_of_time: True if the time budget ran out before the plan was done
+        vias: list of PlacedVia, the new vias left on the board
+        rejections: dict mapping constraint name to number of candidates it rejected
+        timings: dict mapping step ('remove', 'read', 'return', 'tracks', 'grid',
+                 'coverage', 'verify', 'refill', 'commit', 'total') to seconds;
+                 only the steps that were run (backends that refill with the
+                 commit, like the IPC backend, count the refill in 'commit')
+    """
+
+    # Violations listed by position in the messages
+    MAX_LISTED_VIOLATIONS = 10
+
+    def __init__(self):
+        self.gnd_found = True
+        self.nets = []
+        self.removed = None
+        self.layers = []
+        self.return_signal_vias = 0
+        self.return_placed = 0
+        self.return_skipped = 0
+        self.track_placed = 0
+        self.track_skipped = 0
+        self.bundles = 0
+        self.track_fenced = 0
+        self.track_slid = 0
+        self.grid_placed = 0
+        self.grid_skipped = 0
+        self.coverage_placed = 0
+        self.coverage_skipped = 0
+        self.coverage = []
+        self.violations = None
+        self.violations_removed = 0
+        self.verify_seconds = 0.0
+        self.zones_refilled = None
+        self.all_zones_refilled = False
+        self.snapshot_cached = None
+        self.plan = {}
+        self.out_of_time = False
+        self.vias = []
+        self.rejections = {}
+        self.timings = {}
+
+    @property
+    def placed(self):
+        """Number of new vias left on the board."""
+        return (self.return_placed + self.track_placed + self.grid_placed + self.coverage_placed -
+                self.violations_removed)
+
+    @property
+    def skipped(self):
+        return self.return_skipped + self.track_skipped + self.grid_skipped + self.coverage_skipped
+
+    def messages(self):
+        """Lines for the summary shown to the user."""
+        messages = []
+        if self.removed is not None:
+            messages.append("Removed %d vias on %s.\n" % (self.removed, ", ".join(name for name, _ in self.nets)))
+
+        if self.snapshot_cached:
+            messages.append("Board geometry loaded from cache.\n")
+
+        if self.layers:
+            messages.append("Traces (single straight elements):")
+            for layer_name, traces, _ in self.layers:
+                messages.append("  Layer %s: %d traces found" % (layer_name, traces))
+            messages.append("\nTracks:")
+            for layer_name, _, tracks in self.layers:
+                messages.append("  Layer %s: %d tracks reconstructed" % (layer_name, tracks))
+
+        if self.return_signal_vias:
+            messages.append(f"\nReturn-path vias:")
+            messages.append(f"{self.return_signal_vias} signal vias where traces change layers")
+            messages.append(f"{self.return_placed} return vias placed")
+            if self.return_skipped:
+                messages.append(f"{self.return_skipped} return vias not placed (no free position within the radius)")
+
+        if self.track_placed > 0:
+            messages.append(f"\nTrack stitching:")
+            messages.append(f"\n{self.track_placed} stitching vias placed")
+            messages.append(f"{self.track_skipped} vias skipped (clearance issues)")
+            if self.track_slid:
+                messages.append(f"{self.track_slid} vias slid along their trace to a free position")
+            if self.bundles:
+                messages.append(f"{self.bundles} bundles of parallel tracks fenced on their outer edges "
+                                f"({self.track_fenced} positions between bundled tracks not tried)")
+
+        if self.grid_placed > 0:
+            messages.append(f"\nGrid stitching:")
+            messages.append(f"{self.grid_placed} grid vias placed")
+            messages.append(f"{self.grid_skipped} grid vias skipped (clearance issues)")
+
+        if self.coverage:
+            messages.append(f"\nCoverage fill-in:")
+            messages.append(f"{self.coverage_placed} fill-in vias placed")
+            messages.append(f"{self.coverage_skipped} positions skipped (clearance issues)")
+            for net_name, before, after in self.coverage:
+                messages.append("%s plane coverage: %.1f%% -> %.1f%%" % (net_name, before * 100, after * 100))
+
+        if len(self.nets) > 1:
+            messages.append(f"\nReference nets:")
+            for net_name, placed in self.nets:
+                messages.append("  %s: %d vias placed" % (net_name, placed))
+
+        if self.out_of_time:
+            messages.append(f"\nTime budget reached, stitching stopped early:")
+            for stage, (processed, planned) in self.plan.items():
+                messages.append("  %s: %d of %d planned positions processed (%.0f%%)" %
+                                (stage, processed, planned, 100.0 * processed / max(planned, 1)))
+
+        if self.violations is not None:
+            messages.append(f"\nVerification ({self.verify_seconds:.1f} s):")
+            if not self.violations:
+                messages.append("all new vias passed")
+            else:
+                messages.append(f"{len(self.violations)} new vias failed verification")
+                if self.violations_removed:
+                    messages.append(f"{self.violations_removed} of them removed")
+                for violation in self.violations[:self.MAX_LISTED_VIOLATIONS]:
+                    messages.append("  (%.3f, %.3f) mm: %s" % (violation.x / 1e6, violation.y / 1e6, violation.reason))
+                if len(self.violations) > self.MAX_LISTED_VIOLATIONS:
+                    messages.append("  ...")
+
+        if self.zones_refilled and self.all_zones_refilled:
+            messages.append("\nRefilled all %d zones of the board, the backend can't refill single zones." %
+                            self.zones_refilled)
+        elif self.zones_refilled:
+            messages.append("\nRefilled %d zones touched by the new and removed vias (%.1f s)." %
+                            (self.zones_refilled, self.timings.get('refill', 0.0)))
+
+        return messages
+
+
+def read_snapshot_cached(backend, board_file, *extra):
+    """Read the board snapshot through the cache file next to board_file.
+
+    Args:
+        backend: board backend (see kicad_board.SwigBackend), loaded from
+                 board_file and not changed since, except as described by extra
+        board_file: board file path
+        extra: part of the cache key, see snapshot_cache.content_key
+
+    Returns:
+        tuple: (BoardSnapshot, True if it came from the cache)
+    """
+    path = cache_path(board_file)
+    try:
+        key = content_key(board_file, *extra)
+    except OSError:
+        return backend.read_snapshot(), False
+
+    snapshot = load_snapshot(path, key)
+    if snapshot is not None:
+        return snapshot, True
+
+    snapshot = backend.read_snapshot()
+    try:
+        save_snapshot(snapshot, path, key)
+    except:
+        pass  # e.g. a read-only folder; the cache is only an optimization
+    return snapshot, False
+
+
+def stitch_board(board, settings, board_file=None):
+    """Stitch a pcbnew board (SWIG bindings), see run_stitching."""
+    return run_stitching(SwigBackend(board), settings, board_file)
+
+
+def run_stitching(backend, settings, board_file=None, pipeline=None):
+    """Stitch a board: remove old vias, stitch along tracks, stitch the grid.
+
+    Every reference net gets its own engine (its own zones and via size); the
+    engines share the snapshot and one constraint pipeline, so the obstacle
+    indexes are built once and every net keeps clearance to the vias placed for
+    the others.
+
+    The board is only accessed through the backend, so the same run works
+    through the SWIG bindings (kicad_board.SwigBackend) and KiCad's IPC API
+    (kicad_ipc.IpcBackend). Changes are handed to the board with one
+    backend.commit() at the end.
+
+    Args:
+        backend: board backend
+        settings: settings dict (see DEFAULT_SETTINGS), already checked
+        board_file: file the board was just loaded from, unchanged; if given, the
+                    board snapshot is cached next to it (see snapshot_cache)
+        pipeline: ConstraintPipeline the engines share, the default constraints if
+                  None; a sweep passes one whose static constraints (and their
+                  indexes) are shared by all its runs
+
+    Returns:
+        StitchReport
+
+    Raises:
+        ValueError: a reference net is not on the board
+    """
+    report = StitchReport()
+
+    # The time budget covers the whole run, including reading the board
+    start = time.perf_counter()
+    deadline = None
+    if settings['time_budget'] > 0:
+        deadline = start + settings['time_budget']
+
+    step_start = [start]
+
+    def timed(step):
+        """Record the time since the previous step as the time of step."""
+        now = time.perf_counter()
+        report.timings[step] = now - step_start[0]
+        step_start[0] = now
+
+    def finish():
+        # Only the zones around the vias that changed, in the same commit
+        if settings['refill_zones']:
+            report.zones_refilled = backend.refill_zones()
+            report.all_zones_refilled = getattr(backend, 'full_refill', False)
+            timed('refill')
+        backend.commit()
+        timed('commit')
+        report.timings['total'] = time.perf_counter() - start
+        return report
+
+    # Find all nets before changing anything on the board
+    nets = []  # ((net code, net name), via drill, via diameter)
+    for net_name, via_drill, via_diameter in reference_net_entries(settings):
+        if net_name is None:
+            net = backend.find_gnd_net()
+            if net is None:
+                report.gnd_found = False
+                return report
+        else:
+            net = backend.find_net(net_name)
+            if net is None:
+                raise ValueError("Reference net %s not found in the board." % net_name)
+        nets.append((net, via_drill, via_diameter))
+
+    net_codes = [net_code for (net_code, _), _, _ in nets]
+
+    # Only the vias placed by the plugin before are removed (they are tagged), unless
+    # all vias of the nets are asked for; optionally only inside a region
+    removal = []
+    if settings['remove_existing_vias']:
+        region = None
+        if settings['remove_region'] is not None:
+            region = tuple(int(value * 1e6) for value in settings['remove_region'])
+        report.removed = backend.remove_vias(net_codes, not settings['remove_untagged_vias'], region)
+        removal = [net_name for (_, net_name), _, _ in nets] + [settings['remove_untagged_vias'], region]
+        timed('remove')
+
+    report.nets = [(net_name, 0) for (_, net_name), _, _ in nets]
+
+    stitch_traces = settings['stitch_top'] or settings['stitch_inner'] or settings['stitch_bottom']
+    if not ((stitch_traces and (settings['along_traces'] or settings['return_vias'])) or
+            settings['grid_stitch'] or settings['coverage_stitch']):
+        return finish()
+
+    # Read the board once; all nets and stitch methods share the snapshot,
+    # its indexes and the vias placed so far
+    if board_file is not None:
+        snapshot, report.snapshot_cached = read_snapshot_cached(backend, board_file, *removal)
+    else:
+        snapshot = backend.read_snapshot()
+    engines = []
+    for net_code in net_codes:
+        engines.append(StitchingEngine(
+            snapshot, net_code,
+            lambda x, y, drill, diameter, layer_top, layer_bottom, net_code=net_code:
+                backend.add_via(x, y, drill, diameter, net_code, layer_top, layer_bottom),
+            pipeline=engines[0].pipeline if engines else pipeline,
+            blind_buried=settings['blind_buried'], deadline=deadline,
+            plane_only=len(nets) > 1, bus_fencing=settings['bus_fencing']))
+
+    timed('read')
+
+    # Stitch stage of every via placed, per engine
+    stages = [[] for _ in engines]
+
+    def stage_done(stage):
+        for engine, engine_stages in zip(engines, stages):
+            engine_stages.extend([stage] * (len(engine.placed) - len(engine_stages)))
+        timed(stage)
+
+    # Convert mm to internal units (nanometers)
+    via_sizes = [(int(via_drill * 1e6), int(via_diameter * 1e6)) for _, via_drill, via_diameter in nets]
+
+    if stitch_traces:
+        # Gather traces per layer for stitching, in top-to-bottom layer order
+        traces_per_layer = engines[0].gather_tracks_per_layer(settings['stitch_top'],
+                                                              settings['stitch_inner'],
+                                                              settings['stitch_bottom'])
+
+    # Return-path vias first: where a signal changes layers its return current
+    # needs a via nearby the most
+    if stitch_traces and settings['return_vias']:
+        vias = snapshot.vias
+        signal_nets = set(snapshot.tracks.net[trace] for traces in traces_per_layer.values() for trace in traces)
+        signal_nets.difference_update(net_codes)
+        signal_vias = [[] for _ in nets]
+        for i, layers in snapshot.connectivity().layer_transitions():
+            stitched_layers = [layer for layer in layers if layer in traces_per_layer]
+            if vias.net[i] not in signal_nets or not stitched_layers:
+                continue
+            n = 0
+            if len(nets) > 1:
+                net_code = snapshot.nearest_plane_net(vias.x[i], vias.y[i], stitched_layers[0], net_codes)
+                if net_code is not None:
+                    n = net_codes.index(net_code)
+            signal_vias[n].append(i)
+        report.return_signal_vias = sum(len(engine_vias) for engine_vias in signal_vias)
+
+        for engine, engine_vias, (via_drill, via_diameter) in zip(engines, signal_vias, via_sizes):
+            placed, skipped = engine.stitch_return_vias(
+                engine_vias, int(settings['return_via_radius'] * 1e6), via_drill, via_diameter,
+                int(settings['return_via_count']))
+            report.return_placed += placed
+            report.return_skipped += skipped
+        stage_done('return')
+
+    if stitch_traces and settings['along_traces']:
+        # Reconstruct tracks from trace segments, and stitch every track with the
+        # reference net whose plane is closest to it (its return path)
+        tracks_per_net = [dict() for _ in nets]
+        for layer, traces in traces_per_layer.items():
+            tracks = snapshot.connectivity().chains(layer)
+            report.layers.append((snapshot.layer_names[layer], len(traces), len(tracks)))
+            for track in tracks:
+                n = 0
+                if len(nets) > 1:
+                    first = track[0]
+                    net_code = snapshot.nearest_plane_net(snapshot.tracks.x0[first], snapshot.tracks.y0[first],
+                                                          layer, net_codes)
+                    if net_code is not None:
+                        n = net_codes.index(net_code)
+                tracks_per_net[n].setdefault(layer, []).append(track)
+
+        # Place stitching vias along tracks of all layers in one go, so candidates
+        # from different tracks and layers can be merged before validation
+        for engine, tracks_per_layer, (via_drill, via_diameter) in zip(engines, tracks_per_net, via_sizes):
+            placed, skipped = engine.stitch_tracks(
+                tracks_per_layer, int(settings['stitch_distance'] * 1e6), via_drill, via_diameter,
+                int(settings['slide_tolerance'] * 1e6))
+            report.track_placed += placed
+            report.track_skipped += skipped
+            report.bundles += engine.bundles
+            report.track_fenced += engine.fenced
+            report.track_slid += engine.slid
+        stage_done('tracks')
+
+    # Grid stitching in planes
+    if settings['grid_stitch']:
+        for engine, (via_drill, via_diameter) in zip(engines, via_sizes):
+            placed, skipped = engine.stitch_grid(int(settings['grid_spacing'] * 1e6), via_drill, via_diameter,
+                                                 int(settings['memory_limit'] * 1e6))
+            report.grid_placed += placed
+            report.grid_skipped += skipped
+        stage_done('grid')
+
+    # Coverage fill-in: only where the planes are still far from any via of their net
+    if settings['coverage_stitch']:
+        for engine, (via_drill, via_diameter), (net_name, _) in zip(engines, via_sizes, report.nets):
+            placed, skipped, before, after = engine.stitch_coverage(
+                int(settings['coverage_distance'] * 1e6), via_drill, via_diameter)
+            report.coverage_placed += placed
+            report.coverage_skipped += skipped
+            report.coverage.append((net_name, before, after))
+        stage_done('coverage')
+
+    report.nets = [(net_name, len(engine.placed)) for (net_name, _), engine in zip(report.nets, engines)]
+    for engine in engines:
+        for stage, (processed, planned) in engine.plan.items():
+            plan = report.plan.setdefault(stage, [0, 0])
+            plan[0] += processed
+            plan[1] += planned
+    report.out_of_time = any(processed < planned for processed, planned in report.plan.values())
+    report.rejections = engines[0].pipeline.rejection_counts()
+
+    # All new vias, with the net name and stage they were placed for
+    placed = []
+    for engine, engine_stages, (net_name, _) in zip(engines, stages, report.nets):
+        placed.extend(zip(engine.placed, engine.placed_items, [net_name] * len(engine.placed), engine_stages))
+    removed = set()
+
+    # Re-check only the new vias of all nets together, with exact geometry
+    if settings['verify']:
+        report.violations = verify_vias(snapshot, [candidate for candidate, _, _, _ in placed])
+        if settings['remove_violations']:
+            for violation in report.violations:
+                item = placed[violation.index][1]
+                if item is not None:
+                    backend.remove_item(item)
+                    removed.add(violation.index)
+                    report.violations_removed += 1
+        timed('verify')
+        report.verify_seconds = report.timings['verify']
+
+    for i, (candidate, _, net_name, stage) in enumerate(placed):
+        if i not in removed:
+            layer_top, layer_bottom = snapshot.span_layers(candidate.layers)
+            report.vias.append(PlacedVia(candidate.x / 1e6, candidate.y / 1e6, candidate.via_drill / 1e6,
+                                         candidate.via_diameter / 1e6, net_name,
+                                         snapshot.layer_names.get(layer_top, ''),
+                                         snapshot.layer_names.get(layer_bottom, ''), stage))
+
+    return finish()
+
+
+def stitch(board, config=None, board_file=None):
+    """Stitch a pcbnew board from a script, without the dialog.
+
+    Example, in KiCad's scripting console:
+        from via_stitching_plugin.stitching import StitchConfig, stitch
+        report = stitch(pcbnew.GetBoard(), StitchConfig(grid_spacing=5.0))
+        for via in report.vias:
+            print(via.net, via.x, via.y)
+        print(report.rejections, report.timings)
+        pcbnew.Refresh()
+
+    Args:
+        board: pcbnew BOARD
+        config: StitchConfig, or None for DEFAULT_SETTINGS
+        board_file: see run_stitching
+
+    Returns:
+        StitchReport
+
+    Raises:
+        ValueError: invalid settings, or a reference net is not on the board
+    """
+    if config is None:
+        config = StitchConfig()
+    return stitch_board(board, config.settings(), board_file)
@@ -0,0 +1,395 @@
+"""
+Sweep mode: try many stitching settings on one board without changing it.
+
+The board is read once. The static constraints with their obstacle indexes
+(courtyards, board edge, keepouts, copper) are built once per process and
+shared by all runs in it. Worker processes map the board's snapshot cache
+file (see snapshot_cache), so they share its pages instead of each holding a
+copy, and build the indexes for themselves; forked workers without a cache
+file share the parent's snapshot and indexes copy-on-write. Every combination
+of the swept settings is then stitched against that snapshot in its own run,
+in parallel worker processes; new vias are only counted, nothing is written
+to the board. The result is a table of vias placed, skipped and the plane
+coverage per combination, to pick the settings for the real run in one pass.
+
+Run it with KiCad's Python from the folder that contains the plugin folder:
+
+    python -m via_stitching_plugin.sweep board.kicad_pcb --preset fab.json \\
+        --range stitch_distance=2:5:1 --range via_diameter=0.5,0.6 --range grid_spacing=5:10:2.5 \\
+        --jobs 4 --csv sweep.csv
+
+A range is start:stop:step (stop included) or a list of values. Combinations
+the settings check rejects (e.g. a via diameter too small for the drill) are
+listed as errors.
+
+The sweep leaves the board alone, so remove_existing_vias and refill_zones are
+off: existing vias, including ones placed by the plugin before, stay obstacles.
+"""
+import argparse
+import csv
+import itertools
+import multiprocessing
+import os
+import sys
+import time
+
+from .batch import format_table
+from .constraints import ConstraintPipeline, PlacedViaConstraint, default_constraints
+from .coverage import CoverageField, np
+from .kicad_board import SwigBackend
+from .metadata import BoardMetadata
+from .snapshot_cache import cache_path, content_key, load_snapshot
+from .stitching import DEFAULT_SETTINGS, check_settings, load_preset, read_snapshot_cached, run_stitching
+
+RESULT_COLUMNS = ['status', 'placed', 'skipped', 'track_placed', 'grid_placed', 'coverage_placed', 'coverage',
+                  'violations', 'seconds', 'error']
+
+# Settings a sweep can't vary: it never changes the board
+FIXED_SETTINGS = {'remove_existing_vias': False, 'refill_zones': False}
+
+
+class SnapshotBackend:
+    """Backend over a snapshot that was already read, for runs that leave the board alone.
+
+    Has the interface of kicad_board.SwigBackend; new vias are not added to the
+    board (add_via returns None, like a via that has no board item).
+    """
+
+    def __init__(self, snapshot, metadata):
+        self.snapshot = snapshot
+        self._metadata = metadata
+
+    def metadata(self):
+        return self._metadata
+
+    def find_gnd_net(self):
+        return self._metadata.gnd_net()
+
+    def find_net(self, net_name):
+        return self._metadata.net(net_name)
+
+    def remove_vias(self, net_codes, tagged_only=True, region=None):
+        return 0
+
+    def read_snapshot(self):
+        return self.snapshot
+
+    def add_via(self, x, y, drill, diameter, net_code, layer_top=None, layer_bottom=None):
+        return None
+
+    def remove_item(self, item):
+        pass
+
+    def refill_zones(self):
+        return 0
+
+    def commit(self):
+        return None
+
+
+def parse_range(text):
+    """Values of a swept setting.
+
+    Args:
+        text: 'start:stop:step' (stop included) or a comma separated list
+
+    Returns:
+        list of floats
+
+    Raises:
+        ValueError: not a range or list of numbers
+    """
+    try:
+        if ':' in text:
+            start, stop, step = [float(value) for value in text.split(':')]
+            if step <= 0 or stop < start:
+                raise ValueError()
+            count = int((stop - start) / step + 1e-9) + 1
+            return [round(start + i * step, 9) for i in range(count)]
+        return [float(value) for value in text.split(',')]
+    except ValueError:
+        raise ValueError("Invalid range %r, expected start:stop:step or a list of values" % text)
+
+
+def combinations(ranges):
+    """All combinations of the swept settings.
+
+    Args:
+        ranges: list of (setting, list of values), in the order they vary
+                (the last one fastest)
+
+    Returns:
+        list of dicts mapping setting to value
+    """
+    keys = [key for key, _ in ranges]
+    return [dict(zip(keys, values)) for values in itertools.product(*[values for _, values in ranges])]
+
+
+def plane_coverage(snapshot, metadata, report, distance):
+    """Lowest plane coverage over the stitched nets after a run.
+
+    Coverage is the fraction of a net's plane area within distance of one of
+    its vias (existing or new), see coverage.CoverageField.
+
+    Returns:
+        coverage, or None without NumPy or a board outline
+    """
+    if report.coverage:
+        return min(after for _, _, after in report.coverage)
+    if np is None or snapshot.outline is None or distance <= 0:
+        return None
+
+    coverages = []
+    for net_name, _ in report.nets:
+        net_code = metadata.net_code(net_name)
+        field = CoverageField(snapshot.outline, snapshot.plane_outlines(net_code), distance)
+        vias = snapshot.vias
+        for i in range(len(vias)):
+            if vias.net[i] == net_code:
+                field.add_via(vias.x[i], vias.y[i])
+        for via in report.vias:
+            if via.net == net_name:
+                field.add_via(int(via.x * 1e6), int(via.y * 1e6))
+        coverages.append(field.coverage())
+    return min(coverages) if coverages else None
+
+
+def evaluate(snapshot, metadata, static, settings):
+    """Stitch one combination against the shared snapshot and static constraints.
+
+    Args:
+        snapshot: BoardSnapshot
+        metadata: BoardMetadata
+        static: static constraints, shared with the other runs
+        settings: settings dict, not checked yet
+
+    Returns:
+        dict with the keys of RESULT_COLUMNS
+    """
+    t0 = time.perf_counter()
+    row = {}
+    try:
+        check_settings(settings)
+        # A new pipeline: its own stats and its own index of the vias placed in this run
+        pipeline = ConstraintPipeline(list(static) + [PlacedViaConstraint()])
+        report = run_stitching(SnapshotBackend(snapshot, metadata), settings, pipeline=pipeline)
+        if not report.gnd_found:
+            raise Exception("No GND net found in the board.")
+        coverage = plane_coverage(snapshot, metadata, report, int(settings['coverage_distance'] * 1e6))
+        row.update(status='ok', placed=report.placed, skipped=report.skipped, track_placed=report.track_placed,
+                   grid_placed=report.grid_placed, coverage_placed=report.coverage_placed,
+                   coverage=coverage if coverage is not None else '',
+                   violations=len(report.violations) if report.violations is not None else '')
+    except Exception as e:
+        row.update(status='error', error=str(e) or e.__class__.__name__)
+    row['seconds'] = time.perf_counter() - t0
+    for column in RESULT_COLUMNS:
+        row.setdefault(column, '')
+    return row
+
+
+# Shared state of a worker process, see _init_worker
+_shared = None
+
+
+def static_constraints(snapshot):
+    """The static default constraints of a snapshot, with their obstacle indexes built."""
+    return [constraint for constraint in default_constraints(snapshot) if not constraint.dynamic]
+
+
+def _init_worker(snapshot, metadata, static, cache=None):
+    """Set up a worker: with the parent's snapshot (forked), or from a cache file.
+
+    Args:
+        cache: (cache file path, key) to load the snapshot from, memory-mapped;
+               the static constraints are then built in the worker
+    """
+    global _shared
+    if cache is not None:
+        snapshot = load_snapshot(*cache)
+        if snapshot is None:
+            return  # Changed or removed since, see _evaluate_worker
+        metadata = BoardMetadata.from_snapshot(snapshot)
+        static = static_constraints(snapshot)
+    _shared = (snapshot, metadata, static)
+
+
+def _evaluate_worker(settings):
+    if _shared is None:
+        return dict(dict.fromkeys(RESULT_COLUMNS, ''), status='error', seconds=0.0,
+                    error="The snapshot cache file could not be loaded")
+    return evaluate(_shared[0], _shared[1], _shared[2], settings)
+
+
+def snapshot_cache_file(board_file):
+    """(cache file path, key) of the snapshot cached for board_file, or None if there is none."""
+    if board_file is None:
+        return None
+    path = cache_path(board_file)
+    try:
+        key = content_key(board_file)
+    except OSError:
+        return None
+    if not os.path.exists(path):
+        return None  # e.g. not writable next to the board
+    return path, key
+
+
+def run_sweep(backend, settings, ranges, jobs=None, board_file=None, progress=None):
+    """Stitch every combination of the swept settings, without changing the board.
+
+    Args:
+        backend: board backend (kicad_board.SwigBackend or kicad_ipc.IpcBackend),
+                 only read from
+        settings: settings dict (see stitching.DEFAULT_SETTINGS) the swept settings
+                  are changed in
+        ranges: list of (setting, list of values), see combinations
+        jobs: number of worker processes (CPU count if None); 1 runs in this process
+        board_file: file the board was loaded from, to read the snapshot through
+                    its cache file (see stitching.read_snapshot_cached); worker
+                    processes then map the cache file themselves. Without it
+                    workers need fork, otherwise (Windows) everything runs in
+                    this process
+        progress: optional callback called with each row as soon as it is done
+
+    Returns:
+        list of rows (dicts with the swept settings and the keys of RESULT_COLUMNS),
+        in the order of combinations(ranges)
+
+    Raises:
+        ValueError: a swept setting is not a number setting
+    """
+    for key, _ in ranges:
+        default = DEFAULT_SETTINGS.get(key)
+        if isinstance(default, bool) or not isinstance(default, (int, float)) or key in FIXED_SETTINGS:
+            raise ValueError("Setting %s can't be swept" % key)
+
+    # Read the board once
+    metadata = backend.metadata()
+    if board_file is not None:
+        snapshot, _ = read_snapshot_cached(backend, board_file)
+    else:
+        snapshot = backend.read_snapshot()
+
+    runs = []
+    for combination in combinations(ranges):
+        run = dict(settings)
+        run.update(combination)
+        run.update(FIXED_SETTINGS)
+        runs.append(run)
+
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(runs)))
+    worker_args = None
+    if jobs > 1:
+        fork = 'fork' in multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('fork' if fork else None)
+        cache = snapshot_cache_file(board_file)
+        if cache is not None:
+            # Every worker maps the cache file itself, so they all share its pages
+            # through the OS page cache (a snapshot can't be pickled into a
+            # worker anyway, a cached one is memory-mapped)
+            worker_args = (None, None, None, cache)
+        elif fork:
+            # Forked workers share the snapshot and indexes copy-on-write
+            worker_args = (snapshot, metadata, static_constraints(snapshot))
+
+    if worker_args is None:
+        static = static_constraints(snapshot)
+        results = (evaluate(snapshot, metadata, static, run) for run in runs)
+        pool = None
+    else:
+        pool = context.Pool(jobs, _init_worker, worker_args)
+        results = pool.imap(_evaluate_worker, runs)
+
+    rows = []
+    try:
+        for run, result in zip(runs, results):
+            row = dict((key, run[key]) for key, _ in ranges)
+            row.update(result)
+            rows.append(row)
+            if progress is not None:
+                progress(row)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return rows
+
+
+def format_sweep(rows, keys):
+    """Sweep rows as a plain text table, keys are the swept settings."""
+    header = keys + ['placed', 'skipped', 'coverage', 'time [s]']
+    lines = [header]
+    for row in rows:
+        if row['status'] == 'ok':
+            coverage = '%.1f%%' % (row['coverage'] * 100) if row['coverage'] != '' else '-'
+            result = [str(row['placed']), str(row['skipped']), coverage]
+        else:
+            result = ['error', '', '']
+        lines.append(['%g' % row[key] for key in keys] + result + ['%.1f' % row['seconds']])
+    text = format_table(lines)
+
+    errors = [row for row in rows if row['status'] != 'ok']
+    text.append('')
+    text.append('%d combinations, %d failed' % (len(rows), len(errors)))
+    for row in errors:
+        # Only the first line of multi-line messages (e.g. the via ring check)
+        text.append('%s: %s' % (', '.join('%s=%g' % (key, row[key]) for key in keys), row['error'].splitlines()[0]))
+    return '\n'.join(text)
+
+
+def write_sweep_csv(rows, keys, path):
+    """Write sweep rows to a CSV file."""
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=keys + RESULT_COLUMNS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict((column, row[column]) for column in keys + RESULT_COLUMNS))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m via_stitching_plugin.sweep',
+                                     description="Try many stitching settings on a KiCad board without changing it.")
+    parser.add_argument('board', help="board file")
+    parser.add_argument('--preset', help="JSON file with the settings that are not swept")
+    parser.add_argument('-r', '--range', action='append', default=[], metavar='SETTING=RANGE',
+                        help="setting to sweep, e.g. stitch_distance=2:5:1 or via_diameter=0.5,0.6 (repeatable)")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of combinations stitched at the same time (default: CPU count)")
+    parser.add_argument('--csv', help="also write the table to this CSV file")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="don't read or write the geometry cache file next to the board")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.preset:
+            settings = load_preset(args.preset)
+        else:
+            settings = dict(DEFAULT_SETTINGS)
+        ranges = []
+        for text in args.range:
+            key, sep, values = text.partition('=')
+            if not sep:
+                raise ValueError("Invalid range %r, expected SETTING=RANGE" % text)
+            ranges.append((key.strip(), parse_range(values)))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    import pcbnew
+
+    board = pcbnew.LoadBoard(args.board)
+    try:
+        rows = run_sweep(SwigBackend(board), settings, ranges, args.jobs, None if args.no_cache else args.board)
+    except ValueError as e:
+        parser.error(str(e))
+
+    keys = [key for key, _ in ranges]
+    print(format_sweep(rows, keys))
+    if args.csv:
+        write_sweep_csv(rows, keys, args.csv)
+
+    return 1 if any(row['status'] != 'ok' for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
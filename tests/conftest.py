@@ -0,0 +1,17 @@
+"""
+Make the repository importable as the plugin package, under the folder name
+KiCad loads it by, whatever the checkout folder is called.
+"""
+import importlib.util
+import os
+import sys
+
+PACKAGE = 'via_stitching_plugin'
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+if PACKAGE not in sys.modules:
+    spec = importlib.util.spec_from_file_location(PACKAGE, os.path.join(PACKAGE_DIR, '__init__.py'),
+                                                  submodule_search_locations=[PACKAGE_DIR])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[PACKAGE] = module
+    spec.loader.exec_module(module)
@@ -0,0 +1,76 @@
+"""
+Track chains and the union-find connectivity of a snapshot.
+"""
+import pytest
+
+from via_stitching_plugin.geometry import PadShape
+from via_stitching_plugin.snapshot import TRACK_LINE, BoardSnapshot
+
+MM = 1000000
+GND, SIG = 1, 2
+F_CU, B_CU = 0, 31
+
+
+def board():
+    """SIG runs on F.Cu to a via, continues on B.Cu into a pad; a second SIG piece
+    on F.Cu and a GND trace are not connected to it."""
+    snapshot = BoardSnapshot()
+    snapshot.copper_layers = [F_CU, B_CU]
+    snapshot.layer_names = {F_CU: 'F.Cu', B_CU: 'B.Cu'}
+    snapshot.nets = {GND: 'GND', SIG: 'SIG'}
+    for x0, y0, x1, y1, layer, net in ((0, 0, 5 * MM, 0, F_CU, SIG),
+                                       (5 * MM, 5 * MM, 5 * MM + 500, 0, F_CU, SIG),  # Within the tolerance
+                                       (5 * MM, 5 * MM, 10 * MM, 5 * MM, B_CU, SIG),
+                                       (20 * MM, 0, 25 * MM, 0, F_CU, SIG),
+                                       (20 * MM, 5 * MM, 25 * MM, 5 * MM, F_CU, GND)):
+        snapshot.tracks.append(TRACK_LINE, x0, y0, x1, y1, (x0 + x1) // 2, (y0 + y1) // 2, 200000, layer, net,
+                               200000)
+    snapshot.vias.append(5 * MM, 5 * MM, 600000, 300000, SIG, F_CU, B_CU)
+    snapshot.pad_shapes.append(PadShape(500000, 500000))
+    snapshot.pads.append(10 * MM + 300000, 5 * MM, 0, SIG, 0b10, 0, 0)
+    return snapshot
+
+
+def test_chains_join_traces_sharing_end_points_per_layer():
+    connectivity = board().connectivity()
+    assert sorted(sorted(chain) for chain in connectivity.chains(F_CU)) == [[0, 1], [3], [4]]
+    assert connectivity.chains(B_CU) == [[2]]
+    assert {net: len(chains) for net, chains in connectivity.chains_by_net(F_CU).items()} == {SIG: 2, GND: 1}
+
+
+def test_traces_of_different_nets_sharing_an_end_point_are_an_error():
+    snapshot = board()
+    snapshot.tracks.append(TRACK_LINE, 25 * MM, 0, 25 * MM, 5 * MM, 25 * MM, 2500000, 200000, F_CU, GND, 200000)
+    with pytest.raises(Exception, match="Net mismatch"):
+        snapshot.connectivity().chains(F_CU)
+
+
+def test_items_joined_through_a_via_and_a_pad_are_one_component():
+    connectivity = board().connectivity()
+    via = connectivity.item(connectivity.VIA, 0)
+    pad = connectivity.item(connectivity.PAD, 0)
+    assert connectivity.kind_of(via) == (connectivity.VIA, 0)
+    assert connectivity.kind_of(pad) == (connectivity.PAD, 0)
+
+    assert connectivity.connected(0, 2) and connectivity.connected(1, via) and connectivity.connected(2, pad)
+    assert not connectivity.connected(0, 3) and not connectivity.connected(3, 4)
+    groups = sorted(sorted(items) for items in connectivity.groups(SIG))
+    assert groups == [[0, 1, 2, via, pad], [3]]
+    assert connectivity.groups(GND) == [[4]]
+
+
+def test_layer_transitions_and_topology():
+    connectivity = board().connectivity()
+    assert connectivity.layer_transitions() == [(0, [F_CU, B_CU])]
+    assert connectivity.layer_transitions(GND) == []
+    assert connectivity.topology(SIG) == {'groups': 2, 'tracks': 4, 'vias': 1, 'pads': 1,
+                                          'layers': [F_CU, B_CU], 'transitions': 1}
+
+
+def test_a_via_only_connects_the_layers_it_spans():
+    snapshot = board()
+    snapshot.copper_layers = [F_CU, 2, B_CU]
+    snapshot.vias.layer_bottom[0] = 2  # Blind via, doesn't reach B.Cu
+    connectivity = snapshot.connectivity()
+    assert not connectivity.connected(0, 2)
+    assert connectivity.layer_transitions() == []
@@ -0,0 +1,27 @@
+"""
+Batch checks of the constraints against their scalar checks.
+"""
+import random
+
+from via_stitching_plugin.constraints import default_constraints
+from via_stitching_plugin.engine import StitchingEngine
+from via_stitching_plugin.equivalence import synthetic_snapshot
+
+MM = 1000000
+
+
+def test_batch_checks_match_the_scalar_checks():
+    snapshot = synthetic_snapshot(4)
+    engine = StitchingEngine(snapshot, 1)
+    rng = random.Random(4)
+    candidates = [engine.plane_candidate(rng.randint(0, 60 * MM), rng.randint(0, 40 * MM), 300000, 600000)
+                  for _ in range(2000)]
+    candidates += engine.grid_candidates(MM, 300000, 600000)
+    for constraint in default_constraints(snapshot):
+        if constraint.dynamic:
+            continue
+        expected = [constraint.check(candidate) for candidate in candidates]
+        assert constraint.check_batch(candidates) == expected, constraint.name
+        # Both outcomes occur, or the comparison says little
+        if constraint.name in ('copper', 'board edge'):
+            assert True in expected and False in expected, constraint.name
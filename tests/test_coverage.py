@@ -0,0 +1,59 @@
+"""
+Via coverage field and coverage stitching.
+"""
+import pytest
+
+from via_stitching_plugin.coverage import CoverageField, np
+from via_stitching_plugin.engine import StitchingEngine
+from via_stitching_plugin.geometry import PolygonIndex
+from via_stitching_plugin.snapshot import BoardSnapshot
+
+pytestmark = pytest.mark.skipif(np is None, reason="needs NumPy")
+
+MM = 1000000
+GND = 1
+
+
+def test_field_covers_the_cells_within_the_target_of_a_via():
+    field = CoverageField(PolygonIndex.from_rect(0, 0, 20 * MM, 10 * MM), [], 3 * MM, cell=500000)
+    assert field.coverage() == 0.0
+    assert len(field.uncovered_positions()) == int(field.usable.sum())
+
+    field.add_via(5 * MM, 5 * MM)
+    assert field.is_covered(5 * MM, 5 * MM) and field.is_covered(7 * MM, 6 * MM)
+    assert not field.is_covered(8 * MM + 300000, 5 * MM) and not field.is_covered(15 * MM, 5 * MM)
+    for x, y in field.uncovered_positions():
+        assert (x - 5 * MM) ** 2 + (y - 5 * MM) ** 2 > (3 * MM) ** 2
+    partial = field.coverage()
+    assert 0.0 < partial < 0.5
+
+    field.add_via(15 * MM, 5 * MM)
+    assert field.coverage() > partial
+    assert field.is_covered(15 * MM, 5 * MM)
+
+
+def test_only_the_plane_area_counts():
+    # Plane on the left half only, with a via in its middle: all of it is covered
+    field = CoverageField(PolygonIndex.from_rect(0, 0, 20 * MM, 10 * MM),
+                          [PolygonIndex.from_rect(0, 0, 10 * MM, 10 * MM)], 8 * MM, cell=MM)
+    field.add_via(5 * MM, 5 * MM)
+    assert field.coverage() == 1.0
+    assert field.uncovered_positions() == []
+    assert not field.usable[:, 10:].any()
+
+
+def test_coverage_stitching_fills_the_plane():
+    snapshot = BoardSnapshot()
+    snapshot.copper_layers = [0, 31]
+    snapshot.layer_names = {0: 'F.Cu', 31: 'B.Cu'}
+    snapshot.nets = {GND: 'GND'}
+    snapshot.outline = PolygonIndex.from_rect(0, 0, 30 * MM, 20 * MM)
+    snapshot.zones.append(GND, 0b11, PolygonIndex.from_rect(0, 0, 30 * MM, 20 * MM))
+    snapshot.vias.append(5 * MM, 5 * MM, 600000, 300000, GND, 0, 31)
+
+    engine = StitchingEngine(snapshot, GND)
+    placed, skipped, before, after = engine.stitch_coverage(4 * MM, 300000, 600000)
+    assert 0.0 < before < 0.2
+    assert placed == len(engine.placed) > 0
+    # Only the edge clearance band can stay uncovered
+    assert after > 0.95
@@ -0,0 +1,147 @@
+"""
+Stitching engine: sliding, return vias, candidate merging.
+"""
+from via_stitching_plugin.constraints import ConstraintPipeline
+from via_stitching_plugin.engine import StitchCandidate, StitchingEngine
+from via_stitching_plugin.equivalence import synthetic_snapshot
+from via_stitching_plugin.geometry import PolygonIndex, free_intervals
+from via_stitching_plugin.snapshot import TRACK_LINE, BoardSnapshot
+from via_stitching_plugin.verify import verify_vias
+
+MM = 1000000
+GND, SIG = 1, 2
+
+
+def board(tracks=()):
+    snapshot = BoardSnapshot()
+    snapshot.copper_layers = [0, 31]
+    snapshot.layer_names = {0: 'F.Cu', 31: 'B.Cu'}
+    snapshot.nets = {GND: 'GND', SIG: 'SIG'}
+    for x0, y0, x1, y1 in tracks:
+        snapshot.tracks.append(TRACK_LINE, x0, y0, x1, y1, (x0 + x1) // 2, (y0 + y1) // 2, 200000, 0, SIG, 200000)
+    return snapshot
+
+
+class StubPipeline(ConstraintPipeline):
+    """Rejects positions within `radius` of a point, without telling it as intervals."""
+
+    def __init__(self, x, y, radius):
+        super().__init__()
+        self.x, self.y, self.radius = x, y, radius
+        self.static_queries = 0
+
+    def check(self, candidate, dynamic=None):
+        return (candidate.x - self.x) ** 2 + (candidate.y - self.y) ** 2 >= self.radius ** 2
+
+    def blocked_intervals(self, candidate, dx, dy, low, high, dynamic=None):
+        if dynamic is False:
+            self.static_queries += 1
+        return []
+
+
+def candidate(x, y, slide, exclude=(0,)):
+    return StitchCandidate(x, y, 700000, 200000, SIG, 600000, 300000, GND, 0b11, exclude=exclude, slide=slide)
+
+
+def test_slide_leaves_a_position_blocked_by_a_constraint_without_intervals():
+    # The whole slide window is free as far as intervals go, the position itself is not
+    pipeline = StubPipeline(10 * MM, 5 * MM, 100000)
+    engine = StitchingEngine(board([(0, 5 * MM, 20 * MM, 5 * MM)]), GND, pipeline=pipeline)
+    moved = engine.slide(candidate(10 * MM, 5 * MM, (1.0, 0.0, -MM, MM)))
+    assert moved is not None
+    assert abs(moved.x - 10 * MM) == 300000 and moved.y == 5 * MM
+
+
+def test_static_slide_intervals_are_computed_once_per_segment():
+    pipeline = StubPipeline(0, 0, 0)
+    engine = StitchingEngine(board([(0, 5 * MM, 20 * MM, 5 * MM)]), GND, pipeline=pipeline)
+    for x in range(2 * MM, 20 * MM, 3 * MM):
+        for side in (-1, 1):
+            engine.segment_intervals(candidate(x, 5 * MM + side * 400000, (1.0, 0.0, -MM, MM)))
+    # One query per side of the segment
+    assert pipeline.static_queries == 2
+
+
+def test_segment_intervals_match_the_slide_window():
+    snapshot = synthetic_snapshot(2)
+    engine = StitchingEngine(snapshot, GND)
+    pipeline = engine.pipeline
+    checked = 0
+    for layer in snapshot.copper_layers:
+        for c in engine.track_candidates(snapshot.connectivity().chains(layer), layer, 2 * MM, 300000, 600000,
+                                         MM):
+            if c.slide is None:
+                continue
+            dx, dy, low, high = c.slide
+            cached = free_intervals(engine.segment_intervals(c), low, high)
+            direct = free_intervals(pipeline.blocked_intervals(c, dx, dy, low, high, dynamic=False), low, high)
+            assert len(cached) == len(direct)
+            for (a0, a1), (b0, b1) in zip(cached, direct):
+                assert abs(a0 - b0) <= 2 and abs(a1 - b1) <= 2
+            checked += 1
+    assert checked > 50
+
+
+def test_candidates_closer_than_the_merge_distance_become_one_at_their_centroid():
+    engine = StitchingEngine(board(), GND)
+    a = StitchCandidate(10 * MM, 5 * MM, 700000, 200000, SIG, 600000, 300000, GND, 0b01, exclude=(0,),
+                        guards=((0, 5 * MM, 20 * MM, 5 * MM, 100000),), priority=2)
+    b = StitchCandidate(10 * MM + 300000, 5 * MM + 100000, 700000, 250000, SIG, 600000, 300000, GND, 0b10,
+                        exclude=(1,), priority=1)
+    far = StitchCandidate(10 * MM + 500000, 5 * MM, 700000, 200000, SIG, 600000, 300000, GND, 0b01)
+    merged = engine.merge_candidates([a, b, far], 400000)
+
+    assert len(merged) == 2
+    rep = merged[0]
+    assert (rep.x, rep.y) == (10 * MM + 150000, 5 * MM + 50000)
+    # Clearance to the traces and guards of both members, through the layers of both
+    assert set(rep.exclude) == {0, 1} and rep.guards == a.guards and rep.check_guards
+    assert rep.layers == 0b11 and rep.clearance == 250000 and rep.priority == 1
+    assert merged[1] is far
+
+
+def test_candidates_at_the_merge_distance_stay_apart():
+    engine = StitchingEngine(board(), GND)
+    a = candidate(10 * MM, 5 * MM, None)
+    b = candidate(10 * MM + 400000, 5 * MM, None)
+    assert engine.merge_candidates([a, b], 400000) == [a, b]
+    assert len(engine.merge_candidates([a, b], 400001)) == 1
+
+
+def layer_change_board():
+    """4 layers with GND planes inside; SIG changes from F.Cu to B.Cu through a via at (10, 10) mm."""
+    snapshot = BoardSnapshot()
+    snapshot.copper_layers = [0, 4, 6, 2]
+    snapshot.layer_names = {0: 'F.Cu', 4: 'In1.Cu', 6: 'In2.Cu', 2: 'B.Cu'}
+    snapshot.nets = {GND: 'GND', SIG: 'SIG'}
+    snapshot.outline = PolygonIndex.from_rect(0, 0, 20 * MM, 20 * MM)
+    snapshot.zones.append(GND, 0b0110, PolygonIndex.from_rect(0, 0, 20 * MM, 20 * MM))
+    for x0, x1, layer in ((2 * MM, 10 * MM, 0), (10 * MM, 18 * MM, 2)):
+        snapshot.tracks.append(TRACK_LINE, x0, 10 * MM, x1, 10 * MM, (x0 + x1) // 2, 10 * MM, 200000, layer, SIG,
+                               200000)
+    snapshot.vias.append(10 * MM, 10 * MM, 600000, 300000, SIG, 0, 2)
+    return snapshot
+
+
+def test_return_vias_are_placed_within_the_radius_on_both_sides_of_a_layer_change():
+    snapshot = layer_change_board()
+    signal_vias = [i for i, _ in snapshot.connectivity().layer_transitions(SIG)]
+    assert signal_vias == [0]
+
+    engine = StitchingEngine(snapshot, GND)
+    assert engine.stitch_return_vias(signal_vias, 1500000, 300000, 600000, count=2) == (2, 0)
+    first, second = [(c.x - 10 * MM, c.y - 10 * MM) for c in engine.placed]
+    for dx, dy in (first, second):
+        assert dx * dx + dy * dy <= 1500000 ** 2
+    assert first[0] * second[0] + first[1] * second[1] < 0
+    assert verify_vias(snapshot, engine.placed) == []
+
+
+def test_via_net_vias_already_near_count_as_return_vias():
+    snapshot = layer_change_board()
+    snapshot.vias.append(10 * MM, 11 * MM, 600000, 300000, GND, 0, 2)
+    engine = StitchingEngine(snapshot, GND)
+    assert engine.stitch_return_vias([0], 1500000, 300000, 600000, count=2) == (1, 0)
+    assert engine.stitch_return_vias([0], 1500000, 300000, 600000, count=2) == (0, 0)
+    # Out of reach of the radius
+    assert engine.stitch_return_vias([0], 400000, 300000, 600000, count=1) == (0, 1)
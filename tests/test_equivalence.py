@@ -0,0 +1,17 @@
+"""
+Optimized against reference stitching on synthetic boards.
+"""
+import pytest
+
+from via_stitching_plugin.equivalence import check_equivalence, synthetic_snapshot
+from via_stitching_plugin.geometry import np
+
+
+@pytest.mark.skipif(np is None, reason="needs NumPy")
+@pytest.mark.parametrize('seed', [0, 3])
+def test_optimized_and_reference_runs_place_the_same_vias(seed):
+    report = check_equivalence(synthetic_snapshot(seed, width=40.0, height=30.0, signals=15),
+                               name='synthetic %d' % seed)
+    assert report.equivalent, "\n".join(report.messages())
+    assert report.sampling_differences == 0
+    assert report.optimized == report.reference == report.matched > 0
@@ -0,0 +1,60 @@
+"""
+Arc length sampling along tracks: the NumPy pass against the pure Python reference.
+"""
+import math
+
+import pytest
+
+from via_stitching_plugin.geometry import np, sample_offset_positions, sample_offset_positions_python
+
+MM = 1000000
+
+
+def tracks():
+    """A straight run into a quarter arc and back out, a U-turn and a single arc."""
+    r = 3 * MM
+    return [
+        [('line', 0, 0, 10 * MM, 0),
+         ('arc', 10 * MM, r, r, -math.pi / 2, math.pi / 2),
+         ('line', 10 * MM + r, r, 10 * MM + r, 12 * MM)],
+        [('line', 20 * MM, 0, 20 * MM, 8 * MM),
+         ('arc', 22 * MM, 8 * MM, 2 * MM, math.pi, -math.pi),
+         ('line', 24 * MM, 8 * MM, 24 * MM, 0)],
+        [('arc', 40 * MM, 10 * MM, 5 * MM, 0.3, -2.5)],
+    ]
+
+
+@pytest.mark.skipif(np is None, reason="needs NumPy")
+@pytest.mark.parametrize('reverse', [False, True])
+def test_numpy_sampler_matches_python_on_arcs(reverse):
+    paths = tracks()
+    if reverse:
+        # The same tracks walked the other way: arcs with the opposite sweep
+        paths = [[reversed_primitive(p) for p in reversed(path)] for path in paths]
+    offsets = [400000, 550000, 300000]
+    sampled = sample_offset_positions(paths, 700000, offsets)
+    expected = sample_offset_positions_python(paths, 700000, offsets)
+
+    assert len(sampled[0]) == len(expected[0]) > 40
+    assert list(sampled[2]) == list(expected[2])
+    assert list(sampled[3]) == list(expected[3])
+    for x, y, ex, ey in zip(sampled[0], sampled[1], expected[0], expected[1]):
+        assert abs(x - ex) <= 1 and abs(y - ey) <= 1
+
+
+def test_offset_positions_are_perpendicular_to_an_arc():
+    r = 5 * MM
+    xs, ys, _, _ = sample_offset_positions_python([[('arc', 0, 0, r, 0.0, math.pi)]], MM, [400000])
+    assert len(xs) == 2 * int(math.ceil(math.pi * r / MM))
+    # Pairs of positions, one on each side of the arc
+    for n in range(0, len(xs), 2):
+        radii = sorted(math.hypot(xs[n + k], ys[n + k]) for k in (0, 1))
+        assert abs(radii[0] - (r - 400000)) <= 2 and abs(radii[1] - (r + 400000)) <= 2
+
+
+def reversed_primitive(primitive):
+    if primitive[0] == 'arc':
+        _, cx, cy, radius, a0, sweep = primitive
+        return ('arc', cx, cy, radius, a0 + sweep, -sweep)
+    _, x0, y0, x1, y1 = primitive
+    return ('line', x1, y1, x0, y0)
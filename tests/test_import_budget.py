@@ -0,0 +1,63 @@
+"""
+Importing the package (what KiCad does at pcbnew startup) must stay cheap: only
+the package and the registration stub may be loaded, within a fixed time budget.
+"""
+import os
+import subprocess
+import sys
+import textwrap
+
+PACKAGE = 'via_stitching_plugin'
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time of the package, in microseconds
+IMPORT_BUDGET_US = 50000  # 50ms
+
+# Modules that must only be loaded on the first Run()
+FORBIDDEN = ['wx', 'numpy'] + ['%s.%s' % (PACKAGE, name) for name in (
+    'engine', 'geometry', 'via_stitching_action', 'stitching', 'constraints', 'snapshot')]
+
+PCBNEW_STUB = textwrap.dedent('''
+    class ActionPlugin(object):
+        def register(self):
+            pass
+''')
+
+
+def import_package(tmp_path):
+    """Import the package in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict mapping module name to cumulative import time in microseconds
+    """
+    (tmp_path / 'pcbnew.py').write_text(PCBNEW_STUB)
+    # The package is imported by its folder name, as KiCad does
+    os.symlink(PACKAGE_DIR, str(tmp_path / PACKAGE))
+    env = dict(os.environ, PYTHONPATH=str(tmp_path), PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import %s' % PACKAGE],
+                            cwd=str(tmp_path), env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        try:
+            modules[name.strip()] = int(cumulative)
+        except ValueError:
+            pass  # The header line
+    return modules
+
+
+def test_import_loads_only_the_stub(tmp_path):
+    modules = import_package(tmp_path)
+    ours = sorted(name for name in modules if name == PACKAGE or name.startswith(PACKAGE + '.'))
+    assert ours == [PACKAGE, PACKAGE + '.plugin']
+    for name in FORBIDDEN:
+        assert name not in modules, name
+
+
+def test_import_time_budget(tmp_path):
+    modules = import_package(tmp_path)
+    assert modules[PACKAGE] < IMPORT_BUDGET_US
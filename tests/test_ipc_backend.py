@@ -0,0 +1,174 @@
+"""
+A stitching run through IpcBackend and SocketTransport against an in-process
+mock server that answers get_board, get_items and commit (see kicad_ipc) from
+a fixed synthetic board.
+"""
+import json
+import math
+import socketserver
+import threading
+
+import pytest
+
+from via_stitching_plugin import stitching
+from via_stitching_plugin.kicad_board import STITCH_GROUP_NAME
+from via_stitching_plugin.kicad_ipc import IpcBackend, KipyTransport, SocketTransport, _arc_points, _rotated
+
+MM = 1000000
+F_CU, IN1_CU, B_CU = 3, 4, 34
+GND, SIG = 1, 2
+
+BOARD_RING = [[0, 0], [60 * MM, 0], [60 * MM, 40 * MM], [0, 40 * MM]]
+
+BOARD = {
+    'copper_layers': [[F_CU, 'F.Cu'], [IN1_CU, 'In1.Cu'], [B_CU, 'B.Cu']],
+    'nets': [[0, ''], [GND, 'GND'], [SIG, 'SIG']],
+    'default_clearance': 200000, 'hole_clearance': None, 'edge_clearance': None,
+    'outline': [BOARD_RING],
+}
+
+ITEMS = {
+    'tracks': [['line', 5 * MM, 10 * MM, 50 * MM, 10 * MM, 27 * MM, 10 * MM, 250000, F_CU, SIG, None],
+               ['arc', 5 * MM, 30 * MM, 25 * MM, 30 * MM, 15 * MM, 25 * MM, 250000, B_CU, SIG, None]],
+    # id, x, y, diameter, drill, net, layer_top, layer_bottom, tagged
+    'vias': [['tagged-gnd', 40 * MM, 35 * MM, 600000, 300000, GND, F_CU, B_CU, True],
+             ['tagged-sig', 45 * MM, 35 * MM, 600000, 300000, SIG, F_CU, B_CU, True],
+             ['untagged-gnd', 10 * MM, 35 * MM, 600000, 300000, GND, F_CU, B_CU, False]],
+    'pads': [[15 * MM, 12 * MM, SIG, [F_CU], False, 500000, 50000, [MM, MM, 0, 0.0, None]],
+             [30 * MM, 20 * MM, SIG, [F_CU, B_CU], True, 0, 0, [MM, MM // 2, 0, 90.0, None]]],
+    'zones': [[GND, [IN1_CU, B_CU], [BOARD_RING]],
+              # Off the board, so no via touches it
+              [SIG, [F_CU], [[[100 * MM, 100 * MM], [110 * MM, 100 * MM], [110 * MM, 110 * MM]]]]],
+    'keepouts': [[[F_CU, IN1_CU, B_CU], [[[50 * MM, 5 * MM], [55 * MM, 5 * MM],
+                                          [55 * MM, 15 * MM], [50 * MM, 15 * MM]]]]],
+    'courtyards': [['F', [[[10 * MM, 20 * MM], [20 * MM, 20 * MM], [20 * MM, 25 * MM], [10 * MM, 25 * MM]]],
+                    True]],
+}
+
+
+class MockHandler(socketserver.StreamRequestHandler):
+    """Answers JSON line requests from BOARD and ITEMS, and records them on the server."""
+
+    def handle(self):
+        for line in self.rfile:
+            request = json.loads(line.decode('utf-8'))
+            self.server.requests.append((request['method'], request['params']))
+            if request['method'] == 'get_board':
+                reply = {'result': BOARD}
+            elif request['method'] == 'get_items':
+                reply = {'result': ITEMS}
+            elif request['method'] == 'commit':
+                reply = {'result': {'created': len(request['params']['create'])}}
+            else:
+                reply = {'error': 'unknown request %s' % request['method']}
+            reply['id'] = request['id']
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+@pytest.fixture
+def server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), MockHandler)
+    server.daemon_threads = True
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FullRefillTransport(SocketTransport):
+    """A transport that can only refill every zone, like KipyTransport."""
+    refills_all_zones = True
+
+
+def run(server, transport_class=SocketTransport, **settings):
+    transport = transport_class('127.0.0.1:%d' % server.server_address[1], timeout=10.0)
+    try:
+        return stitching.run_stitching(IpcBackend(transport), dict(stitching.DEFAULT_SETTINGS, **settings))
+    finally:
+        transport.close()
+
+
+def inside(x, y, left, top, right, bottom):
+    return left <= x <= right and top <= y <= bottom
+
+
+def test_run_commits_the_placed_vias(server):
+    result = run(server, remove_existing_vias=True)
+
+    methods = [method for method, _ in server.requests]
+    assert methods == ['get_board', 'get_items', 'commit']
+    commit = server.requests[-1][1]
+
+    # Only the plugin's own vias of the stitched net are removed
+    assert commit['remove'] == ['tagged-gnd']
+    assert commit['group'] == STITCH_GROUP_NAME
+    assert commit['message'] == IpcBackend.COMMIT_MESSAGE
+    assert commit['refill']
+
+    assert commit['create']
+    assert len(commit['create']) == result.placed
+    for x, y, drill, diameter, net, layer_top, layer_bottom in commit['create']:
+        assert net == GND
+        assert (drill, diameter) == (300000, 600000)
+        assert (layer_top, layer_bottom) == (F_CU, B_CU)
+        assert inside(x, y, 0, 0, 60 * MM, 40 * MM)
+        assert not inside(x, y, 50 * MM - diameter // 2, 5 * MM - diameter // 2,
+                          55 * MM + diameter // 2, 15 * MM + diameter // 2)
+        # Local clearance of the first pad (0.5 mm), from the edge of its 2 x 2 mm square
+        dx = max(abs(x - 15 * MM) - MM, 0)
+        dy = max(abs(y - 12 * MM) - MM, 0)
+        assert math.hypot(dx, dy) >= 500000 + diameter // 2
+
+
+def test_refill_counts_the_touched_zones(server):
+    result = run(server)
+    assert result.zones_refilled == 1
+    assert not result.all_zones_refilled
+
+
+def test_full_refill_is_reported(server):
+    result = run(server, transport_class=FullRefillTransport)
+    assert result.zones_refilled == len(ITEMS['zones'])
+    assert result.all_zones_refilled
+    assert any('Refilled all 2 zones' in message for message in result.messages())
+
+
+def test_run_without_changes_sends_no_commit(server):
+    result = run(server, along_traces=False, grid_stitch=False)
+    assert result.placed == 0
+    assert 'commit' not in [method for method, _ in server.requests]
+
+
+@pytest.mark.parametrize('start, mid, end', [
+    ((0, 0), (5 * MM, 5 * MM), (10 * MM, 0)),     # counter-clockwise on screen
+    ((10 * MM, 0), (5 * MM, 5 * MM), (0, 0)),     # the same arc the other way
+    ((0, 0), (5 * MM, -MM), (10 * MM, 0)),        # shallow, bulging the other side
+])
+def test_outline_arcs_follow_the_arc(start, mid, end):
+    error = KipyTransport.OUTLINE_ARC_ERROR
+    points = _arc_points(start, mid, end, error)
+    assert points[0] == list(start) and points[-1] == list(end)
+    assert len(points) > 3
+
+    # The circle through the three points
+    (x0, y0), (x1, y1), (x2, y2) = start, mid, end
+    d = 2.0 * (x0 * (y1 - y2) + x1 * (y2 - y0) + x2 * (y0 - y1))
+    cx = ((x0 ** 2 + y0 ** 2) * (y1 - y2) + (x1 ** 2 + y1 ** 2) * (y2 - y0) + (x2 ** 2 + y2 ** 2) * (y0 - y1)) / d
+    cy = ((x0 ** 2 + y0 ** 2) * (x2 - x1) + (x1 ** 2 + y1 ** 2) * (x0 - x2) + (x2 ** 2 + y2 ** 2) * (x1 - x0)) / d
+    radius = math.hypot(x0 - cx, y0 - cy)
+    for (ax, ay), (bx, by) in zip(points, points[1:]):
+        assert abs(math.hypot(ax - cx, ay - cy) - radius) <= 1
+        # The chord's midpoint is within the error of the arc: no notch is cut off
+        assert radius - math.hypot((ax + bx) / 2 - cx, (ay + by) / 2 - cy) <= error + 1
+    # The points run along the side of mid
+    assert min(math.hypot(x - mid[0], y - mid[1]) for x, y in points) < MM
+
+
+def test_pad_offset_is_rotated_with_the_pad():
+    assert _rotated(MM, 0, 0.0) == (MM, 0)
+    dx, dy = _rotated(MM, 0, 90.0)
+    # KiCad angles turn counter-clockwise on screen, where y points down
+    assert (round(dx), round(dy)) == (0, -MM)
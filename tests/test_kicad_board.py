@@ -0,0 +1,137 @@
+"""
+read_pads against stand-ins for the pcbnew board, footprint and pad objects.
+"""
+import types
+
+import pytest
+
+from via_stitching_plugin import kicad_board
+from via_stitching_plugin.snapshot import BoardSnapshot
+
+MM = 1000000
+F_CU, B_CU = 0, 31
+
+# The pcbnew constants read_pads and build_pad_shape use
+PCBNEW = types.SimpleNamespace(PAD_SHAPE_CIRCLE=0, PAD_SHAPE_RECT=1, PAD_SHAPE_OVAL=2, PAD_SHAPE_TRAPEZOID=3,
+                               PAD_SHAPE_ROUNDRECT=4, PAD_SHAPE_CHAMFERED_RECT=5, PAD_SHAPE_CUSTOM=6,
+                               F_Cu=F_CU, B_Cu=B_CU)
+
+
+class Vector:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+class LayerSet:
+    def __init__(self, layers):
+        self.layers = layers
+
+    def Contains(self, layer):
+        return layer in self.layers
+
+
+class Pad:
+    def __init__(self, number, x, y, size_x, size_y, shape=PCBNEW.PAD_SHAPE_RECT):
+        self.number = number
+        self.position = Vector(x, y)
+        self.size = Vector(size_x, size_y)
+        self.shape = shape
+
+    def GetNumber(self):
+        return self.number
+
+    def ShapePos(self):
+        return self.position
+
+    def GetPosition(self):
+        return self.position
+
+    def GetSize(self):
+        return self.size
+
+    def GetShape(self):
+        return self.shape
+
+    def GetOrientationDegrees(self):
+        return 0.0
+
+    def GetLocalClearance(self):
+        return None
+
+    def GetSolderMaskExpansion(self):
+        return 0
+
+    def GetDrillSize(self):
+        return Vector(0, 0)
+
+    def GetLayerSet(self):
+        return LayerSet([F_CU])
+
+    def GetNetCode(self):
+        return 1
+
+
+class Footprint:
+    def __init__(self, fpid, pads, flipped=False):
+        self.fpid = fpid
+        self.pads = pads
+        self.flipped = flipped
+
+    def GetFPIDAsString(self):
+        return self.fpid
+
+    def IsFlipped(self):
+        return self.flipped
+
+    def Pads(self):
+        return self.pads
+
+
+class Board:
+    def __init__(self, footprints):
+        self.footprints = footprints
+
+    def GetFootprints(self):
+        return self.footprints
+
+
+@pytest.fixture(autouse=True)
+def pcbnew(monkeypatch):
+    monkeypatch.setattr(kicad_board, 'pcbnew', PCBNEW)
+
+
+def read(footprints):
+    snapshot = BoardSnapshot()
+    snapshot.copper_layers = [F_CU, B_CU]
+    kicad_board.read_pads(Board(footprints), snapshot)
+    return snapshot
+
+
+def pad_shape(snapshot, i):
+    return snapshot.pad_shapes[snapshot.pads.shape[i]]
+
+
+def test_same_numbered_pads_keep_their_own_shapes():
+    # QFN exposed pad with smaller sub-pads of the same number
+    pads = [Pad('1', 0, 0, MM // 2, MM // 4),
+            Pad('9', 2 * MM, 2 * MM, 4 * MM, 4 * MM),
+            Pad('9', 2 * MM, 2 * MM, MM, MM, PCBNEW.PAD_SHAPE_CIRCLE)]
+    snapshot = read([Footprint('Package_DFN_QFN:QFN-16', pads)])
+
+    exposed = pad_shape(snapshot, 1)
+    sub_pad = pad_shape(snapshot, 2)
+    assert (exposed.half_x, exposed.half_y, exposed.corner_radius) == (2 * MM, 2 * MM, 0)
+    assert (sub_pad.half_x, sub_pad.half_y, sub_pad.corner_radius) == (MM // 2, MM // 2, MM // 2)
+
+
+def test_identical_pads_share_one_shape():
+    footprints = [Footprint('Resistor_SMD:R_0603', [Pad('1', x, 0, MM, MM), Pad('2', x + 2 * MM, 0, MM, MM)])
+                  for x in (0, 10 * MM, 20 * MM)]
+    snapshot = read(footprints)
+    assert len(snapshot.pads) == 6
+    assert len(snapshot.pad_shapes) == 2
+
+    # The other side is read again
+    snapshot = read(footprints + [Footprint('Resistor_SMD:R_0603', [Pad('1', 0, 5 * MM, MM, MM)], True)])
+    assert len(snapshot.pad_shapes) == 3
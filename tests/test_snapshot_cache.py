@@ -0,0 +1,67 @@
+"""
+Snapshot cache files: round trip, key invalidation and damaged files.
+"""
+import pytest
+
+from via_stitching_plugin.equivalence import synthetic_snapshot
+from via_stitching_plugin.snapshot_cache import TABLES, cache_path, content_key, load_snapshot, save_snapshot
+
+
+@pytest.fixture
+def board(tmp_path):
+    path = tmp_path / 'board.kicad_pcb'
+    path.write_text('(kicad_pcb (version 20240108))\n')
+    return str(path)
+
+
+def test_round_trip(board):
+    snapshot = synthetic_snapshot(3)
+    key = content_key(board)
+    save_snapshot(snapshot, cache_path(board), key)
+    loaded = load_snapshot(cache_path(board), key)
+    assert loaded is not None
+
+    for name in ('copper_layers', 'layer_names', 'nets', 'edge_clearance', 'default_clearance',
+                 'hole_clearance'):
+        assert getattr(loaded, name) == getattr(snapshot, name), name
+    for name in TABLES:
+        table, loaded_table = getattr(snapshot, name), getattr(loaded, name)
+        assert len(loaded_table) == len(table)
+        for column in table.names:
+            if column == 'outline':
+                assert ([polygon.edges if polygon else None for polygon in getattr(loaded_table, column)] ==
+                        [polygon.edges if polygon else None for polygon in getattr(table, column)])
+            else:
+                assert list(getattr(loaded_table, column)) == list(getattr(table, column)), (name, column)
+    assert ([(s.half_x, s.half_y, s.corner_radius, s.angle_deg) for s in loaded.pad_shapes] ==
+            [(s.half_x, s.half_y, s.corner_radius, s.angle_deg) for s in snapshot.pad_shapes])
+    assert loaded.outline.edges == snapshot.outline.edges
+    assert [(layers, exact) for layers, _, exact in loaded.courtyards] == \
+        [(layers, exact) for layers, _, exact in snapshot.courtyards]
+
+
+@pytest.mark.parametrize('changed', ['board.kicad_pcb', 'board.kicad_pro', 'board.kicad_dru'])
+def test_key_changes_with_board_and_design_rules(tmp_path, board, changed):
+    (tmp_path / 'board.kicad_pro').write_text('{"net_settings": {"classes": [{"clearance": 0.2}]}}\n')
+    key = content_key(board)
+    save_snapshot(synthetic_snapshot(0), cache_path(board), key)
+    assert content_key(board) == key
+
+    with open(str(tmp_path / changed), 'a') as f:
+        f.write('(rule "edge" (constraint edge_clearance (min 0.5mm)))\n')
+    new_key = content_key(board)
+    assert new_key != key
+    assert load_snapshot(cache_path(board), new_key) is None
+    assert content_key(board, 'GND') != new_key
+
+
+@pytest.mark.parametrize('size', [40, 200, -8, -3])
+def test_damaged_file_is_not_used(board, size):
+    key = content_key(board)
+    path = cache_path(board)
+    save_snapshot(synthetic_snapshot(0), path, key)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:size])
+    assert load_snapshot(path, key) is None
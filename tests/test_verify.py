@@ -0,0 +1,60 @@
+"""
+Exact verification of the placed vias.
+"""
+from via_stitching_plugin.engine import StitchCandidate
+from via_stitching_plugin.geometry import PadShape, PolygonIndex
+from via_stitching_plugin.snapshot import TRACK_LINE, BoardSnapshot
+from via_stitching_plugin.verify import check_new_vias_together, verify_vias
+
+MM = 1000000
+GND, SIG = 1, 2
+
+
+def board():
+    snapshot = BoardSnapshot()
+    snapshot.copper_layers = [0, 31]
+    snapshot.layer_names = {0: 'F.Cu', 31: 'B.Cu'}
+    snapshot.nets = {GND: 'GND', SIG: 'SIG'}
+    snapshot.outline = PolygonIndex.from_rect(0, 0, 30 * MM, 20 * MM)
+    snapshot.tracks.append(TRACK_LINE, 0, 10 * MM, 30 * MM, 10 * MM, 15 * MM, 10 * MM, 200000, 0, SIG, 200000)
+    snapshot.pad_shapes.append(PadShape(500000, 500000))
+    snapshot.pads.append(20 * MM, 5 * MM, 0, SIG, 0b11, 0, 0)
+    snapshot.courtyards.append((0b01, PolygonIndex.from_rect(2 * MM, 14 * MM, 6 * MM, 18 * MM), True))
+    return snapshot
+
+
+def via(x, y, layers=0b11):
+    return StitchCandidate(x, y, 600000, 200000, GND, 600000, 300000, GND, layers)
+
+
+def test_vias_clear_of_everything_pass():
+    vias = [via(5 * MM, 5 * MM), via(10 * MM, 10 * MM + 600000), via(20 * MM, 6 * MM + 200000),
+            via(6 * MM + 350000, 16 * MM)]
+    assert verify_vias(board(), vias) == []
+
+
+def test_vias_too_close_are_flagged_with_the_reason():
+    vias = [via(5 * MM, 5 * MM),
+            via(10 * MM, 10 * MM + 500000),   # 0.1mm from the track
+            via(20 * MM, 5 * MM + 900000),    # 0.1mm from the pad
+            via(500000, 5 * MM),              # inside the edge clearance
+            via(6 * MM + 250000, 16 * MM)]    # overlaps the courtyard
+    violations = verify_vias(board(), vias)
+    assert [(v.index, v.reason) for v in violations] == [
+        (1, "clearance to track of net SIG"), (2, "clearance to pad of net SIG"),
+        (3, "board edge clearance"), (4, "inside courtyard")]
+    assert (violations[0].x, violations[0].y) == (10 * MM, 10 * MM + 500000)
+
+
+def test_layers_the_via_does_not_span_are_ignored():
+    # The track and the courtyard are on F.Cu only
+    vias = [via(10 * MM, 10 * MM + 500000, layers=0b10), via(6 * MM + 250000, 16 * MM, layers=0b10)]
+    assert verify_vias(board(), vias) == []
+
+
+def test_new_vias_are_checked_against_each_other():
+    vias = [via(25 * MM, 5 * MM), via(25 * MM + 500000, 5 * MM), via(25 * MM, 6 * MM),
+            StitchCandidate(25 * MM, 6 * MM + 700000, 600000, 200000, SIG, 600000, 300000, SIG, 0b11)]
+    # Drills 0.2mm apart on the same net, copper 0.1mm apart on different nets
+    assert check_new_vias_together(vias, 250000, 200000) == {
+        1: "hole clearance to new via", 3: "clearance to new via"}
@@ -0,0 +1,189 @@
+"""
+Post-placement verification of the vias placed in a run.
+
+Only the new vias are checked, against a spatial index of everything on the
+board, with the exact geometry and without the safety margin used during
+placement:
+- copper of other nets (tracks, arcs, vias, exact pad shapes): distance >= clearance
+- vias on the same net: drill holes at least hole_clearance apart
+- courtyards and via keepouts: exact distance from the via to the outline,
+  instead of the vertex / circumference sampling used during placement
+- board edge: exact distance to the Edge.Cuts outline
+
+This takes seconds instead of the minutes of a full DRC, and flags what the
+approximations during placement may have let through.
+"""
+from .constraints import INDEX_CELL_SIZE, CopperConstraint, bbox_index, polygon_bbox
+from .geometry import SpatialIndex, point_to_primitive_distance
+
+
+class Violation:
+    """A new via that failed verification.
+
+    Attributes:
+        index: index of the via in the list passed to verify_vias
+        x, y: via center in internal units
+        reason: what the via violates, for the user
+    """
+    __slots__ = ('index', 'x', 'y', 'reason')
+
+    def __init__(self, index, x, y, reason):
+        self.index = index
+        self.x = x
+        self.y = y
+        self.reason = reason
+
+
+def circle_hits_polygon(polygon, x, y, radius):
+    """Exact test whether a disc overlaps a polygon (inside or closer than radius to an edge)."""
+    if (x + radius < polygon.left or x - radius > polygon.right or
+            y + radius < polygon.top or y - radius > polygon.bottom):
+        return False
+    if polygon.contains(x, y):
+        return True
+    return radius > 0 and polygon.clearance_region(radius).edge_too_close(x, y)
+
+
+class Verifier:
+    """Exact checks for new vias, indexed like the placement constraints."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        # The copper index (tracks, arcs, vias, pads with their layer masks) is shared
+        # with the placement check; only the distance rules differ
+        self.copper = CopperConstraint(snapshot)
+        self.courtyard_index = bbox_index([polygon_bbox(polygon) for _, polygon, _ in snapshot.courtyards])
+        self.keepout_index = bbox_index([polygon_bbox(polygon) for _, polygon in snapshot.keepouts])
+        # Largest clearance any copper item asks for, bounds the index query
+        self.max_clearance = max([snapshot.default_clearance, self.copper.max_pad_margin] +
+                                 list(snapshot.tracks.clearance))
+
+    def copper_clearance(self, *clearances):
+        """Clearance between two items: the larger of their own clearances and the default."""
+        return max((self.snapshot.default_clearance,) + tuple(c for c in clearances if c))
+
+    def check_copper(self, via):
+        """Reason why the via violates copper clearance, or None."""
+        snapshot = self.snapshot
+        x = via.x
+        y = via.y
+        radius = via.via_diameter // 2
+        reach = radius + max(self.max_clearance, snapshot.hole_clearance + via.via_drill // 2)
+
+        for kind, i, layers in self.copper.index.query_radius(x, y, reach):
+            if not layers & via.layers:
+                continue
+
+            if kind == CopperConstraint.TRACK:
+                tracks = snapshot.tracks
+                if tracks.net[i] == via.via_net:
+                    continue  # Connected copper
+                clearance = self.copper_clearance(tracks.clearance[i])
+                distance = point_to_primitive_distance(x, y, self.copper.track_primitives[i])
+                if distance - tracks.width[i] / 2.0 - radius < clearance:
+                    return "clearance to track of net %s" % snapshot.net_name(tracks.net[i])
+
+            elif kind == CopperConstraint.VIA:
+                vias = snapshot.vias
+                distance = ((x - vias.x[i]) ** 2 + (y - vias.y[i]) ** 2) ** 0.5
+                if vias.net[i] == via.via_net:
+                    if distance - vias.drill[i] / 2.0 - via.via_drill / 2.0 < snapshot.hole_clearance:
+                        return "hole clearance to via"
+                elif distance - vias.diameter[i] / 2.0 - radius < self.copper_clearance():
+                    return "clearance to via of net %s" % snapshot.net_name(vias.net[i])
+
+            else:
+                pads = snapshot.pads
+                if pads.net[i] == via.via_net:
+                    continue  # Connected copper
+                # Keep clear of both the clearance zone and the soldermask opening
+                keepout = max(self.copper_clearance(pads.local_clearance[i]), abs(pads.mask_margin[i]))
+                shape = snapshot.pad_shapes[pads.shape[i]]
+                if shape.distance(x - pads.x[i], y - pads.y[i]) - radius < keepout:
+                    return "clearance to pad of net %s" % snapshot.net_name(pads.net[i])
+
+        return None
+
+    def check_courtyards(self, via):
+        radius = via.via_diameter // 2
+        for i in self.courtyard_index.query_radius(via.x, via.y, radius):
+            layers, polygon, _ = self.snapshot.courtyards[i]
+            # Bounding box courtyards are polygons too, so this is exact for both
+            if layers & via.layers and circle_hits_polygon(polygon, via.x, via.y, radius):
+                return "inside courtyard"
+        return None
+
+    def check_keepouts(self, via):
+        radius = via.via_diameter // 2
+        for i in self.keepout_index.query_radius(via.x, via.y, radius):
+            layers, polygon = self.snapshot.keepouts[i]
+            if layers & via.layers and circle_hits_polygon(polygon, via.x, via.y, radius):
+                return "inside via keepout"
+        return None
+
+    def check_edge(self, via):
+        outline = self.snapshot.outline
+        if outline is None:
+            return None
+        if not outline.clearance_region(via.via_diameter // 2 + self.snapshot.edge_clearance).contains(via.x, via.y):
+            return "board edge clearance"
+        return None
+
+    def check(self, via):
+        """Reason why the via fails verification, or None if it passes."""
+        for check in (self.check_edge, self.check_courtyards, self.check_keepouts, self.check_copper):
+            reason = check(via)
+            if reason is not None:
+                return reason
+        return None
+
+
+def check_new_vias_together(vias, hole_clearance, default_clearance):
+    """Check the new vias against each other.
+
+    Returns:
+        dict mapping via index to reason, for the later via of each colliding pair
+    """
+    index = SpatialIndex(INDEX_CELL_SIZE)
+    reasons = {}
+    for n, via in enumerate(vias):
+        radius = via.via_diameter // 2
+        reach = radius + max(default_clearance, hole_clearance + via.via_drill // 2)
+        for m in index.query_radius(via.x, via.y, reach):
+            other = vias[m]
+            if not other.layers & via.layers:
+                continue
+            distance = ((via.x - other.x) ** 2 + (via.y - other.y) ** 2) ** 0.5
+            if other.via_net == via.via_net:
+                if distance - other.via_drill / 2.0 - via.via_drill / 2.0 < hole_clearance:
+                    reasons[n] = "hole clearance to new via"
+                    break
+            elif distance - other.via_diameter / 2.0 - radius < default_clearance:
+                reasons[n] = "clearance to new via"
+                break
+        index.insert(n, via.x - radius, via.y - radius, via.x + radius, via.y + radius)
+    return reasons
+
+
+def verify_vias(snapshot, vias):
+    """Verify newly placed vias with exact geometry.
+
+    Args:
+        snapshot: BoardSnapshot read before the vias were placed
+        vias: the placed StitchCandidates (see StitchingEngine.placed)
+
+    Returns:
+        list of Violation, in via order
+    """
+    if not vias:
+        return []
+
+    verifier = Verifier(snapshot)
+    together = check_new_vias_together(vias, snapshot.hole_clearance, snapshot.default_clearance)
+
+    violations = []
+    for n, via in enumerate(vias):
+        reason = verifier.check(via) or together.get(n)
+        if reason is not None:
+            violations.append(Violation(n, via.x, via.y, reason))
+    return violations